@@ -0,0 +1,132 @@
+# Generated by Django 2.0 on 2026-10-18 17:00
+
+import base.models
+from django.db import migrations
+
+
+FIELDS = ['p', 'g', 'y', 'x']
+
+BATCH = 10000
+
+
+def copy(apps, schema_editor, src, dst, encoders):
+    '''
+    Copies the fields src of every key to dst, BATCH keys at a time, with
+    the encoder of each field
+    '''
+
+    Key = apps.get_model('base', 'Key')
+    qn = schema_editor.quote_name
+    sql = 'UPDATE {} SET {} WHERE id = %s'.format(
+          qn(Key._meta.db_table), ', '.join('{} = %s'.format(qn(f)) for f in dst))
+
+    last = 0
+    while True:
+        rows = list(Key.objects.filter(id__gt=last).order_by('id')
+                               .values_list('id', *src)[:BATCH])
+        if not rows:
+            break
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(sql, [[e(v) for e, v in zip(encoders, row[1:])] + [row[0]]
+                                     for row in rows])
+        last = rows[-1][0]
+
+
+def to_binary(apps, schema_editor):
+    def encode(n):
+        return n.to_bytes(max(1, (n.bit_length() + 7) // 8), 'big')
+
+    def encode_x(n):
+        # the text field stored the missing x as 0, that is never a key
+        return encode(n) if n else None
+
+    copy(apps, schema_editor, FIELDS, [f + '_bin' for f in FIELDS],
+         [encode, encode, encode, encode_x])
+
+
+def to_text(apps, schema_editor):
+    def encode(n):
+        return str(n or 0)
+    copy(apps, schema_editor, [f + '_bin' for f in FIELDS], FIELDS, [encode] * len(FIELDS))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0003_auto_20180921_1119'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='key',
+            name='p_bin',
+            field=base.models.BigBinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='key',
+            name='g_bin',
+            field=base.models.BigBinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='key',
+            name='y_bin',
+            field=base.models.BigBinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='key',
+            name='x_bin',
+            field=base.models.BigBinaryField(blank=True, null=True),
+        ),
+        migrations.RunPython(to_binary, to_text),
+        migrations.RemoveField(
+            model_name='key',
+            name='p',
+        ),
+        migrations.RemoveField(
+            model_name='key',
+            name='g',
+        ),
+        migrations.RemoveField(
+            model_name='key',
+            name='y',
+        ),
+        migrations.RemoveField(
+            model_name='key',
+            name='x',
+        ),
+        migrations.RenameField(
+            model_name='key',
+            old_name='p_bin',
+            new_name='p',
+        ),
+        migrations.RenameField(
+            model_name='key',
+            old_name='g_bin',
+            new_name='g',
+        ),
+        migrations.RenameField(
+            model_name='key',
+            old_name='y_bin',
+            new_name='y',
+        ),
+        migrations.RenameField(
+            model_name='key',
+            old_name='x_bin',
+            new_name='x',
+        ),
+        migrations.AlterField(
+            model_name='key',
+            name='p',
+            field=base.models.BigBinaryField(),
+        ),
+        migrations.AlterField(
+            model_name='key',
+            name='g',
+            field=base.models.BigBinaryField(),
+        ),
+        migrations.AlterField(
+            model_name='key',
+            name='y',
+            field=base.models.BigBinaryField(),
+        ),
+    ]
@@ -20,6 +20,62 @@ class BigBigField(models.TextField):
         return int(value)
 
 
+class BigBinaryField(models.BinaryField):
+    '''
+    Big integer stored as its big endian bytes, a bytea in postgres. It
+    takes less than half of the space of the decimal text of BigBigField,
+    and it's read without a decimal conversion.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        # editable like BigBigField, it's a decimal number in the forms
+        kwargs.setdefault('editable', True)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.editable:
+            kwargs.pop('editable', None)
+        else:
+            kwargs['editable'] = False
+        return name, path, args, kwargs
+
+    def to_python(self, value):
+        if value is None or isinstance(value, int):
+            return value
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return int.from_bytes(value, 'big')
+        # decimal text of the forms and the fixtures
+        return int(value)
+
+    def get_prep_value(self, value):
+        value = self.to_python(value)
+        if value is None:
+            return None
+        return int_to_bytes(value)
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return None
+        return int.from_bytes(value, 'big')
+
+    def value_to_string(self, obj):
+        value = self.value_from_object(obj)
+        return '' if value is None else str(value)
+
+
+def int_to_bytes(n):
+    '''
+    Shortest big endian bytes of n, so equal numbers have equal bytes
+
+    >>> int_to_bytes(0), int_to_bytes(256)
+    (b'\\x00', b'\\x01\\x00')
+    '''
+
+    n = int(n)
+    return n.to_bytes(max(1, (n.bit_length() + 7) // 8), 'big')
+
+
 class Auth(models.Model):
     name = models.CharField(max_length=200)
     url = models.URLField()
@@ -30,10 +86,10 @@ class Auth(models.Model):
 
 
 class Key(models.Model):
-    p = BigBigField()
-    g = BigBigField()
-    y = BigBigField()
-    x = BigBigField(blank=True, null=True)
+    p = BigBinaryField()
+    g = BigBinaryField()
+    y = BigBinaryField()
+    x = BigBinaryField(blank=True, null=True)
 
     def __str__(self):
         if self.x:
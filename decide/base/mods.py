@@ -1,6 +1,142 @@
+import functools
+import json
+import threading
 import urllib
+from collections import Counter
+
 import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
 from django.conf import settings
+from django.test import RequestFactory
+from django.urls import Resolver404, resolve
+from urllib3.util.retry import Retry
+
+from base import wire
+
+
+# base urls of the nodes that answered with the binary wire format
+wire_peers = set()
+
+# queries by (modname, 'local' or 'remote'), counted when MODS_STATS is set
+stats = Counter()
+
+# keep-alive session of each base url, see get_session
+sessions = {}
+sessions_lock = threading.Lock()
+
+
+def retry():
+    '''
+    Retries of the GETs, the only queries that can be repeated without
+    doing the work twice, when the connection fails or the node is busy
+    '''
+
+    kwargs = dict(total=settings.MODS_RETRIES, backoff_factor=settings.MODS_RETRY_BACKOFF,
+                  status_forcelist=(502, 503, 504), raise_on_status=False)
+    try:
+        return Retry(allowed_methods=frozenset(['GET']), **kwargs)
+    except TypeError:
+        # urllib3 < 1.26
+        return Retry(method_whitelist=frozenset(['GET']), **kwargs)
+
+
+def get_session(baseurl):
+    '''
+    Session of this process for the node in baseurl, it keeps up to
+    MODS_POOL_SIZE open connections to it
+    '''
+
+    with sessions_lock:
+        session = sessions.get(baseurl)
+        if session is None:
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.MODS_POOL_SIZE,
+                                  max_retries=retry())
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            sessions[baseurl] = session
+        return session
+
+
+def pool_stats():
+    '''
+    Connections opened and requests made to each node, every request
+    over the number of connections reused an open one
+    '''
+
+    result = {}
+    with sessions_lock:
+        items = list(sessions.items())
+    for baseurl, session in items:
+        connections = made = 0
+        for adapter in set(session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is not None:
+                    connections += pool.num_connections
+                    made += pool.num_requests
+        result[baseurl] = {'connections': connections, 'requests': made,
+                           'reused': max(0, made - connections)}
+    return result
+
+
+class LocalResponse:
+    '''
+    Response of a view called in this process, with the parts of a
+    requests response that the callers of query use
+    '''
+
+    def __init__(self, response):
+        if hasattr(response, 'render'):
+            response.render()
+        self.status_code = response.status_code
+        self.headers = CaseInsensitiveDict(response.items())
+        self.content = response.content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+
+    def json(self):
+        return json.loads(self.text)
+
+
+def is_local(mod):
+    return settings.MODS_LOCAL and mod.rstrip('/') == settings.BASEURL.rstrip('/')
+
+
+def local_query(url, method, headers, json_data):
+    '''
+    Calls the view of the url in this process, like an http request with
+    the same headers and json body. None if the url isn't a view of this
+    node
+    '''
+
+    parts = urllib.parse.urlsplit(url)
+    try:
+        match = resolve(parts.path)
+    except Resolver404:
+        return None
+
+    extra = {'HTTP_HOST': parts.netloc, 'QUERY_STRING': parts.query}
+    if 'Authorization' in headers:
+        extra['HTTP_AUTHORIZATION'] = headers['Authorization']
+    factory = RequestFactory()
+    if method == 'get':
+        request = factory.get(parts.path, secure=parts.scheme == 'https', **extra)
+    else:
+        request = factory.generic(method.upper(), parts.path, json.dumps(json_data),
+                                  content_type='application/json',
+                                  secure=parts.scheme == 'https', **extra)
+
+    return LocalResponse(match.func(request, *match.args, **match.kwargs))
+
+
+def use_wire(json_data):
+    return (settings.MIXNET_BINARY_WIRE and isinstance(json_data, dict)
+            and 'msgs' in json_data)
 
 
 def query(modname, entry_point='/', method='get', baseurl=None, **kwargs):
@@ -15,11 +151,15 @@ def query(modname, entry_point='/', method='get', baseurl=None, **kwargs):
     This function returns the json returned. If there's a problem an
     execption will be raised.
 
+    When the module is served by this same node, see MODS_LOCAL, its view
+    is called in this process instead of making an http request.
+
     Optional parameters
 
     This function can receive optional parameters to complete the query,
     you can complete the query with GET params using the **params** keyword
-    and with json data, using the **json** keyword.
+    and with json data, using the **json** keyword. The **timeout** keyword
+    replaces MODS_TIMEOUT for this query.
 
     Examples
 
@@ -35,7 +175,8 @@ def query(modname, entry_point='/', method='get', baseurl=None, **kwargs):
     else:
         mod = baseurl
 
-    q = getattr(requests, method)
+    timeout = kwargs.get('timeout', settings.MODS_TIMEOUT)
+    q = functools.partial(getattr(get_session(mod), method), timeout=timeout)
     url = '{}/{}{}'.format(mod, modname, entry_point)
 
     headers = {}
@@ -46,11 +187,32 @@ def query(modname, entry_point='/', method='get', baseurl=None, **kwargs):
     if params:
         url += '?{}'.format(urllib.parse.urlencode(params))
 
-    if method == 'get':
+    response = None
+    if is_local(mod):
+        response = local_query(url, method, headers, kwargs.get('json', {}))
+    if settings.MODS_STATS:
+        stats[(modname, 'remote' if response is None else 'local')] += 1
+
+    if response is None and method == 'get':
         response = q(url, headers=headers)
-    else:
+    elif response is None:
         json_data = kwargs.get('json', {})
-        response = q(url, json=json_data, headers=headers)
+        if use_wire(json_data):
+            headers['Accept'] = wire.ACCEPT
+            if mod in wire_peers:
+                data = wire.encode(json_data, settings.MIXNET_WIRE_COMPRESSION)
+                wheaders = dict(headers, **{'Content-Type': wire.MEDIA_TYPE})
+                response = q(url, data=data, headers=wheaders)
+                if response.status_code == 415:
+                    # the node doesn't parse the binary format anymore
+                    wire_peers.discard(mod)
+                    response = None
+        if response is None:
+            response = q(url, json=json_data, headers=headers)
+
+    if response.headers.get('Content-Type', '').startswith(wire.MEDIA_TYPE):
+        wire_peers.add(mod)
+        response = wire.WireResponse(response)
 
     if kwargs.get('response', False):
         return response
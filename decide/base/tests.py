@@ -1,8 +1,16 @@
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock
+
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.test import override_settings
 from rest_framework.test import APIClient
 from rest_framework.test import APITestCase
 
 from base import mods
+# mock_query replaces mods.query in the tests that call it
+from base.mods import query
 
 
 class BaseTestCase(APITestCase):
@@ -34,3 +42,78 @@ class BaseTestCase(APITestCase):
 
     def logout(self):
         self.client.credentials()
+
+
+class ModsTestCase(APITestCase):
+
+    def test_local_query(self):
+        self.assertTrue(mods.is_local(settings.BASEURL + '/'))
+        self.assertFalse(mods.is_local('http://remote.example.com'))
+
+        data = {
+            "voting": 1,
+            "auths": [
+                { "name": "auth1", "url": settings.BASEURL }
+            ]
+        }
+        response = mods.local_query(settings.BASEURL + '/mixnet/', 'post', {}, data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(response.json()), ['g', 'p', 'y'])
+
+        url = settings.BASEURL + '/mixnet/pool/1/'
+        response = mods.local_query(url, 'get', {}, {})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['content-type'], 'application/json')
+        self.assertEqual(response.json(), {"size": 0})
+
+        self.assertIsNone(mods.local_query(settings.BASEURL + '/nothing/', 'get', {}, {}))
+
+    def test_keep_alive(self):
+        answers = [503, 200, 200]
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                self.send_response(answers.pop(0))
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', '2')
+                self.end_headers()
+                self.wfile.write(b'{}')
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        baseurl = 'http://127.0.0.1:{}'.format(server.server_port)
+        try:
+            with override_settings(MODS_RETRY_BACKOFF=0):
+                session = mods.get_session(baseurl)
+                # the 503 is retried
+                self.assertEqual(session.get(baseurl + '/a/').status_code, 200)
+                self.assertEqual(session.get(baseurl + '/b/').status_code, 200)
+            self.assertIs(mods.get_session(baseurl), session)
+            self.assertEqual(mods.pool_stats()[baseurl],
+                             {'connections': 1, 'requests': 3, 'reused': 2})
+        finally:
+            # the server waits on the keep-alive connection until it's closed
+            mods.sessions.pop(baseurl).close()
+            server.shutdown()
+            server.server_close()
+
+    def test_timeout(self):
+        baseurl = 'http://10.0.0.1:8000'
+        session = mods.get_session(baseurl)
+        try:
+            with mock.patch.object(session, 'post') as post:
+                post.return_value.headers = {}
+                query('voting', method='post', baseurl=baseurl, json={}, response=True)
+                self.assertEqual(post.call_args[1]['timeout'], settings.MODS_TIMEOUT)
+
+                # the mixnet chain calls wait longer
+                query('mixnet', method='post', baseurl=baseurl, json={}, response=True,
+                      timeout=settings.MODS_CHAIN_TIMEOUT)
+                self.assertEqual(post.call_args[1]['timeout'], settings.MODS_CHAIN_TIMEOUT)
+        finally:
+            mods.sessions.pop(baseurl).close()
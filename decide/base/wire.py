@@ -0,0 +1,235 @@
+'''
+Compact binary format for ciphertext batches.
+
+The mixnet sends the votes between auths as lists of big integers. In
+JSON every number is written in decimal and parsed back, which is slow
+and takes more than twice the space. This format writes every number as
+a fixed width big endian integer:
+
+    magic        4 bytes  b'DCW1'
+    compression  1 byte   0 none, 1 gzip, 2 zstd. The rest of the
+                          message is compressed with it
+    width        4 bytes  bytes of each number
+    arity        1 byte   1 for a list of ints, 2 for a list of pairs
+    count        8 bytes  number of messages
+    has pk       1 byte   1 if p, g, y follow
+    meta length  4 bytes
+    p, g, y      width bytes each, only if has pk
+    meta         json with the rest of the keys of the request
+    msgs         count * arity * width bytes
+
+>>> data = {"msgs": [(3, 4), (5, 6)], "pk": {"p": 7, "g": 2, "y": 3}, "position": 1}
+>>> d = decode(encode(data))
+>>> d["msgs"], d["pk"], d["position"]
+([(3, 4), (5, 6)], {'p': 7, 'g': 2, 'y': 3}, 1)
+>>> decode(encode([1, 2, 300], compression='gzip'))
+[1, 2, 300]
+>>> decode(encode([0] * 1000, compression='gzip'), max_size=100)
+Traceback (most recent call last):
+    ...
+base.wire.WireError: Message bigger than 100 bytes
+'''
+
+import gzip
+import json
+import struct
+import zlib
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+MAGIC = b'DCW1'
+MEDIA_TYPE = 'application/x-decide-ciphertexts'
+# prefer the binary format, but old nodes will answer with json
+ACCEPT = '{}, application/json'.format(MEDIA_TYPE)
+
+HEADER = struct.Struct('>4sB')
+BODY = struct.Struct('>IBQBI')
+
+NONE, GZIP, ZSTD = 0, 1, 2
+COMPRESSIONS = {None: NONE, 'gzip': GZIP, 'zstd': ZSTD}
+
+# default cap of a message, in bytes, before and after decompressing it
+MAX_SIZE = 1024 * 1024 * 1024
+
+
+class WireError(ValueError):
+    pass
+
+
+def compress(body, compression):
+    if compression == GZIP:
+        return gzip.compress(body, compresslevel=1)
+    if compression == ZSTD:
+        return zstandard.ZstdCompressor().compress(body)
+    return body
+
+
+def decompress(body, compression, max_size=MAX_SIZE):
+    '''
+    The body decompressed, raises WireError if it's bigger than max_size,
+    so a small compressed message can't take all the memory
+    '''
+
+    if compression == GZIP:
+        d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        out = d.decompress(body, max_size + 1)
+        if not d.eof and not d.unconsumed_tail:
+            raise WireError('Truncated gzip message')
+    elif compression == ZSTD:
+        if zstandard is None:
+            raise WireError('zstd compression is not available')
+        out = zstandard.ZstdDecompressor().stream_reader(body).read(max_size + 1)
+    else:
+        out = body
+    if len(out) > max_size:
+        raise WireError('Message bigger than {} bytes'.format(max_size))
+    return out
+
+
+def encode(data, compression=None):
+    '''
+    Encodes a dict with msgs and pk, or a bare list of msgs
+    '''
+
+    if isinstance(data, dict):
+        meta = dict(data)
+        msgs = meta.pop('msgs', None) or []
+        pk = meta.pop('pk', None)
+    else:
+        meta, msgs, pk = None, data, None
+
+    arity = 1 if msgs and not isinstance(msgs[0], (list, tuple)) else 2
+    if arity == 1:
+        values = [int(m) for m in msgs]
+    else:
+        values = [int(i) for m in msgs for i in m]
+
+    pkvalues = [int(pk[i]) for i in ('p', 'g', 'y')] if pk else []
+    bits = max((v.bit_length() for v in values + pkvalues), default=0)
+    width = max(1, (bits + 7) // 8)
+
+    meta = json.dumps(meta).encode('utf-8')
+    parts = [BODY.pack(width, arity, len(msgs), 1 if pk else 0, len(meta))]
+    parts.extend(v.to_bytes(width, 'big') for v in pkvalues)
+    parts.append(meta)
+    parts.extend(v.to_bytes(width, 'big') for v in values)
+
+    if compression not in COMPRESSIONS:
+        raise WireError('Unknown compression: {}'.format(compression))
+    compression = COMPRESSIONS[compression]
+    if compression == ZSTD and zstandard is None:
+        compression = GZIP
+
+    return HEADER.pack(MAGIC, compression) + compress(b''.join(parts), compression)
+
+
+def decode(raw, max_size=MAX_SIZE):
+    '''
+    Decodes the numbers straight from the buffer, returns the same
+    structure that was encoded. The message can't be bigger than max_size
+    bytes, compressed or not.
+    '''
+
+    if len(raw) < HEADER.size:
+        raise WireError('Message too short')
+    if len(raw) > max_size:
+        raise WireError('Message bigger than {} bytes'.format(max_size))
+    magic, compression = HEADER.unpack_from(raw)
+    if magic != MAGIC:
+        raise WireError('Bad magic')
+
+    body = memoryview(decompress(raw[HEADER.size:], compression, max_size))
+    width, arity, count, has_pk, meta_len = BODY.unpack_from(body)
+    off = BODY.size
+    end = off + (3 * width if has_pk else 0) + meta_len + count * arity * width
+    if len(body) != end:
+        raise WireError('Bad message length')
+
+    frombytes = int.from_bytes
+
+    pk = None
+    if has_pk:
+        p, g, y = (frombytes(body[off + i * width:off + (i + 1) * width], 'big')
+                   for i in range(3))
+        pk = {'p': p, 'g': g, 'y': y}
+        off += 3 * width
+
+    meta = json.loads(bytes(body[off:off + meta_len]).decode('utf-8'))
+    off += meta_len
+
+    values = [frombytes(body[i:i + width], 'big')
+              for i in range(off, end, width)]
+    if arity == 1:
+        msgs = values
+    else:
+        it = iter(values)
+        msgs = list(zip(it, it))
+
+    if meta is None:
+        return msgs
+
+    meta['msgs'] = msgs
+    if pk:
+        meta['pk'] = pk
+    return meta
+
+
+class WireParser(BaseParser):
+    media_type = MEDIA_TYPE
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        max_size = settings.MIXNET_WIRE_MAX_SIZE
+        try:
+            # one more byte to know if it's bigger
+            return decode(stream.read(max_size + 1), max_size)
+        except (WireError, struct.error, ValueError) as e:
+            raise ParseError('Wire parse error - {}'.format(e))
+
+
+class WireRenderer(BaseRenderer):
+    media_type = MEDIA_TYPE
+    format = 'wire'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return encode(data, compression=settings.MIXNET_WIRE_COMPRESSION)
+
+
+class WireNegotiation(DefaultContentNegotiation):
+    '''
+    Selects the binary renderer only when the client asks for it, in any
+    other case the default negotiation is used so json is the default
+    '''
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        if MEDIA_TYPE in request.META.get('HTTP_ACCEPT', ''):
+            for renderer in renderers:
+                if renderer.media_type == MEDIA_TYPE:
+                    return renderer, MEDIA_TYPE
+        return super().select_renderer(request, renderers, format_suffix)
+
+
+class WireResponse:
+    '''
+    Wraps a requests response with a binary body, so json() decodes it
+    '''
+
+    def __init__(self, response):
+        self.response = response
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.content = response.content
+
+    def json(self):
+        return decode(self.content, settings.MIXNET_WIRE_MAX_SIZE)
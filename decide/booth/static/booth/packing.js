@@ -0,0 +1,41 @@
+// Ballot packing, with the same encoding as voting/packing.py: the
+// position of each option, 0 if it isn't ranked, is a digit of a
+// mixed-radix number, the first option is the least significant digit,
+// and the ballot is the number plus one, so the whole ranking is
+// encrypted in a single vote
+Packing = {};
+
+Packing.pack = function(digits, radices) {
+  if (digits.length != radices.length)
+    throw "Wrong number of digits";
+
+  var n = BigInt.ZERO;
+  for (var i = digits.length - 1; i >= 0; i--) {
+    if (digits[i] < 0 || digits[i] >= radices[i])
+      throw "Digit out of range";
+    n = n.multiply(BigInt.fromInt(radices[i])).add(BigInt.fromInt(digits[i]));
+  }
+  return n;
+};
+
+Packing.rankingRadices = function(n) {
+  var radices = [];
+  for (var i = 0; i < n; i++)
+    radices.push(n + 1);
+  return radices;
+};
+
+// the ranked positions are 1, 2, ... without gaps nor repetitions
+Packing.validRanking = function(positions) {
+  var ranked = positions.filter(p => p > 0).sort((a, b) => a - b);
+  return ranked.every((p, i) => p == i + 1);
+};
+
+// positions[i] is the position of the option i, in the order of their
+// numbers
+Packing.packRanking = function(positions) {
+  if (!Packing.validRanking(positions))
+    throw "Invalid ranking";
+  var radices = Packing.rankingRadices(positions.length);
+  return Packing.pack(positions, radices).add(BigInt.ONE);
+};
@@ -0,0 +1,96 @@
+// Elliptic curve ElGamal on P-256, with the same encoding as mixnet/ec.py:
+// the points are the SEC1 compressed form read as a number, and a message
+// m is encrypted as the point m * G
+EC = {};
+
+EC.P256 = {
+  p: new BigInt("ffffffff00000001000000000000000000000000ffffffffffffffffffffffff", 16),
+  b: new BigInt("5ac635d8aa3a93e7b3ebbd55769886bc651d06b0cc53b0f63bce3c3e27d2604b", 16),
+  n: new BigInt("ffffffff00000000ffffffffffffffffbce6faada7179e84f3b9cac2fc632551", 16),
+  size: 32
+};
+
+EC.THREE = BigInt.fromInt(3);
+
+// the keys of a curve have the field prime as p
+EC.isCurve = function(p) {
+  return p.equals(EC.P256.p);
+};
+
+// affine points {x: BigInt, y: BigInt}, null is the point at infinity
+EC.add = function(P, Q) {
+  if (P === null)
+    return Q;
+  if (Q === null)
+    return P;
+
+  var p = EC.P256.p;
+  var l;
+  if (P.x.equals(Q.x)) {
+    if (!P.y.equals(Q.y) || P.y.signum() == 0)
+      return null;
+    // doubling, a = -3
+    var num = P.x.multiply(P.x).multiply(EC.THREE).subtract(EC.THREE);
+    l = num.multiply(P.y.shiftLeft(1).modInverse(p)).mod(p);
+  } else {
+    var den = Q.x.subtract(P.x).mod(p).modInverse(p);
+    l = Q.y.subtract(P.y).multiply(den).mod(p);
+  }
+
+  var x = l.multiply(l).subtract(P.x).subtract(Q.x).mod(p);
+  var y = l.multiply(P.x.subtract(x)).subtract(P.y).mod(p);
+  return {x: x, y: y};
+};
+
+EC.mul = function(k, P) {
+  var R = null;
+  k = k.mod(EC.P256.n);
+  for (var i = k.bitLength() - 1; i >= 0; i--) {
+    R = EC.add(R, R);
+    if (k.testBit(i))
+      R = EC.add(R, P);
+  }
+  return R;
+};
+
+EC.encode = function(P) {
+  if (P === null)
+    return BigInt.ZERO;
+  var prefix = BigInt.fromInt(P.y.testBit(0) ? 3 : 2);
+  return prefix.shiftLeft(8 * EC.P256.size).or(P.x);
+};
+
+EC.decode = function(n) {
+  if (n.signum() == 0)
+    return null;
+
+  var curve = EC.P256;
+  var bits = 8 * curve.size;
+  var prefix = n.shiftRight(bits).intValue();
+  var x = n.and(BigInt.ONE.shiftLeft(bits).subtract(BigInt.ONE));
+
+  var rhs = x.multiply(x).multiply(x).subtract(x.multiply(EC.THREE)).add(curve.b).mod(curve.p);
+  // p = 3 mod 4
+  var e = curve.p.add(BigInt.ONE).shiftRight(2);
+  var y = rhs.modPow(e, curve.p);
+  if (!y.multiply(y).mod(curve.p).equals(rhs))
+    throw "Point not in the curve";
+  if (y.testBit(0) != ((prefix & 1) == 1))
+    y = curve.p.subtract(y);
+  return {x: x, y: y};
+};
+
+EC.encrypt = function(pk, m, r) {
+  if (!r) {
+    var n1 = EC.P256.n.subtract(BigInt.ONE);
+    r = ElGamal.getRandomInteger(n1).add(BigInt.ONE);
+  }
+
+  var g = EC.decode(pk.g);
+  var y = EC.decode(pk.y);
+
+  var alpha = EC.mul(r, g);
+  var beta = EC.add(EC.mul(m, g), EC.mul(r, y));
+
+  return { alpha: EC.encode(alpha), beta: EC.encode(beta) };
+};
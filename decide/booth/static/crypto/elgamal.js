@@ -11,6 +11,36 @@ ElGamal.getRandomInteger = function(max) {
   return BigInt._from_java_object(random).mod(max);
 };
 
+// Jacobi symbol (a/n) for an odd n
+ElGamal.jacobi = function(a, n) {
+  var three = BigInt.fromInt(3);
+  var result = 1;
+  a = a.mod(n);
+  while (a.signum() != 0) {
+    var s = a.getLowestSetBit();
+    a = a.shiftRight(s);
+    var n8 = n.and(BigInt.fromInt(7)).intValue();
+    if ((s & 1) && (n8 == 3 || n8 == 5))
+      result = -result;
+    var t = a;
+    a = n;
+    n = t;
+    if (a.and(three).intValue() == 3 && n.and(three).intValue() == 3)
+      result = -result;
+    a = a.mod(n);
+  }
+  return n.equals(BigInt.ONE) ? result : 0;
+};
+
+// Encodes m in the subgroup of quadratic residues, where g is, so the
+// cipher doesn't leak the Legendre symbol of the vote. See to_subgroup in
+// mixnet/mixcrypt.py
+ElGamal.toSubgroup = function(m, p) {
+  if (ElGamal.jacobi(m, p) == 1)
+    return m;
+  return p.subtract(m);
+};
+
 ElGamal.encrypt = function(pk, m, r) {
   if (m.equals(BigInt.ZERO))
     throw "Can't encrypt 0 with El Gamal"
@@ -21,8 +51,77 @@ ElGamal.encrypt = function(pk, m, r) {
     r = ElGamal.getRandomInteger(q1);
   }
 
+  m = ElGamal.toSubgroup(m, pk.p);
   var alpha = pk.g.modPow(r, pk.p);
   var beta = (pk.y.modPow(r, pk.p)).multiply(m).mod(pk.p);
 
   return { alpha: alpha, beta: beta };
 };
+
+// Exponential ElGamal, encrypts g^m. Used by homomorphic votings, where
+// the ciphers of all the votes are multiplied to add them
+ElGamal.encryptExp = function(pk, m, r) {
+  var gm = pk.g.modPow(BigInt.fromInt(m), pk.p);
+  return ElGamal.encrypt(pk, gm, r);
+};
+
+// Proofs of validity of the homomorphic ballots, the same as
+// mixnet/ballotproof.py: each cipher encrypts g^0 or g^1, and their
+// product encrypts g^1. Every number is modulo q = (p - 1) / 2
+ElGamal.order = function(p) {
+  return p.subtract(BigInt.ONE).shiftRight(1);
+};
+
+ElGamal.challenge = function(label, context, p, values) {
+  var text = [label, '' + context].concat(values.map(v => v.toString())).join('|');
+  var hex = sjcl.codec.hex.fromBits(sjcl.hash.sha256.hash(text));
+  return new BigInt(hex, 16).mod(ElGamal.order(p));
+};
+
+// (g^s a^-c, y^s b^-c)
+ElGamal.commitment = function(pk, a, b, c, s) {
+  var p = pk.p;
+  var inv = ElGamal.order(p).subtract(c).mod(ElGamal.order(p));
+  return [pk.g.modPow(s, p).multiply(a.modPow(inv, p)).mod(p),
+          pk.y.modPow(s, p).multiply(b.modPow(inv, p)).mod(p)];
+};
+
+// b / g^m
+ElGamal.divG = function(pk, b, m) {
+  var q = ElGamal.order(pk.p);
+  return b.multiply(pk.g.modPow(q.subtract(BigInt.fromInt(m)).mod(q), pk.p)).mod(pk.p);
+};
+
+ElGamal.proveBit = function(pk, cipher, m, r, context) {
+  var p = pk.p, q = ElGamal.order(p);
+  var cs = [null, null], ss = [null, null], ts = [null, null];
+
+  // the other branch is simulated with a random challenge and answer
+  var j = 1 - m;
+  cs[j] = ElGamal.getRandomInteger(q);
+  ss[j] = ElGamal.getRandomInteger(q);
+  ts[j] = ElGamal.commitment(pk, cipher.alpha, ElGamal.divG(pk, cipher.beta, j), cs[j], ss[j]);
+
+  var w = ElGamal.getRandomInteger(q);
+  ts[m] = [pk.g.modPow(w, p), pk.y.modPow(w, p)];
+  var values = [p, pk.g, pk.y, cipher.alpha, cipher.beta].concat(ts[0], ts[1]);
+  var c = ElGamal.challenge('decide-ballot-bit', context, p, values);
+  cs[m] = c.subtract(cs[j]).mod(q);
+  ss[m] = w.add(cs[m].multiply(r)).mod(q);
+  return {c: cs.map(v => v.toString()), s: ss.map(v => v.toString())};
+};
+
+ElGamal.proveSum = function(pk, ciphers, rs, context) {
+  var p = pk.p, q = ElGamal.order(p);
+  var A = BigInt.ONE, B = BigInt.ONE, R = BigInt.ZERO;
+  for (var i = 0; i < ciphers.length; i++) {
+    A = A.multiply(ciphers[i].alpha).mod(p);
+    B = B.multiply(ciphers[i].beta).mod(p);
+    R = R.add(rs[i]);
+  }
+
+  var w = ElGamal.getRandomInteger(q);
+  var values = [p, pk.g, pk.y, A, B, pk.g.modPow(w, p), pk.y.modPow(w, p)];
+  var c = ElGamal.challenge('decide-ballot-sum', context, p, values);
+  return {c: c.toString(), s: w.add(c.multiply(R)).mod(q).toString()};
+};
@@ -28,6 +28,7 @@ class BoothView(TemplateView):
             raise Http404
 
         context['KEYBITS'] = settings.KEYBITS
+        context['EXPONENT_BITS'] = settings.MIXNET_EXPONENT_BITS or settings.KEYBITS
 
         return context
 
@@ -52,6 +53,7 @@ class BoothViewUrl(TemplateView):
             raise Http404
 
         context['KEYBITS'] = settings.KEYBITS
+        context['EXPONENT_BITS'] = settings.MIXNET_EXPONENT_BITS or settings.KEYBITS
 
         return context
 
@@ -41,6 +41,13 @@ class CensusTestCase(BaseTestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.json(), {'voters': [1]})
 
+        response = self.client.get('/census/?voting_id=1&voters=1,2', format='json')
+        self.assertEqual(response.json(), {'voters': [1]})
+        response = self.client.get('/census/?voting_id=1&voters=2', format='json')
+        self.assertEqual(response.json(), {'voters': []})
+        response = self.client.get('/census/?voting_id=1&voters=x', format='json')
+        self.assertEqual(response.status_code, 400)
+
     def test_add_new_voters_conflict(self):
         data = {'voting_id': 1, 'voters': [1]}
         response = self.client.post('/census/', data, format='json')
@@ -30,8 +30,16 @@ class CensusCreate(generics.ListCreateAPIView):
 
     def list(self, request, *args, **kwargs):
         voting_id = request.GET.get('voting_id')
-        voters = Census.objects.filter(voting_id=voting_id).values_list('voter_id', flat=True)
-        return Response({'voters': voters})
+        voters = Census.objects.filter(voting_id=voting_id)
+        # only these voters, a comma separated list of ids
+        ids = request.GET.get('voters')
+        if ids is not None:
+            try:
+                ids = [int(i) for i in ids.split(',') if i]
+            except ValueError:
+                return Response('Invalid voters', status=ST_400)
+            voters = voters.filter(voter_id__in=ids)
+        return Response({'voters': voters.values_list('voter_id', flat=True)})
 
 
 class CensusDetail(generics.RetrieveDestroyAPIView):
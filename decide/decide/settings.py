@@ -212,6 +212,112 @@ SOCIAL_AUTH_USER_FIELDS = ['username']
 # number of bits for the key, all auths should use the same number of bits
 KEYBITS = 161
 
+# use the standard groups of RFC 7919 and RFC 3526 when KEYBITS is the size
+# of one of them (1536, 2048, 3072 or 4096), so a new key is only a random
+# exponent instead of the search of a safe prime
+MIXNET_STANDARD_GROUPS = True
+
+# bits of the random exponents of the mixnet keys and reencryptions. Short
+# exponents, at least twice the security level of the group, make every
+# exponentiation faster, 256 bits is 8x shorter than a 2048 bits key. None
+# uses exponents of the full size of the group
+MIXNET_EXPONENT_BITS = 256
+
+# the first auth asks all the others for their key shares at the same time,
+# with up to this number of requests in flight, so creating the voting key
+# takes the latency of the slowest auth instead of the sum of all of them.
+# 0 uses the chain, where each auth asks the next one
+MIXNET_KEYGEN_FANOUT = 8
+
+# the first auth decrypts with all the auths at the same time: each one
+# computes its decryption shares, with up to this number of requests in
+# flight, and the first auth combines them. 0 uses the chain, where each
+# auth removes its layer and calls the next one
+MIXNET_DECRYPT_FANOUT = 8
+
+# every shuffle stores a transcript with a proof that its output is a
+# permutation and reencryption of its input, see mixnet/shuffleproof.py,
+# that the verifyshuffle command checks. Only for the modp groups
+MIXNET_SHUFFLE_PROOFS = True
+
+# every decryption stores a proof that the decryption shares of this auth
+# were computed with its key, see mixnet/decryptproof.py, that the
+# verifydecrypt command checks. The first auth of a fan out decryption
+# checks the proofs of the others. Only for the modp groups
+MIXNET_DECRYPT_PROOFS = True
+
+# big integer backend for the mixnet crypto: 'auto', 'python' or 'gmpy2'.
+# 'auto' uses gmpy2 when it's installed and falls back to pure python
+MIXNET_BACKEND = 'auto'
+
+# processes used to reencrypt votes in the mixnet shuffle. 1 disables the
+# process pool, 0 uses one process per core
+MIXNET_SHUFFLE_WORKERS = 1
+
+# precompute window tables for g and the public key of each voting, so the
+# reencryptions don't need full modular exponentiations. The tables of each
+# process are capped to MIXNET_FIXEDBASE_MAX_BYTES
+MIXNET_FIXEDBASE = True
+MIXNET_FIXEDBASE_MAX_BYTES = 64 * 1024 * 1024
+
+# the mixnets of the last votings are cached in each process, with their
+# keys ready and their next auths, so each request or chunk doesn't read
+# them again. 0 disables the cache
+MIXNET_CACHE_SIZE = 256
+
+# send the votes between mixnet nodes in a compact binary format instead of
+# json, when the other node supports it. The binary messages can also be
+# compressed: None, 'gzip' or 'zstd' (needs the zstandard package)
+MIXNET_BINARY_WIRE = True
+MIXNET_WIRE_COMPRESSION = None
+# the binary messages bigger than this, in bytes, compressed or not, are
+# rejected
+MIXNET_WIRE_MAX_SIZE = 1024 * 1024 * 1024
+
+# the queries to the modules of this same node, APIS[modname] == BASEURL,
+# call their views in this process instead of making a loopback http
+# request. With MODS_STATS every query is counted as local or remote in
+# base.mods.stats
+MODS_LOCAL = True
+MODS_STATS = False
+
+# the queries to other nodes reuse keep-alive connections, up to
+# MODS_POOL_SIZE per node and process. MODS_TIMEOUT is the (connect, read)
+# timeout in seconds. The mixnet calls of the key, the shuffle and the
+# decryption wait for the rest of the chain, that can take hours in a big
+# election, so they use MODS_CHAIN_TIMEOUT, None waits without limit. The
+# GETs are retried MODS_RETRIES times when the connection fails or the
+# node answers 502, 503 or 504, waiting MODS_RETRY_BACKOFF * 2^n seconds
+MODS_POOL_SIZE = 10
+MODS_TIMEOUT = (5, 1800)
+MODS_CHAIN_TIMEOUT = (5, None)
+MODS_RETRIES = 3
+MODS_RETRY_BACKOFF = 0.5
+
+# the tally sends the votes to the mixnet in chunks of this number of
+# ballots, so no auth has the whole election in memory. 0 sends all the
+# votes in one request. MIXNET_CHUNK_WINDOW chunks are decrypted at the same
+# time, so each auth decrypts one chunk while the next one decrypts another
+MIXNET_CHUNK_SIZE = 10000
+MIXNET_CHUNK_WINDOW = 2
+# the proof of a chunked shuffle is over all its ballots, so the auth keeps
+# every input and output chunk in memory until it's built, and the proof
+# itself grows with the ballots. The chunked shuffles only store a proof,
+# see MIXNET_SHUFFLE_PROOFS, with MIXNET_CHUNK_PROOFS
+MIXNET_CHUNK_PROOFS = False
+
+# tables to decode the totals of homomorphic votings. Each table takes at
+# most MIXNET_DLOG_MAX_BYTES, a bigger table decodes bigger totals with a
+# single lookup
+MIXNET_DLOG_DIR = os.path.join(BASE_DIR, 'mixnet', 'dlog_cache')
+MIXNET_DLOG_MAX_BYTES = 64 * 1024 * 1024
+
+# run the tallies in a background thread, the request that starts it
+# answers with 202 and the progress is in /voting/<id>/tally/. A running
+# tally without progress in TALLY_JOB_STALE seconds can be retried
+TALLY_ASYNC = True
+TALLY_JOB_STALE = 600
+
 # Versioning
 ALLOWED_VERSIONS = ['v1', 'v2']
 DEFAULT_VERSION = 'v1'
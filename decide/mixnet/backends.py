@@ -0,0 +1,133 @@
+'''
+Big integer arithmetic backends for MixCrypt.
+
+Every backend exposes the same small set of operations, so MixCrypt
+doesn't need to know which library is doing the math. Values returned by
+a backend can be backend specific numbers (gmpy2.mpz), use ``int()`` to
+get a python int back.
+
+>>> b = get_backend('python')
+>>> b.powmod(3, 5, 7)
+5
+>>> b.invert(3, 7)
+5
+>>> b.batch_invert([2, 3, 6], 7)
+[4, 5, 6]
+>>> [b.jacobi(a, 7) for a in range(1, 7)]
+[1, 1, -1, 1, -1, -1]
+>>> get_backend('auto').name in BACKENDS
+True
+'''
+
+from Crypto.Util.number import inverse
+
+try:
+    import gmpy2
+except ImportError:
+    gmpy2 = None
+
+
+class PythonBackend:
+    '''
+    Pure python backend, always available
+    '''
+
+    name = 'python'
+
+    def mpz(self, n):
+        return int(n)
+
+    def powmod(self, base, exp, mod):
+        return pow(base, exp, mod)
+
+    def invert(self, n, mod):
+        return inverse(n, mod)
+
+    def jacobi(self, a, n):
+        '''
+        Jacobi symbol (a/n) for an odd n, with the binary algorithm, much
+        faster than Euler's criterion a^((n-1)/2)
+        '''
+
+        a, n = int(a) % int(n), int(n)
+        result = 1
+        while a:
+            while not a & 1:
+                a >>= 1
+                if n & 7 in (3, 5):
+                    result = -result
+            a, n = n, a
+            if a & 3 == 3 and n & 3 == 3:
+                result = -result
+            a %= n
+        return result if n == 1 else 0
+
+    def batch_invert(self, values, mod):
+        '''
+        Inverts all the values with only one modular inversion, using
+        Montgomery's trick: the product of all of them is inverted and
+        each inverse is recovered with two multiplications.
+        '''
+
+        prods = []
+        acc = 1
+        for v in values:
+            acc = (acc * v) % mod
+            prods.append(acc)
+
+        inv = self.invert(acc, mod)
+        invs = [0] * len(values)
+        for i in range(len(values) - 1, 0, -1):
+            invs[i] = (inv * prods[i - 1]) % mod
+            inv = (inv * values[i]) % mod
+        if values:
+            invs[0] = inv
+        return invs
+
+
+class GmpyBackend(PythonBackend):
+    '''
+    GMP backend, used when gmpy2 is installed
+    '''
+
+    name = 'gmpy2'
+
+    def mpz(self, n):
+        return gmpy2.mpz(int(n))
+
+    def powmod(self, base, exp, mod):
+        return gmpy2.powmod(base, exp, mod)
+
+    def invert(self, n, mod):
+        return gmpy2.invert(n, mod)
+
+    def jacobi(self, a, n):
+        return int(gmpy2.jacobi(a, n))
+
+
+BACKENDS = {
+    PythonBackend.name: PythonBackend,
+    GmpyBackend.name: GmpyBackend,
+}
+
+
+def available_backends():
+    names = [PythonBackend.name]
+    if gmpy2 is not None:
+        names.append(GmpyBackend.name)
+    return names
+
+
+def get_backend(name=None):
+    '''
+    Returns a backend instance by name. With no name, or 'auto', the
+    fastest available backend is selected.
+    '''
+
+    if isinstance(name, PythonBackend):
+        return name
+    if not name or name == 'auto':
+        name = available_backends()[-1]
+    if name not in available_backends():
+        raise ValueError('Unavailable mixnet backend: {}'.format(name))
+    return BACKENDS[name]()
@@ -0,0 +1,202 @@
+'''
+Proofs of validity of the homomorphic ballots.
+
+A ballot of a homomorphic voting has an exponential ElGamal cipher
+(a, b) = (g^r, g^m y^r) per option, and the store multiplies them into the
+totals without decrypting them. So the voter proves, without showing the
+vote, that every m is 0 or 1 and that the m of all the options add up to
+1. Without the proofs a cipher of g^5, or g^1 in every option, would add
+extra votes to the totals.
+
+Each bit is a disjunctive Chaum-Pedersen proof, one branch is a real
+proof that log_g a = log_y (b / g^m) and the other one is simulated, and
+the sum is a Chaum-Pedersen proof that log_g A = log_y (B / g) for the
+products A and B of the ciphers. The challenges are a sha256 of the
+decimal numbers, the same in the booth, see booth/static/crypto/elgamal.js,
+with the voting and the voter in the context, so a proof can't be copied
+to another ballot. Every number is modulo q = (p - 1) / 2, the order of
+the subgroup of g in the safe primes of the votings.
+
+>>> from mixnet.groups import GROUP_NAMES
+>>> p, g, x = GROUP_NAMES['ffdhe2048'].p, 2, 1234
+>>> pk = (p, g, pow(g, x, p))
+>>> ms, rs = [0, 1, 0], [5, 6, 7]
+>>> ciphers = [(pow(g, r, p), pow(g, m, p) * pow(pk[2], r, p) % p) for m, r in zip(ms, rs)]
+>>> ballot = prove_ballot(pk, ciphers, ms, rs, '1|2')
+>>> verify_ballot(pk, ciphers, ballot, '1|2')
+True
+>>> verify_ballot(pk, ciphers, ballot, '1|3')
+False
+>>> verify_ballot(pk, ciphers[::-1], ballot, '1|2')
+False
+'''
+
+import hashlib
+
+from Crypto.Random import random
+
+from .backends import get_backend
+
+
+def order(p):
+    return (int(p) - 1) // 2
+
+
+def challenge(label, context, p, values):
+    text = '|'.join([label, str(context)] + [str(int(v)) for v in values])
+    return int(hashlib.sha256(text.encode('ascii')).hexdigest(), 16) % order(p)
+
+
+def member(be, v, p):
+    '''
+    v is in the subgroup of order q, where g and y are
+    '''
+
+    return 0 < v < p and be.powmod(be.mpz(v), order(p), be.mpz(p)) == 1
+
+
+def commitment(be, pk, a, b, c, s):
+    '''
+    (g^s a^-c, y^s b^-c), the commitment of a Chaum-Pedersen proof of
+    log_g a = log_y b with challenge c and answer s
+    '''
+
+    p, g, y = (be.mpz(v) for v in pk)
+    q = order(p)
+    inv = (q - c) % q
+    return (be.powmod(g, s, p) * be.powmod(be.mpz(a), inv, p) % p,
+            be.powmod(y, s, p) * be.powmod(be.mpz(b), inv, p) % p)
+
+
+def div_g(pk, b, m):
+    # b / g^m, g^-1 is g^(q-1)
+    p, g = int(pk[0]), int(pk[1])
+    return b * pow(g, (order(p) - m) % order(p), p) % p
+
+
+def prove_bit(pk, a, b, m, r, context, backend=None):
+    '''
+    Proof that (a, b) = (g^r, g^m y^r) with m 0 or 1
+    '''
+
+    be = get_backend(backend)
+    p, g, y = (int(v) for v in pk)
+    q = order(p)
+    cs, ss, ts = [0, 0], [0, 0], [None, None]
+
+    # the other branch is simulated with a random challenge and answer
+    j = 1 - m
+    cs[j], ss[j] = random.randrange(q), random.randrange(q)
+    ts[j] = commitment(be, pk, a, div_g(pk, b, j), cs[j], ss[j])
+
+    w = random.randrange(q)
+    ts[m] = (be.powmod(be.mpz(g), w, be.mpz(p)), be.powmod(be.mpz(y), w, be.mpz(p)))
+    c = challenge('decide-ballot-bit', context, p, list(pk) + [a, b] + list(ts[0]) + list(ts[1]))
+    cs[m] = (c - cs[j]) % q
+    ss[m] = (w + cs[m] * int(r)) % q
+    return {'c': cs, 's': ss}
+
+
+def verify_bit(pk, a, b, proof, context, backend=None):
+    be = get_backend(backend)
+    p = int(pk[0])
+    q = order(p)
+    try:
+        cs = [int(c) for c in proof['c']]
+        ss = [int(s) for s in proof['s']]
+    except (KeyError, TypeError, ValueError):
+        return False
+    if len(cs) != 2 or len(ss) != 2 or not all(0 <= v < q for v in cs + ss):
+        return False
+
+    ts = [commitment(be, pk, a, div_g(pk, b, j), cs[j], ss[j]) for j in (0, 1)]
+    c = challenge('decide-ballot-bit', context, p, list(pk) + [a, b] + list(ts[0]) + list(ts[1]))
+    return (cs[0] + cs[1]) % q == c
+
+
+def product(ciphers, p):
+    A, B = 1, 1
+    for a, b in ciphers:
+        A, B = A * int(a) % p, B * int(b) % p
+    return A, B
+
+
+def prove_sum(pk, ciphers, rs, context, backend=None):
+    '''
+    Proof that the product of the ciphers is an encryption of g^1, with
+    the sum of the rs
+    '''
+
+    be = get_backend(backend)
+    p, g, y = (int(v) for v in pk)
+    q = order(p)
+    A, B = product(ciphers, p)
+
+    w = random.randrange(q)
+    t = (be.powmod(be.mpz(g), w, be.mpz(p)), be.powmod(be.mpz(y), w, be.mpz(p)))
+    c = challenge('decide-ballot-sum', context, p, list(pk) + [A, B] + list(t))
+    return {'c': c, 's': (w + c * sum(int(r) for r in rs)) % q}
+
+
+def verify_sum(pk, ciphers, proof, context, backend=None):
+    be = get_backend(backend)
+    p = int(pk[0])
+    try:
+        c, s = int(proof['c']), int(proof['s'])
+    except (KeyError, TypeError, ValueError):
+        return False
+    if not 0 <= c < order(p) or not 0 <= s < order(p):
+        return False
+
+    A, B = product(ciphers, p)
+    t = commitment(be, pk, A, div_g(pk, B, 1), c, s)
+    return c == challenge('decide-ballot-sum', context, p, list(pk) + [A, B] + list(t))
+
+
+def prove_ballot(pk, ciphers, ms, rs, context, backend=None):
+    '''
+    Proofs of the ciphers of a ballot, that encrypt ms with rs: a list
+    with the proof of each bit and the proof of the sum
+    '''
+
+    bits = [prove_bit(pk, a, b, m, r, context, backend)
+            for (a, b), m, r in zip(ciphers, ms, rs)]
+    return {'options': bits, 'sum': prove_sum(pk, ciphers, rs, context, backend)}
+
+
+def verify_ballot(pk, ciphers, proof, context, backend=None):
+    '''
+    True if every cipher is in the subgroup of g and encrypts 0 or 1, and
+    only one of them encrypts 1
+    '''
+
+    be = get_backend(backend)
+    p = int(pk[0])
+    try:
+        bits, total = proof['options'], proof['sum']
+    except (KeyError, TypeError):
+        return False
+    if not ciphers or not isinstance(bits, list) or len(bits) != len(ciphers):
+        return False
+    if not all(member(be, int(v), p) for c in ciphers for v in c):
+        return False
+
+    return (all(verify_bit(pk, a, b, bit, context, backend)
+                for (a, b), bit in zip(ciphers, bits)) and
+            verify_sum(pk, ciphers, total, context, backend))
+
+
+def encrypt_ballot(k, numbers, selected, context):
+    '''
+    Vote of a homomorphic voting for the option selected, with the
+    proofs, like the booth sends it. k is the MixCrypt of the public key
+    '''
+
+    pk = (int(k.k.p), int(k.k.g), int(k.k.y))
+    ms = [1 if n == selected else 0 for n in numbers]
+    rs = [random.randrange(order(pk[0])) for n in numbers]
+    ciphers = [k.encrypt_exp(m, r=r) for m, r in zip(ms, rs)]
+    proof = prove_ballot(pk, ciphers, ms, rs, context, k.backend)
+    options = [{'number': n, 'a': a, 'b': b, 'proof': bit}
+               for n, (a, b), bit in zip(numbers, ciphers, proof['options'])]
+    return {'options': options, 'proof': proof['sum']}
@@ -0,0 +1,77 @@
+'''
+Process-local cache of the mixnets of the requests
+
+Each shuffle or decrypt request, or each chunk of them, used to load its
+Mixnet and key from the database, generate a throwaway key in the
+MixCrypt before setting the stored one, and query the next auths. The
+cache keeps the Mixnet of each (voting_id, position) with its MixCrypt
+and its chain of next auths ready, see Mixnet.crypt and Mixnet.chain.
+
+The entries are removed by the signals in models.py when a mixnet, its
+auths or its keys change in this process.
+'''
+
+from collections import OrderedDict
+import threading
+
+
+MAX_SIZE = 256
+
+
+class MixnetCache:
+    '''
+    LRU cache of mixnets by (voting_id, position), bounded by max_size
+    entries
+    '''
+
+    def __init__(self, max_size=MAX_SIZE):
+        self.max_size = max_size
+        self.mixnets = OrderedDict()
+        self.lock = threading.Lock()
+        # changed by every invalidation, a mixnet loaded before one isn't
+        # stored, it could be the old one
+        self.generation = 0
+
+    def get(self, voting_id, position, load):
+        '''
+        Mixnet of the voting in position, load() reads it if it isn't
+        cached
+        '''
+
+        key = (int(voting_id), int(position))
+        with self.lock:
+            mn = self.mixnets.get(key)
+            if mn is not None:
+                self.mixnets.move_to_end(key)
+                return mn
+            generation = self.generation
+
+        mn = load()
+        with self.lock:
+            if self.max_size and generation == self.generation:
+                self.mixnets[key] = mn
+                while len(self.mixnets) > self.max_size:
+                    self.mixnets.popitem(last=False)
+        return mn
+
+    def invalidate(self, match):
+        '''
+        Removes the mixnets where match(mixnet) is true
+        '''
+
+        with self.lock:
+            self.generation += 1
+            for key, mn in list(self.mixnets.items()):
+                if match(mn):
+                    del self.mixnets[key]
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.mixnets.clear()
+
+    def __len__(self):
+        return len(self.mixnets)
+
+
+cache = MixnetCache()
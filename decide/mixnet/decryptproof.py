@@ -0,0 +1,196 @@
+'''
+Proof of correct decryption, that every decryption share d_i = a_i^x of
+an auth was computed with the secret key x of its public key y = g^x.
+
+Each share would need a Chaum-Pedersen proof that log_g y = log_a d, N
+proofs to make and 4N exponentiations to verify. They're joined in one
+with a random linear combination: the exponents e_i are a hash of all
+the a_i and d_i, A = prod(a_i^e_i), D = prod(d_i^e_i), and there's a
+single Chaum-Pedersen proof that log_g y = log_A D. If any share is wrong
+D != A^x, except with probability 2^-CHALLENGE_BITS. Verifying N shares
+costs the two products of N short powers, see multi_pow, and four
+exponentiations.
+
+The shares alone don't show what the auth forwards. When it decrypts its
+layer of (a, b) and sends (a, b / d) to the next auth, the transcript
+also has the b and the b / d of each cipher, see check_outputs, so an auth
+can't prove right shares and forward other ciphers.
+
+>>> from mixnet.groups import GROUP_NAMES
+>>> p, g, x = GROUP_NAMES['ffdhe2048'].p, 2, 1234
+>>> pk = (p, g, pow(g, x, p))
+>>> alist = [pow(g, r, p) for r in (3, 5, 7)]
+>>> dlist = [pow(a, x, p) for a in alist]
+>>> proof = prove(pk, x, alist, dlist)
+>>> verify(pk, alist, dlist, proof)
+True
+>>> verify(pk, alist, dlist[::-1], proof)
+False
+>>> loads(dumps(pk, alist, dlist, proof)) == (pk, alist, dlist, proof, None, None)
+True
+>>> blist = [7 * d % p for d in dlist]
+>>> check_outputs(pk, blist, dlist, [7, 7, 7])
+True
+>>> loads(dumps(pk, alist, dlist, proof, blist, [7, 7, 7]))[4:] == (blist, [7, 7, 7])
+True
+'''
+
+import hashlib
+import struct
+
+from .backends import get_backend
+from .mixcrypt import split
+from .shuffleproof import (CHALLENGE_BITS, STAT_BITS, challenges, hash_ints,
+                           member_chunk, pmap, power_product, randbits, width)
+
+
+MAGIC = b'DDP1'
+# with the b and b / d of each cipher
+MAGIC_CIPHERS = b'DDP2'
+# magic, bytes of each number, number of shares
+HEADER = struct.Struct('>4sIQ')
+
+
+class ProofError(ValueError):
+    pass
+
+
+def seed(pk, alist, dlist):
+    h = hashlib.sha256(b'decide-decrypt')
+    size = width(pk[0])
+    hash_ints(h, pk, size)
+    h.update(len(alist).to_bytes(8, 'big'))
+    hash_ints(h, alist, size)
+    hash_ints(h, dlist, size)
+    return h.digest()
+
+
+def challenge(seed, p, t):
+    h = hashlib.sha256(seed)
+    hash_ints(h, t, width(p))
+    return int.from_bytes(h.digest()[:CHALLENGE_BITS // 8], 'big')
+
+
+def combine(pk, alist, dlist, backend=None, workers=1):
+    '''
+    (A, D) and the seed of the shares
+    '''
+
+    s = seed(pk, alist, dlist)
+    e = challenges(s, len(alist))
+    p = pk[0]
+    return (power_product(alist, e, p, backend, workers),
+            power_product(dlist, e, p, backend, workers), s)
+
+
+def prove(pk, x, alist, dlist, backend=None, workers=1):
+    '''
+    Proof that dlist[i] is alist[i]^x, for the public key pk = (p, g, y)
+    with y = g^x
+    '''
+
+    be = get_backend(backend)
+    p, g, y = (int(v) for v in pk)
+    A, D, s = combine((p, g, y), alist, dlist, be, workers)
+
+    # x < p, so w hides it whatever its size
+    w = randbits(p.bit_length() + CHALLENGE_BITS + STAT_BITS)
+    t = [int(be.powmod(be.mpz(g), w, be.mpz(p))), int(be.powmod(A, w, be.mpz(p)))]
+    c = challenge(s, p, t)
+    return {'t': t, 's': w + c * int(x)}
+
+
+def verify(pk, alist, dlist, proof, backend=None, workers=1):
+    '''
+    True if the proof shows that every dlist[i] is alist[i]^x, where x is
+    the secret key of pk
+    '''
+
+    be = get_backend(backend)
+    p, g, y = (int(v) for v in pk)
+
+    try:
+        (t1, t2), s = proof['t'], int(proof['s'])
+    except (KeyError, TypeError, ValueError):
+        return False
+
+    if not alist or len(alist) != len(dlist) or s < 0:
+        return False
+
+    # the shares and the ciphers of the booth are in the subgroup of order
+    # q. A share out of it, like -a^x, would change D only by a sign
+    values = [y, t1, t2] + list(alist) + list(dlist)
+    args = [(p, c, be.name) for c in split(values, max(1, workers)) if c]
+    if not all(pmap(member_chunk, args, workers)):
+        return False
+
+    A, D, sd = combine((p, g, y), alist, dlist, be, workers)
+    c = challenge(sd, p, [t1, t2])
+
+    mpz = be.mpz
+    p_ = mpz(p)
+
+    def check(base, x, t):
+        # base^s == t x^c
+        return be.powmod(mpz(base), s, p_) == (mpz(t) * be.powmod(mpz(x), c, p_)) % p_
+
+    return check(g, y, t1) and check(A, D, t2)
+
+
+def check_outputs(pk, blist, dlist, outputs):
+    '''
+    True if every output is b / d, the cipher decrypted with the share
+    '''
+
+    p = int(pk[0])
+    if not len(blist) == len(dlist) == len(outputs):
+        return False
+    return all(int(o) * int(d) % p == int(b) % p for b, d, o in zip(blist, dlist, outputs))
+
+
+def dumps(pk, alist, dlist, proof, blist=None, outputs=None):
+    '''
+    Binary transcript of the decryption shares of an auth, every number
+    is a fixed width big endian integer like in shuffleproof.dumps:
+
+        header       see HEADER
+        p, g, y
+        alist        n numbers
+        dlist        n numbers
+        blist        n numbers, only with MAGIC_CIPHERS
+        outputs      n numbers, only with MAGIC_CIPHERS
+        t1, t2, s
+    '''
+
+    ciphers = list(blist) + list(outputs) if blist is not None else []
+    values = list(pk) + list(alist) + list(dlist) + ciphers + list(proof['t']) + [proof['s']]
+    values = [int(v) for v in values]
+    size = max(1, (max(v.bit_length() for v in values) + 7) // 8)
+
+    magic = MAGIC_CIPHERS if blist is not None else MAGIC
+    header = HEADER.pack(magic, size, len(alist))
+    return header + b''.join(v.to_bytes(size, 'big') for v in values)
+
+
+def loads(data):
+    '''
+    (pk, alist, dlist, proof, blist, outputs) of a transcript written by
+    dumps, blist and outputs are None if it doesn't have them
+    '''
+
+    data = memoryview(data)
+    magic, size, n = HEADER.unpack_from(data)
+    if magic not in (MAGIC, MAGIC_CIPHERS):
+        raise ValueError('Bad decryption transcript')
+    lists = 4 if magic == MAGIC_CIPHERS else 2
+    if len(data) != HEADER.size + size * (6 + lists * n):
+        raise ValueError('Bad decryption transcript length')
+
+    values = [int.from_bytes(data[i:i + size], 'big')
+              for i in range(HEADER.size, len(data), size)]
+    pk = tuple(values[:3])
+    alist, dlist = values[3:3 + n], values[3 + n:3 + 2 * n]
+    blist = outputs = None
+    if magic == MAGIC_CIPHERS:
+        blist, outputs = values[3 + 2 * n:3 + 3 * n], values[3 + 3 * n:3 + 4 * n]
+    return pk, alist, dlist, {'t': values[-3:-1], 's': values[-1]}, blist, outputs
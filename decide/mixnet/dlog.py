@@ -0,0 +1,278 @@
+'''
+Discrete logarithms for exponential ElGamal, with baby-step giant-step.
+
+The decryption of an exponential ElGamal cipher is g^m, and m is found
+with a table of the baby steps g^j, j < M, and at most max / M giant
+steps h * g^-(M * i), looking each one up in the table.
+
+The table is an open addressing hash table of g^j mod a 64 bit prime,
+stored in a file and memory mapped, so it's built once for each (p, g, M)
+and shared by every process and every voting with the same group. M is
+a power of two as big as the max value, bounded by the memory cap, so a
+decode is usually a single lookup.
+
+>>> t = Table(1019, 2, 16)
+>>> [t.log(pow(2, m, 1019), 100) for m in (0, 7, 42, 100)]
+[0, 7, 42, 100]
+>>> t.log(3, 100) is None
+True
+'''
+
+import hashlib
+import mmap
+import os
+import struct
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from Crypto.Util.number import inverse
+
+
+MAGIC = b'DLG1'
+HEADER = struct.Struct('<4sQ')
+SLOT = struct.Struct('<QI')
+# the keys are the values mod this prime. The low bits would be the same
+# for every small power of a small g, like g = 2
+PRIME64 = (1 << 64) - 59
+
+# default cap of the baby steps table, in bytes
+MAX_BYTES = 64 * 1024 * 1024
+
+
+def table_bytes(steps):
+    '''
+    Size of a table with this number of baby steps, two slots per step
+    '''
+
+    return HEADER.size + 2 * steps * SLOT.size
+
+
+def baby_steps(maxm, max_bytes):
+    '''
+    Power of two number of baby steps to decode up to maxm, bounded by
+    max_bytes
+    '''
+
+    steps = 1
+    while steps <= maxm and table_bytes(steps * 2) <= max_bytes:
+        steps *= 2
+    return steps
+
+
+def build(p, g, steps):
+    '''
+    Table contents as a bytearray, each slot is (g^j % PRIME64, j + 1) and
+    an empty slot has j + 1 == 0
+    '''
+
+    slots = 2 * steps
+    mask = slots - 1
+    buf = bytearray(table_bytes(steps))
+    HEADER.pack_into(buf, 0, MAGIC, steps)
+
+    gj = 1
+    for j in range(steps):
+        key = gj % PRIME64
+        i = key & mask
+        while SLOT.unpack_from(buf, HEADER.size + i * SLOT.size)[1]:
+            i = (i + 1) & mask
+        SLOT.pack_into(buf, HEADER.size + i * SLOT.size, key, j + 1)
+        gj = (gj * g) % p
+    return buf
+
+
+class Table:
+    '''
+    Baby steps table for (p, g), in memory, or memory mapped from path if
+    it's given. The file is created if it doesn't exist.
+    '''
+
+    def __init__(self, p, g, steps, path=None):
+        self.p, self.g, self.steps = int(p), int(g), steps
+        self.mask = 2 * steps - 1
+        # g^-steps, one multiplication per giant step
+        self.giant = inverse(pow(self.g, steps, self.p), self.p)
+
+        if path is None:
+            self.buf = build(self.p, self.g, steps)
+            return
+
+        if not os.path.exists(path):
+            # other threads and processes can write the same table
+            tmp = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+            with open(tmp, 'wb') as f:
+                f.write(build(self.p, self.g, steps))
+            os.replace(tmp, path)
+
+        # an empty file can't be mapped, mmap raises ValueError
+        with open(path, 'rb') as f:
+            self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.buf) != table_bytes(steps) or HEADER.unpack_from(self.buf) != (MAGIC, steps):
+            self.buf.close()
+            raise ValueError('Bad dlog table: {}'.format(path))
+
+    def lookup(self, h):
+        '''
+        Baby steps j with the same key as h, g^j == h only if they're equal
+        mod PRIME64
+        '''
+
+        key = h % PRIME64
+        i = key & self.mask
+        buf, size, off = self.buf, SLOT.size, HEADER.size
+        while True:
+            k, j = SLOT.unpack_from(buf, off + i * size)
+            if not j:
+                return
+            if k == key:
+                yield j - 1
+            i = (i + 1) & self.mask
+
+    def log(self, h, maxm):
+        '''
+        m such that g^m = h and 0 <= m <= maxm, None if there's no such m
+        '''
+
+        p = self.p
+        h0 = h = int(h) % p
+        for i in range(maxm // self.steps + 1):
+            for j in self.lookup(h):
+                # m is small, so checking it is cheap
+                m = i * self.steps + j
+                if m <= maxm and pow(self.g, m, p) == h0:
+                    return m
+            h = (h * self.giant) % p
+        return None
+
+    def memory(self):
+        return table_bytes(self.steps)
+
+    def close(self):
+        if isinstance(self.buf, mmap.mmap):
+            self.buf.close()
+
+
+class TableCache:
+    '''
+    Open tables by (p, g, steps). The tables are stored in path, if it's
+    None or it can't be written the tables are only kept in memory. Every
+    table is at most max_bytes, and at most max_tables are kept open.
+
+    The cache is shared by the threads of the process. A table read with
+    use isn't closed while it's in use, if it's evicted it's closed when
+    the last thread releases it.
+    '''
+
+    def __init__(self, path=None, max_bytes=MAX_BYTES, max_tables=8):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_tables = max_tables
+        self.tables = OrderedDict()
+        # threads reading each table, by id
+        self.users = {}
+        self.lock = threading.Lock()
+
+    def filename(self, p, g, steps):
+        key = '{}:{}:{}'.format(p, g, steps).encode('ascii')
+        return os.path.join(self.path, hashlib.sha256(key).hexdigest() + '.dlog')
+
+    def load(self, key):
+        if self.path:
+            path = self.filename(*key)
+            try:
+                os.makedirs(self.path, exist_ok=True)
+                return Table(*key, path=path)
+            except OSError:
+                pass
+            except ValueError:
+                # a truncated table, or of other steps, is built again
+                try:
+                    os.remove(path)
+                    return Table(*key, path=path)
+                except (OSError, ValueError):
+                    pass
+        return Table(*key)
+
+    def get(self, p, g, maxm):
+        '''
+        The table, without keeping it in use, only for a single thread
+        '''
+
+        t = self.acquire(p, g, maxm)
+        self.release(t)
+        return t
+
+    def acquire(self, p, g, maxm):
+        '''
+        The table, in use until it's released
+        '''
+
+        steps = baby_steps(maxm, self.max_bytes)
+        key = (int(p), int(g), steps)
+        with self.lock:
+            t = self.tables.get(key)
+            if t is not None:
+                self.tables.move_to_end(key)
+                self.users[id(t)] += 1
+                return t
+
+        # the table is built out of the lock, another thread could build
+        # the same one, only the first is kept
+        t = self.load(key)
+        with self.lock:
+            first = self.tables.setdefault(key, t)
+            if first is not t:
+                t.close()
+                t = first
+            else:
+                self.users[id(t)] = 0
+            self.tables.move_to_end(key)
+            self.users[id(t)] += 1
+            while len(self.tables) > self.max_tables:
+                self.evict(self.tables.popitem(last=False)[1])
+        return t
+
+    def release(self, t):
+        with self.lock:
+            self.users[id(t)] -= 1
+            if not self.users[id(t)] and t not in self.tables.values():
+                del self.users[id(t)]
+                t.close()
+
+    def evict(self, t):
+        # the tables in use are closed by the last release
+        if not self.users[id(t)]:
+            del self.users[id(t)]
+            t.close()
+
+    @contextmanager
+    def use(self, p, g, maxm):
+        t = self.acquire(p, g, maxm)
+        try:
+            yield t
+        finally:
+            self.release(t)
+
+    def clear(self):
+        with self.lock:
+            tables = list(self.tables.values())
+            self.tables.clear()
+            for t in tables:
+                self.evict(t)
+
+
+cache = TableCache()
+
+
+def dlog(h, g, p, maxm):
+    '''
+    m such that g^m = h mod p, with 0 <= m <= maxm. Raises ValueError if
+    there's no such m.
+    '''
+
+    with cache.use(p, g, maxm) as t:
+        m = t.log(h, maxm)
+    if m is None:
+        raise ValueError('Discrete log out of range')
+    return m
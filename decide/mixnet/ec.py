@@ -0,0 +1,551 @@
+'''
+Elliptic curve ElGamal on the NIST P-256 curve.
+
+Points are encoded as ints from their SEC1 compressed form, 33 bytes, so
+a cipher is still a pair of ints and it's stored and sent between auths
+like the modp ones, with about 66 bytes instead of 512. The curve of a
+key is known from its p, that is the field prime of the curve.
+
+A message m is encrypted as the point m * G, so the decryption is a
+small discrete log, up to MAX_MESSAGE. This is also exponential ElGamal,
+the sum of two ciphers is the cipher of the sum.
+
+The field arithmetic uses the big integer backend, see backends.py, so
+it's faster with gmpy2.
+
+>>> k = ECMixCrypt()
+>>> clears = [2, 3, 4, 5]
+>>> cipher = [k.encrypt(i) for i in clears]
+>>> k.batch_decrypt(cipher) == clears
+True
+>>> shuffled = k.shuffle(cipher)
+>>> sorted(k.decrypt(c) for c in shuffled) == clears
+True
+>>> decode(encode(P256.g)) == P256.g
+True
+'''
+
+from collections import OrderedDict
+
+from Crypto.Random import random
+
+from .backends import get_backend
+from .mixcrypt import PublicKey, get_pool, split
+from . import perm
+
+
+# biggest message decrypted, it's found with baby-step giant-step
+MAX_MESSAGE = 1 << 20
+
+# fixed-base tables kept by process, each one is about 60KB
+MAX_TABLES = 16
+
+WINDOW = 4
+
+
+class Curve:
+    '''
+    Short Weierstrass curve y^2 = x^3 - 3x + b over the prime field p,
+    with a generator g of prime order n
+    '''
+
+    def __init__(self, name, p, b, n, g):
+        self.name, self.p, self.b, self.n, self.g = name, p, b, n, g
+        self.bits = p.bit_length()
+        self.size = (self.bits + 7) // 8
+
+
+P256 = Curve(
+    'P-256',
+    p=0xffffffff00000001000000000000000000000000ffffffffffffffffffffffff,
+    b=0x5ac635d8aa3a93e7b3ebbd55769886bc651d06b0cc53b0f63bce3c3e27d2604b,
+    n=0xffffffff00000000ffffffffffffffffbce6faada7179e84f3b9cac2fc632551,
+    g=(0x6b17d1f2e12c4247f8bce6e563a440f277037d812deb33a0f4a13945d898c296,
+       0x4fe342e2fe1a7f9b8ee7eb4a7c0f9e162bce33576b315ececbb6406837bf51f5),
+)
+
+# the keys store the curve field prime as p
+CURVES = {P256.p: P256}
+CURVE_NAMES = {P256.name: P256}
+
+
+def is_curve(p):
+    return int(p) in CURVES
+
+
+def encode(point, curve=P256):
+    '''
+    SEC1 compressed encoding as an int, 0 is the point at infinity
+    '''
+
+    if point is None:
+        return 0
+    x, y = point
+    return ((2 + (int(y) & 1)) << (8 * curve.size)) | int(x)
+
+
+def decode(n, curve=P256):
+    '''
+    Affine point from its encoding, raises ValueError if it's not in the
+    curve
+    '''
+
+    n = int(n)
+    if n == 0:
+        return None
+    prefix, x = n >> (8 * curve.size), n & ((1 << (8 * curve.size)) - 1)
+    p = curve.p
+    if prefix not in (2, 3) or x >= p:
+        raise ValueError('Bad point encoding')
+    rhs = (x * x * x - 3 * x + curve.b) % p
+    # p = 3 mod 4 in P-256
+    y = pow(rhs, (p + 1) // 4, p)
+    if (y * y) % p != rhs:
+        raise ValueError('Point not in the curve')
+    if (y & 1) != (prefix & 1):
+        y = p - y
+    return (x, y)
+
+
+class Group:
+    '''
+    Point arithmetic in jacobian coordinates (X, Y, Z), with x = X / Z^2
+    and y = Y / Z^3. Z == 0 is the point at infinity.
+    '''
+
+    INF = (1, 1, 0)
+
+    def __init__(self, curve=P256, backend=None):
+        self.curve = curve
+        self.backend = get_backend(backend)
+        self.p = self.backend.mpz(curve.p)
+        self.tables = OrderedDict()
+        self.babies = {}
+
+    def jacobian(self, point):
+        if point is None:
+            return self.INF
+        mpz = self.backend.mpz
+        return (mpz(point[0]), mpz(point[1]), mpz(1))
+
+    def affine(self, P):
+        X, Y, Z = P
+        if not Z:
+            return None
+        p = self.p
+        zinv = self.backend.invert(Z, p)
+        zinv2 = (zinv * zinv) % p
+        return (int((X * zinv2) % p), int((Y * zinv2 * zinv) % p))
+
+    def affine_all(self, points):
+        '''
+        Converts many points with only one inversion
+        '''
+
+        p = self.p
+        finite = [P for P in points if P[2]]
+        invs = iter(self.backend.batch_invert([P[2] for P in finite], p))
+        result = []
+        for X, Y, Z in points:
+            if not Z:
+                result.append(None)
+                continue
+            zinv = next(invs)
+            zinv2 = (zinv * zinv) % p
+            result.append((int((X * zinv2) % p), int((Y * zinv2 * zinv) % p)))
+        return result
+
+    def double(self, P):
+        X1, Y1, Z1 = P
+        if not Z1 or not Y1:
+            return self.INF
+        p = self.p
+        delta = (Z1 * Z1) % p
+        gamma = (Y1 * Y1) % p
+        beta = (X1 * gamma) % p
+        alpha = (3 * (X1 - delta) * (X1 + delta)) % p
+        X3 = (alpha * alpha - 8 * beta) % p
+        Z3 = ((Y1 + Z1) * (Y1 + Z1) - gamma - delta) % p
+        Y3 = (alpha * (4 * beta - X3) - 8 * gamma * gamma) % p
+        return (X3, Y3, Z3)
+
+    def add(self, P, Q):
+        X1, Y1, Z1 = P
+        X2, Y2, Z2 = Q
+        if not Z1:
+            return Q
+        if not Z2:
+            return P
+        p = self.p
+        Z1Z1 = (Z1 * Z1) % p
+        Z2Z2 = (Z2 * Z2) % p
+        U1 = (X1 * Z2Z2) % p
+        U2 = (X2 * Z1Z1) % p
+        S1 = (Y1 * Z2 * Z2Z2) % p
+        S2 = (Y2 * Z1 * Z1Z1) % p
+        H = (U2 - U1) % p
+        r = (2 * (S2 - S1)) % p
+        if not H:
+            return self.double(P) if not r else self.INF
+        I = (4 * H * H) % p
+        J = (H * I) % p
+        V = (U1 * I) % p
+        X3 = (r * r - J - 2 * V) % p
+        Y3 = (r * (V - X3) - 2 * S1 * J) % p
+        Z3 = (((Z1 + Z2) * (Z1 + Z2) - Z1Z1 - Z2Z2) * H) % p
+        return (X3, Y3, Z3)
+
+    def add_affine(self, P, point):
+        '''
+        P + point, with point in affine coordinates, cheaper than add
+        '''
+
+        if point is None:
+            return P
+        X1, Y1, Z1 = P
+        if not Z1:
+            return self.jacobian(point)
+        p = self.p
+        X2, Y2 = point
+        Z1Z1 = (Z1 * Z1) % p
+        U2 = (X2 * Z1Z1) % p
+        S2 = (Y2 * Z1 * Z1Z1) % p
+        H = (U2 - X1) % p
+        r = (2 * (S2 - Y1)) % p
+        if not H:
+            return self.double(P) if not r else self.INF
+        HH = (H * H) % p
+        I = (4 * HH) % p
+        J = (H * I) % p
+        V = (X1 * I) % p
+        X3 = (r * r - J - 2 * V) % p
+        Y3 = (r * (V - X3) - 2 * Y1 * J) % p
+        Z3 = ((Z1 + H) * (Z1 + H) - Z1Z1 - HH) % p
+        return (X3, Y3, Z3)
+
+    def neg(self, point):
+        if point is None:
+            return None
+        return (point[0], self.curve.p - point[1])
+
+    def mul(self, k, point):
+        '''
+        k * point with a window of WINDOW bits, in jacobian coordinates
+        '''
+
+        k = int(k) % self.curve.n
+        if not k or point is None:
+            return self.INF
+        table = [self.INF, self.jacobian(point)]
+        for d in range(2, 1 << WINDOW):
+            table.append(self.add_affine(table[-1], point))
+
+        R = self.INF
+        mask = (1 << WINDOW) - 1
+        for shift in range(k.bit_length() // WINDOW * WINDOW, -1, -WINDOW):
+            for i in range(WINDOW):
+                R = self.double(R)
+            d = (k >> shift) & mask
+            if d:
+                R = self.add(R, table[d])
+        return R
+
+    def fixed_table(self, point):
+        '''
+        d * 2^(WINDOW * i) * point for every window i and digit d, in
+        affine coordinates. Cached by point.
+        '''
+
+        key = encode(point, self.curve)
+        t = self.tables.get(key)
+        if t is not None:
+            self.tables.move_to_end(key)
+            return t
+
+        rows = []
+        base = self.jacobian(point)
+        for i in range(-(-self.curve.n.bit_length() // WINDOW)):
+            row = [base]
+            for d in range(2, 1 << WINDOW):
+                row.append(self.add(row[-1], base))
+            rows.append(row)
+            base = self.add(row[-1], base)
+
+        flat = self.affine_all([P for row in rows for P in row])
+        size = (1 << WINDOW) - 1
+        t = [[None] + flat[i * size:(i + 1) * size] for i in range(len(rows))]
+
+        self.tables[key] = t
+        while len(self.tables) > MAX_TABLES:
+            self.tables.popitem(last=False)
+        return t
+
+    def fixed_mul(self, k, point):
+        '''
+        k * point with the precomputed table of point, only additions
+        '''
+
+        k = int(k) % self.curve.n
+        R = self.INF
+        mask = (1 << WINDOW) - 1
+        for row in self.fixed_table(point):
+            if not k:
+                break
+            d = k & mask
+            if d:
+                R = self.add_affine(R, row[d])
+            k >>= WINDOW
+        return R
+
+
+    def baby_steps(self, point, steps):
+        '''
+        Table of the encodings of j * point, j < steps, and -steps * point
+        for the giant steps. Cached by point and steps.
+        '''
+
+        key = (encode(point, self.curve), steps)
+        if key not in self.babies:
+            P = self.INF
+            points = []
+            for j in range(1, steps):
+                P = self.add_affine(P, point)
+                points.append(P)
+            baby = {0: 0}
+            for j, q in enumerate(self.affine_all(points), 1):
+                baby[encode(q, self.curve)] = j
+            giant = self.neg(self.affine(self.mul(steps, point)))
+            self.babies[key] = (baby, giant)
+        return self.babies[key]
+
+
+_groups = {}
+
+
+def get_group(curve=P256, backend=None):
+    '''
+    Group for the curve, shared in the process to reuse the tables
+    '''
+
+    backend = get_backend(backend)
+    key = (curve.name, backend.name)
+    if key not in _groups:
+        _groups[key] = Group(curve, backend)
+    return _groups[key]
+
+
+def add_points(a, b, curve=P256):
+    '''
+    Sum of two encoded points
+    '''
+
+    group = get_group(curve)
+    P = group.add_affine(group.jacobian(decode(a, curve)), decode(b, curve))
+    return encode(group.affine(P), curve)
+
+
+class ECKey:
+    '''
+    Key with the same attributes as the modp ones. p is the curve field
+    prime, g and y are encoded points and x is the secret scalar.
+    '''
+
+    def __init__(self, p, g, y, x=None):
+        self.p, self.g, self.y = int(p), int(g), int(y)
+        self.x = None if x is None else int(x)
+
+
+def ec_reencrypt_chunk(args):
+    '''
+    Reencrypts a list of ciphertexts, runs in the pool worker processes
+    '''
+
+    msgs, factors, pubkey, backend, fixedbase = args
+    k = ECMixCrypt(k=PublicKey(*pubkey), backend=backend, fixedbase=fixedbase)
+    return [k.reencrypt(m, pubkey, f) for m, f in zip(msgs, factors)]
+
+
+class ECMixCrypt:
+    '''
+    MixCrypt on an elliptic curve, with the same interface
+    '''
+
+    def __init__(self, k=None, bits=None, backend=None, fixedbase=False, curve=None,
+                 x=None):
+        if curve is None:
+            curve = CURVES[int(k.p)] if k else P256
+        self.curve = curve
+        self.bits = curve.bits
+        self.backend = get_backend(backend)
+        self.group = get_group(curve, self.backend)
+        self.fixedbase = fixedbase
+        if k and x is not None:
+            self.k = self.setk(k.p, k.g, k.y, x)
+        elif k:
+            self.k = self.getk(k.p, k.g)
+        else:
+            self.k = self.genk()
+
+    def rand(self):
+        return random.randint(1, self.curve.n - 1)
+
+    def mul(self, k, point):
+        if self.fixedbase:
+            return self.group.fixed_mul(k, point)
+        return self.group.mul(k, point)
+
+    def genk(self):
+        return self.getk(self.curve.p, encode(self.curve.g, self.curve))
+
+    def getk(self, p, g):
+        x = self.rand()
+        y = self.group.affine(self.mul(x, decode(g, self.curve)))
+        self.k = ECKey(p, g, encode(y, self.curve), x)
+        return self.k
+
+    def setk(self, p, g, y, x):
+        self.k = ECKey(p, g, y, x)
+        return self.k
+
+    def encrypt(self, m, k=None, r=None):
+        '''
+        Encrypts m * G, m can be 0 or negative
+        '''
+
+        if not k:
+            k = self.k
+        if r is None:
+            r = self.rand()
+        g, y = decode(k.g, self.curve), decode(k.y, self.curve)
+        group = self.group
+
+        a = self.mul(r, g)
+        b = group.add(self.mul(m, g), self.mul(r, y))
+        a, b = group.affine_all([a, b])
+        return encode(a, self.curve), encode(b, self.curve)
+
+    encrypt_exp = encrypt
+
+    def decrypt_point(self, c):
+        a, b = (decode(i, self.curve) for i in c)
+        s = self.group.affine(self.group.mul(self.k.x, a))
+        m = self.group.add_affine(self.group.jacobian(b), self.group.neg(s))
+        return encode(self.group.affine(m), self.curve)
+
+    def dlog(self, h, maxm=MAX_MESSAGE, g=None):
+        '''
+        m such that m * g = h, with 0 <= m <= maxm. Raises ValueError if
+        there's no such m.
+        '''
+
+        g = decode(g or self.k.g, self.curve)
+        group = self.group
+        steps = 1
+        while steps * steps <= maxm:
+            steps *= 2
+
+        baby, giant = group.baby_steps(g, steps)
+        H = group.jacobian(decode(h, self.curve))
+        for i in range(maxm // steps + 1):
+            j = baby.get(encode(group.affine(H), self.curve))
+            if j is not None and i * steps + j <= maxm:
+                return i * steps + j
+            H = group.add_affine(H, giant)
+        raise ValueError('Discrete log out of range')
+
+    def decrypt(self, c):
+        return self.dlog(self.decrypt_point(c))
+
+    def decrypt_exp(self, c, maxm):
+        return self.dlog(self.decrypt_point(c), maxm)
+
+    def batch_decrypt(self, msgs, decode=True):
+        if not decode:
+            return [self.decrypt_point(c) for c in msgs]
+        return [self.decrypt(c) for c in msgs]
+
+    def multiple_decrypt(self, msgs, last=True, decode=True):
+        if last:
+            return self.batch_decrypt(msgs, decode)
+        return [(a, self.decrypt_point((a, b))) for a, b in msgs]
+
+    def shuffle_decrypt(self, msgs, last=True, decode=True):
+        msgs2 = list(msgs)
+        perm.shuffle(msgs2)
+        return self.multiple_decrypt(msgs2, last, decode)
+
+    def decrypt_shares(self, msgs):
+        '''
+        Decryption share x * A of each cipher with the key of this auth
+        '''
+
+        group, curve = self.group, self.curve
+        points = [group.mul(self.k.x, decode(a, curve)) for a, b in msgs]
+        return [encode(P, curve) for P in group.affine_all(points)]
+
+    def point(self, n):
+        return decode(n, self.curve)
+
+    def combine_shares(self, msgs, shares, decode=True):
+        '''
+        Decrypts the msgs with the decryption shares of every auth, B minus
+        the sum of the shares
+        '''
+
+        group = self.group
+        points = []
+        for (a, b), column in zip(msgs, zip(*shares)):
+            P = group.jacobian(self.point(b))
+            for share in column:
+                P = group.add_affine(P, group.neg(self.point(share)))
+            points.append(P)
+        clears = [encode(P, self.curve) for P in group.affine_all(points)]
+        if decode:
+            clears = [self.dlog(m) for m in clears]
+        return clears
+
+    def reencrypt(self, cipher, pubkey=None, factor=None):
+        '''
+        Adds an encryption of 0 to the cipher
+        '''
+
+        k = ECKey(*pubkey) if pubkey else self.k
+        if factor:
+            a1, b1 = factor
+        else:
+            a1, b1 = self.encrypt(0, k=k)
+
+        group, curve = self.group, self.curve
+        a, b = cipher
+        a = group.add_affine(group.jacobian(decode(a, curve)), decode(a1, curve))
+        b = group.add_affine(group.jacobian(decode(b, curve)), decode(b1, curve))
+        a, b = group.affine_all([a, b])
+        return encode(a, curve), encode(b, curve)
+
+    def gen_perm(self, l):
+        return perm.gen_perm(l)
+
+    def gen_factors(self, n, pubkey=None, workers=1):
+        return self.reencrypt_all([(0, 0)] * n, pubkey, workers)
+
+    def reencrypt_all(self, msgs, pubkey=None, workers=1, factors=None):
+        factors = list(factors or [])[:len(msgs)]
+        factors += [None] * (len(msgs) - len(factors))
+
+        if workers <= 1 or len(msgs) < workers * 2:
+            return [self.reencrypt(m, pubkey, f) for m, f in zip(msgs, factors)]
+
+        if not pubkey:
+            pubkey = (self.k.p, self.k.g, self.k.y)
+        pubkey = tuple(map(int, pubkey))
+        chunks = [(c, f, pubkey, self.backend.name, self.fixedbase)
+                  for c, f in zip(split(msgs, workers), split(factors, workers))]
+
+        msgs2 = []
+        for c in get_pool(workers).map(ec_reencrypt_chunk, chunks):
+            msgs2.extend(c)
+        return msgs2
+
+    def shuffle(self, msgs, pubkey=None, workers=1, factors=None):
+        permuted = [msgs[i] for i in self.gen_perm(len(msgs))]
+        return self.reencrypt_all(permuted, pubkey, workers, factors)
@@ -0,0 +1,153 @@
+'''
+Fixed-base exponentiation with precomputed window tables.
+
+When the same base is raised to many random exponents, like g and the
+public key y in every reencryption of a voting, we can precompute
+base^(d * 2^(w * i)) for every window i and digit d. Then each power is
+only one multiplication per window, without any squaring.
+
+Tables are cached by (p, base) in this process and the whole cache is
+bounded by a memory cap. Older tables are dropped when the cap is
+reached.
+
+>>> t = FixedBase(3, 1019, window=2)
+>>> all(t.pow(e) == pow(3, e, 1019) for e in range(2000))
+True
+>>> t.memory()
+30
+'''
+
+from collections import OrderedDict
+import threading
+
+from .backends import get_backend
+
+
+# default cap for all the tables of this process, in bytes
+MAX_BYTES = 64 * 1024 * 1024
+
+MAX_WINDOW = 8
+
+
+def table_bytes(bits, window):
+    '''
+    Memory needed by a table for a modulus of this size
+    '''
+
+    windows = -(-bits // window)
+    return windows * ((1 << window) - 1) * ((bits + 7) // 8)
+
+
+def best_window(bits, max_bytes):
+    '''
+    Biggest window that fits in max_bytes, 0 if none fits
+    '''
+
+    for window in range(MAX_WINDOW, 0, -1):
+        if table_bytes(bits, window) <= max_bytes:
+            return window
+    return 0
+
+
+class FixedBase:
+    def __init__(self, base, p, window=6, backend=None):
+        self.backend = get_backend(backend)
+        self.p = self.backend.mpz(p)
+        self.bits = int(p).bit_length()
+        self.window = window
+        self.mask = (1 << window) - 1
+        self.table = self.gen_table(self.backend.mpz(base))
+
+    def gen_table(self, base):
+        table = []
+        p = self.p
+        for i in range(-(-self.bits // self.window)):
+            row = [1, base]
+            for d in range(2, self.mask + 1):
+                row.append((row[-1] * base) % p)
+            table.append(row)
+            # base^(2^w) for the next window
+            base = (row[-1] * base) % p
+        return table
+
+    def pow(self, e):
+        e = int(e)
+        if e < 0 or e.bit_length() > self.bits:
+            return self.backend.powmod(self.table[0][1], e, self.p)
+
+        r = 1
+        w, mask, p = self.window, self.mask, self.p
+        for row in self.table:
+            if not e:
+                break
+            d = e & mask
+            if d:
+                r = (r * row[d]) % p
+            e >>= w
+        return r
+
+    def memory(self):
+        return table_bytes(self.bits, self.window)
+
+
+class FixedBaseCache:
+    '''
+    LRU cache of FixedBase tables bounded by max_bytes, shared by the
+    threads of the process
+    '''
+
+    def __init__(self, max_bytes=MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.tables = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, base, p, backend=None):
+        key = (int(p), int(base))
+        with self.lock:
+            t = self.tables.get(key)
+            if t is not None:
+                self.tables.move_to_end(key)
+                return t
+
+        # a single table never takes more than half of the cache, so g and
+        # y of the same voting can live together
+        window = best_window(int(p).bit_length(), self.max_bytes // 2)
+        if not window:
+            return None
+
+        # the table is built out of the lock, another thread could build
+        # the same one, only the first is kept
+        t = FixedBase(base, p, window=window, backend=backend)
+        with self.lock:
+            t = self.tables.setdefault(key, t)
+            self.tables.move_to_end(key)
+            while self.tables and self.used() > self.max_bytes:
+                self.tables.popitem(last=False)
+        return t
+
+    def used(self):
+        return sum(t.memory() for t in self.tables.values())
+
+    def memory(self):
+        with self.lock:
+            return self.used()
+
+    def clear(self):
+        with self.lock:
+            self.tables.clear()
+
+
+cache = FixedBaseCache()
+
+
+def fixed_pow(base, e, p, backend=None):
+    '''
+    base^e mod p using the cached table for (p, base), plain powmod if the
+    table doesn't fit in the cache
+    '''
+
+    t = cache.get(base, p, backend)
+    if t is None:
+        be = get_backend(backend)
+        return be.powmod(be.mpz(base), e, be.mpz(p))
+    return t.pow(e)
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from base import mods
+from mixnet.models import Mixnet
+
+
+class Command(BaseCommand):
+    help = 'Precompute reencryption factors for the shuffle of a voting'
+
+    def add_arguments(self, parser):
+        parser.add_argument('voting_id', type=int)
+        parser.add_argument('--size', type=int, default=1000,
+                            help='number of factors to add to the pool')
+        parser.add_argument('--position', type=int, default=0,
+                            help='position of this auth in the mixnet')
+        parser.add_argument('--batch', type=int, default=1000,
+                            help='factors generated and stored at once')
+        parser.add_argument('--own-key', action='store_true',
+                            help='use the mixnet key instead of the voting pubkey')
+
+    def get_pubkey(self, mn, own_key):
+        if own_key:
+            return (mn.key.p, mn.key.g, mn.key.y)
+
+        # the votes are encrypted with the voting pubkey
+        voting = mods.get('voting', params={'id': mn.voting_id})
+        pk = voting[0]['pub_key']
+        return (int(pk['p']), int(pk['g']), int(pk['y']))
+
+    def handle(self, *args, **options):
+        try:
+            mn = Mixnet.objects.get(voting_id=options['voting_id'],
+                                    auth_position=options['position'])
+        except Mixnet.DoesNotExist:
+            raise CommandError('Mixnet not found')
+
+        pk = self.get_pubkey(mn, options['own_key'])
+
+        print("Filling pool")
+        mn.fill_pool(options['size'], pk, batch=options['batch'])
+        print("Pool size: {}".format(mn.pool_size(pk)))
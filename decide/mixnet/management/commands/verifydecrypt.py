@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mixnet.models import DecryptProof
+
+
+class Command(BaseCommand):
+    help = 'Verify the stored decryption proofs of a voting'
+
+    def add_arguments(self, parser):
+        parser.add_argument('voting_id', type=int)
+        parser.add_argument('--position', type=int, default=None,
+                            help='only the decryptions of the auth in this position')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='processes used to verify each proof')
+
+    def handle(self, *args, **options):
+        proofs = DecryptProof.objects.filter(mixnet__voting_id=options['voting_id'])
+        if options['position'] is not None:
+            proofs = proofs.filter(mixnet__auth_position=options['position'])
+        proofs = proofs.select_related('mixnet').order_by('mixnet__auth_position', 'id')
+
+        if not proofs:
+            raise CommandError('No decryption proofs found')
+
+        kwargs = {}
+        if options['workers']:
+            kwargs['workers'] = options['workers']
+
+        # the ciphers each auth forwarded to the next one in the chain
+        forwarded = {}
+        for proof in DecryptProof.objects.filter(mixnet__voting_id=options['voting_id'])\
+                                         .select_related('mixnet'):
+            outputs = proof.ciphers(outputs=True)
+            if outputs is not None:
+                forwarded.setdefault(proof.mixnet.auth_position, []).append(sorted(outputs))
+
+        failed = 0
+        for proof in proofs:
+            start = time.time()
+            ok = proof.verify(**kwargs)
+            position = proof.mixnet.auth_position
+            inputs = proof.ciphers()
+            if ok and inputs is not None and position > 0:
+                # the auth decrypted what the previous one sent, shuffled
+                ok = sorted(inputs) in forwarded.get(position - 1, [])
+            failed += not ok
+            print("Position {} decryption {}: {} ({:.2f}s)".format(
+                  position, proof.id, 'OK' if ok else 'FAILED', time.time() - start))
+
+        if failed:
+            raise CommandError('{} decryptions failed the verification'.format(failed))
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mixnet.models import Transcript
+
+
+class Command(BaseCommand):
+    help = 'Verify the stored shuffle proofs of a voting'
+
+    def add_arguments(self, parser):
+        parser.add_argument('voting_id', type=int)
+        parser.add_argument('--position', type=int, default=None,
+                            help='only the shuffles of the auth in this position')
+        parser.add_argument('--session', default=None,
+                            help='only the shuffles of this chunked session')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='processes used to verify each proof')
+
+    def handle(self, *args, **options):
+        transcripts = Transcript.objects.filter(mixnet__voting_id=options['voting_id'])
+        if options['position'] is not None:
+            transcripts = transcripts.filter(mixnet__auth_position=options['position'])
+        if options['session'] is not None:
+            transcripts = transcripts.filter(session=options['session'])
+        transcripts = transcripts.select_related('mixnet').order_by('mixnet__auth_position', 'id')
+
+        if not transcripts:
+            raise CommandError('No shuffle transcripts found')
+
+        kwargs = {}
+        if options['workers']:
+            kwargs['workers'] = options['workers']
+
+        failed = 0
+        for t in transcripts:
+            start = time.time()
+            ok = t.verify(**kwargs)
+            failed += not ok
+            print("Position {} shuffle {} {}: {} ({:.2f}s)".format(
+                  t.mixnet.auth_position, t.id, t.session or '-',
+                  'OK' if ok else 'FAILED', time.time() - start))
+
+        if failed:
+            raise CommandError('{} shuffles failed the verification'.format(failed))
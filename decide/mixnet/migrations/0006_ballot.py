@@ -0,0 +1,31 @@
+# Generated by Django 2.0 on 2026-10-18 12:00
+
+import base.models
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mixnet', '0005_reencryptfactor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Ballot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session', models.CharField(max_length=64)),
+                ('stage', models.CharField(choices=[('in', 'input'), ('out', 'output')], max_length=3)),
+                ('index', models.PositiveIntegerField()),
+                ('a', base.models.BigBigField()),
+                ('b', base.models.BigBigField()),
+                ('mixnet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ballots', to='mixnet.Mixnet')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='ballot',
+            unique_together={('mixnet', 'session', 'stage', 'index')},
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 2.0 on 2026-10-18 12:00
+
+import base.models
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mixnet', '0006_ballot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reencryptfactor',
+            name='r',
+            field=base.models.BigBigField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='Transcript',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session', models.CharField(blank=True, max_length=64)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('data', models.BinaryField()),
+                ('mixnet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transcripts', to='mixnet.Mixnet')),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.0 on 2026-10-18 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mixnet', '0007_transcript'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DecryptProof',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('data', models.BinaryField()),
+                ('mixnet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='decrypt_proofs', to='mixnet.Mixnet')),
+            ],
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 2.0 on 2026-10-18 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mixnet', '0008_decryptproof'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Checkpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session', models.CharField(max_length=64)),
+                ('stage', models.CharField(choices=[('in', 'input'), ('out', 'output')], max_length=3)),
+                ('start', models.PositiveIntegerField()),
+                ('size', models.PositiveIntegerField()),
+                ('digest', models.CharField(max_length=64)),
+                ('mixnet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='mixnet.Mixnet')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='checkpoint',
+            unique_together={('mixnet', 'session', 'stage', 'start')},
+        ),
+    ]
@@ -35,12 +35,18 @@ True
 
 
 from pprint import pprint
+from concurrent.futures import ProcessPoolExecutor
 
 from Crypto.PublicKey import ElGamal
 from Crypto.Random import random
 from Crypto import Random
 from Crypto.Util.number import GCD
 
+from .backends import get_backend
+from .fixedbase import fixed_pow
+from . import dlog
+from . import perm
+
 
 def rand(p):
     while True:
@@ -49,6 +55,122 @@ def rand(p):
     return k
 
 
+def rand_exp(p, bits=None):
+    '''
+    Random exponent for g, that has order q = (p - 1) / 2. With bits it's
+    a short exponent of that size, that is secure with a safe prime p if
+    it's at least twice the security level of the group (RFC 7919, 5.2),
+    and makes every exponentiation q.bit_length() / bits times faster.
+
+    >>> rand_exp(2 ** 127 - 1, 64) < 2 ** 64
+    True
+    '''
+
+    q = (int(p) - 1) // 2
+    if bits and bits < q.bit_length():
+        return random.StrongRandom().randint(1, (1 << bits) - 1)
+    return random.StrongRandom().randint(1, q - 1)
+
+
+def to_subgroup(m, p, backend=None):
+    '''
+    Encodes m, 0 < m <= q, in the subgroup of quadratic residues, where g
+    is. A message out of the subgroup would leak its Legendre symbol to
+    anyone with the cipher. p is a safe prime, so p = 3 mod 4 and -1 isn't
+    a residue, then m or p - m is.
+
+    >>> p = 167
+    >>> [to_subgroup(m, p) for m in (1, 2, 5)]
+    [1, 2, 162]
+    >>> [from_subgroup(to_subgroup(m, p), p) for m in (1, 2, 5)]
+    [1, 2, 5]
+    '''
+
+    p = int(p)
+    jacobi = get_backend(backend).jacobi(m, p)
+    if jacobi == 1:
+        return m
+    if jacobi == -1 and m <= (p - 1) // 2:
+        return p - m
+    raise ValueError('Message out of the subgroup range')
+
+
+def from_subgroup(m, p):
+    '''
+    Decodes a message encoded with to_subgroup
+    '''
+
+    p = int(p)
+    return m if m <= (p - 1) // 2 else p - m
+
+
+# process pool shared by all the parallel shuffles of this process
+_pool = None
+_pool_workers = 0
+
+
+def get_pool(workers):
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers != workers:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool = ProcessPoolExecutor(max_workers=workers)
+        _pool_workers = workers
+    return _pool
+
+
+def split(msgs, n):
+    '''
+    Splits msgs in n contiguous chunks of almost the same size
+
+    >>> split(list(range(7)), 3)
+    [[0, 1, 2], [3, 4], [5, 6]]
+    '''
+
+    size, extra = divmod(len(msgs), n)
+    chunks = []
+    start = 0
+    for i in range(n):
+        end = start + size + (1 if i < extra else 0)
+        chunks.append(msgs[start:end])
+        start = end
+    return chunks
+
+
+def reencrypt_chunk(args):
+    '''
+    Reencrypts a list of ciphertexts, runs in the pool worker processes
+    '''
+
+    msgs, factors, pubkey, bits, backend, fixedbase, exp_bits = args
+    k = MixCrypt(k=PublicKey(*pubkey), bits=bits, backend=backend,
+                 fixedbase=fixedbase, exp_bits=exp_bits)
+    return [k.reencrypt(m, pubkey, f) for m, f in zip(msgs, factors)]
+
+
+def factors_chunk(args):
+    '''
+    Encryptions of 1 with the random exponents rs, runs in the pool worker
+    processes
+    '''
+
+    rs, pubkey, bits, backend, fixedbase, exp_bits = args
+    pk = PublicKey(*pubkey)
+    k = MixCrypt(k=pk, bits=bits, backend=backend, fixedbase=fixedbase,
+                 exp_bits=exp_bits)
+    return [k.encrypt(1, k=pk, r=r) for r in rs]
+
+
+class PublicKey:
+    '''
+    Lightweight public key, avoids the ElGamal.construct checks when we
+    only need p, g and y to reencrypt
+    '''
+
+    def __init__(self, p, g, y):
+        self.p, self.g, self.y = int(p), int(g), int(y)
+
+
 def gen_multiple_key(*crypts):
     k1 = crypts[0]
     k = MixCrypt(k=k1.k, bits=k1.bits)
@@ -61,8 +183,8 @@ def gen_multiple_key(*crypts):
 
 def multiple_decrypt(c, *crypts):
     a, b = c
-    for k in crypts:
-        b = k.decrypt((a, b))
+    for i, k in enumerate(crypts):
+        b = k.decrypt((a, b), decode=i == len(crypts) - 1)
     return b
 
 
@@ -104,20 +226,43 @@ def multiple_decrypt_shuffle2(ciphers, *crypts, pubkey=None):
 
 
 class MixCrypt:
-    def __init__(self, k=None, bits=256):
+    '''
+    ElGamal in the subgroup of order q = (p - 1) / 2 of a safe prime p.
+    The messages are encoded in the subgroup, see to_subgroup, and the
+    random exponents can be short, with exp_bits, see rand_exp.
+
+    >>> k = MixCrypt(bits=256, exp_bits=64)
+    >>> k.k.x < 2 ** 64
+    True
+    >>> k.decrypt(k.reencrypt(k.encrypt(5)))
+    5
+    '''
+
+    def __init__(self, k=None, bits=256, backend=None, fixedbase=False, exp_bits=None,
+                 x=None):
         self.bits = bits
-        if k:
+        self.backend = get_backend(backend)
+        # use precomputed tables for g and y, see fixedbase.py
+        self.fixedbase = fixedbase
+        self.exp_bits = exp_bits
+        if k and x is not None:
+            # the key of k with its secret x, no new key is generated
+            self.k = self.setk(k.p, k.g, k.y, x)
+        elif k:
             self.k = self.getk(k.p, k.g)
         else:
             self.k = self.genk()
 
     def genk(self):
-        self.k = ElGamal.generate(self.bits, Random.new().read)
-        return self.k
+        k = ElGamal.generate(self.bits, Random.new().read)
+        return self.getk(int(k.p), int(k.g))
+
+    def rand(self, p):
+        return rand_exp(p, self.exp_bits)
 
     def getk(self, p, g):
-        x = rand(p)
-        y = pow(g, x, p)
+        x = self.rand(p)
+        y = int(self.backend.powmod(self.backend.mpz(g), x, self.backend.mpz(p)))
         self.k = ElGamal.construct((p, g, y, x))
         return self.k
 
@@ -125,45 +270,166 @@ class MixCrypt:
         self.k = ElGamal.construct((p, g, y, x))
         return self.k
 
-    def encrypt(self, m, k=None):
-        r = rand(self.k.p)
+    def encrypt(self, m, k=None, r=None):
         if not k:
             k = self.k
-        a, b = k._encrypt(m, r)
-        return a, b
+        be = self.backend
+        p, g, y = be.mpz(k.p), be.mpz(k.g), be.mpz(k.y)
+        if r is None:
+            r = self.rand(p)
+        m = to_subgroup(m, p, be)
+
+        if self.fixedbase:
+            a = fixed_pow(g, r, p, be)
+            b = (fixed_pow(y, r, p, be) * m) % p
+        else:
+            a = be.powmod(g, r, p)
+            b = (be.powmod(y, r, p) * m) % p
+        return int(a), int(b)
 
-    def decrypt(self, c):
-        m = self.k._decrypt(c)
-        return m
+    def encrypt_exp(self, m, k=None, r=None):
+        '''
+        Exponential ElGamal, encrypts g^m. The product of two ciphers is
+        the encryption of the sum, so the votes can be added without
+        decrypting them, see dlog to get m back.
 
-    def multiple_decrypt(self, msgs, last=True):
-        msgs2 = []
-        for a, b in msgs:
-            clear = self.decrypt((a, b))
-            if last:
-                msg = clear
-            else:
-                msg = (a, clear)
-            msgs2.append(msg)
-        return msgs2
+        >>> B = 256
+        >>> k = MixCrypt(bits=B)
+        >>> c1, c2 = k.encrypt_exp(3), k.encrypt_exp(4)
+        >>> p = int(k.k.p)
+        >>> c = (c1[0] * c2[0] % p, c1[1] * c2[1] % p)
+        >>> k.dlog(k.decrypt(c, decode=False), 10)
+        7
+        '''
+
+        if not k:
+            k = self.k
+        be = self.backend
+        gm = be.powmod(be.mpz(k.g), m, be.mpz(k.p))
+        return self.encrypt(gm, k, r)
 
-    def shuffle_decrypt(self, msgs, last=True):
-        msgs2 = msgs.copy()
-        msgs3 = []
-        while msgs2:
-            n = random.StrongRandom().randint(0, len(msgs2) - 1)
-            a, b = msgs2.pop(n)
-            clear = self.decrypt((a, b))
-            if last:
-                msg = clear
-            else:
-                msg = (a, clear)
-            msgs3.append(msg)
+    def dlog(self, h, maxm, g=None):
+        '''
+        m such that g^m = h, with 0 <= m <= maxm. Raises ValueError if
+        there's no such m. The baby-step giant-step tables are cached by
+        (p, g), see dlog.py.
+        '''
+
+        return dlog.dlog(h, int(g or self.k.g), int(self.k.p), maxm)
+
+    def decrypt_exp(self, c, maxm):
+        '''
+        Decrypts an exponential ElGamal cipher, returning m <= maxm
+
+        >>> B = 256
+        >>> k = MixCrypt(bits=B)
+        >>> k.decrypt_exp(k.encrypt_exp(1000), 5000)
+        1000
+        '''
+
+        return self.dlog(self.decrypt(c, decode=False), maxm)
+
+    def decrypt(self, c, decode=True):
+        '''
+        Decrypts the cipher, with decode=False the result is the element of
+        the subgroup, without decoding it, see to_subgroup
+        '''
+
+        be = self.backend
+        p, x = be.mpz(self.k.p), be.mpz(self.k.x)
+        a, b = map(be.mpz, c)
+
+        ax = be.powmod(a, x, p)
+        m = int((b * be.invert(ax, p)) % p)
+        return from_subgroup(m, p) if decode else m
+
+    def batch_decrypt(self, msgs, decode=True):
+        '''
+        Decrypts a list of ciphers, returning the clear texts in the same
+        order. All the a^x are inverted together with only one modular
+        inversion, see Backend.batch_invert.
+
+        >>> B = 256
+        >>> k = MixCrypt(bits=B)
+        >>> cipher = [k.encrypt(i) for i in range(2, 10)]
+        >>> k.batch_decrypt(cipher) == [k.decrypt(c) for c in cipher]
+        True
+        '''
+
+        be = self.backend
+        p, x = be.mpz(self.k.p), be.mpz(self.k.x)
+
+        axs = [be.powmod(be.mpz(a), x, p) for a, b in msgs]
+        invs = be.batch_invert(axs, p)
+        clears = [int((be.mpz(b) * inv) % p) for (a, b), inv in zip(msgs, invs)]
+        if decode:
+            clears = [from_subgroup(m, p) for m in clears]
+        return clears
+
+    def multiple_decrypt(self, msgs, last=True, decode=True):
+        '''
+        Partial decryption, only the last auth decodes the messages, with
+        decode=False they're returned as elements of the subgroup
+        '''
+
+        clears = self.batch_decrypt(msgs, decode=last and decode)
+        if last:
+            return clears
+        return [(a, clear) for (a, b), clear in zip(msgs, clears)]
+
+    def shuffle_decrypt(self, msgs, last=True, decode=True):
+        msgs2 = list(msgs)
+        perm.shuffle(msgs2)
+        return self.multiple_decrypt(msgs2, last, decode)
+
+    def decrypt_shares(self, msgs):
+        '''
+        Decryption share a^x of each cipher with the key of this auth, the
+        shares of all the auths are joined with combine_shares
+        '''
 
-        return msgs3
+        be = self.backend
+        p, x = be.mpz(self.k.p), be.mpz(self.k.x)
+        return [int(be.powmod(be.mpz(a), x, p)) for a, b in msgs]
 
-    def reencrypt(self, cipher, pubkey=None):
+    def combine_shares(self, msgs, shares, decode=True):
         '''
+        Decrypts the msgs with the decryption shares of every auth, a list
+        of shares for each auth. The pubkey is the product of all the y, so
+        the clear text is b / (a^x1 * a^x2 ...), and all the products are
+        inverted at once.
+
+        >>> B = 256
+        >>> k1 = MixCrypt(bits=B)
+        >>> k2 = MixCrypt(k=k1.k, bits=B)
+        >>> p, g = int(k1.k.p), int(k1.k.g)
+        >>> pk = PublicKey(p, g, int(k1.k.y) * int(k2.k.y) % p)
+        >>> cipher = [k1.encrypt(i, k=pk) for i in (2, 3, 4)]
+        >>> shares = [k1.decrypt_shares(cipher), k2.decrypt_shares(cipher)]
+        >>> k1.combine_shares(cipher, shares)
+        [2, 3, 4]
+        '''
+
+        be = self.backend
+        p = be.mpz(self.k.p)
+        prods = []
+        for column in zip(*shares):
+            acc = be.mpz(1)
+            for share in column:
+                acc = (acc * be.mpz(share)) % p
+            prods.append(acc)
+
+        invs = be.batch_invert(prods, p)
+        clears = [int((be.mpz(b) * inv) % p) for (a, b), inv in zip(msgs, invs)]
+        if decode:
+            clears = [from_subgroup(m, p) for m in clears]
+        return clears
+
+    def reencrypt(self, cipher, pubkey=None, factor=None):
+        '''
+        Multiplies the cipher by an encryption of 1. The factor (g^r, y^r)
+        can be given if it was precomputed, see gen_factors.
+
         >>> B = 256
         >>> k = MixCrypt(bits=B)
         >>> clears = [random.StrongRandom().randint(1, B) for i in range(5)]
@@ -178,40 +444,104 @@ class MixCrypt:
         '''
 
         if pubkey:
-            p, g, y = pubkey
-            k = ElGamal.construct((p, g, y))
+            k = PublicKey(*pubkey)
         else:
             k = self.k
 
         a, b = map(int, cipher)
-        a1, b1 = map(int, self.encrypt(1, k=k))
+        if factor:
+            a1, b1 = map(int, factor)
+        else:
+            a1, b1 = self.encrypt(1, k=k)
         p = int(k.p)
 
         return ((a * a1) % p, (b * b1) % p)
 
     def gen_perm(self, l):
-        x = list(range(l))
-        for i in range(l):
-            d = random.StrongRandom().randint(0, i)
-            if i != d:
-                x[i] = x[d]
-                x[d] = i
-        return x
+        return perm.gen_perm(l)
 
-    def shuffle(self, msgs, pubkey=None):
+    def gen_factors(self, n, pubkey=None, workers=1, exps=False):
         '''
-        Reencrypt and shuffle
+        Generates n reencryption factors, encryptions of 1 (g^r, y^r) that
+        can be used later by shuffle. With exps the random exponents are
+        kept, (g^r, y^r, r), a shuffle proof needs them, see
+        shuffleproof.py
+
+        >>> B = 256
+        >>> k = MixCrypt(bits=B)
+        >>> factors = k.gen_factors(3)
+        >>> [k.decrypt(f) for f in factors]
+        [1, 1, 1]
+        >>> a, b, r = k.gen_factors(1, exps=True)[0]
+        >>> a == pow(k.k.g, r, k.k.p)
+        True
+        '''
+
+        if not exps:
+            return self.reencrypt_all([(1, 1)] * n, pubkey, workers)
+
+        if not pubkey:
+            pubkey = (self.k.p, self.k.g, self.k.y)
+        pubkey = tuple(map(int, pubkey))
+        rs = [self.rand(pubkey[0]) for i in range(n)]
+
+        if workers <= 1 or n < workers * 2:
+            factors = factors_chunk((rs, pubkey, self.bits, self.backend,
+                                     self.fixedbase, self.exp_bits))
+        else:
+            chunks = [(c, pubkey, self.bits, self.backend.name, self.fixedbase,
+                       self.exp_bits) for c in split(rs, workers)]
+            factors = []
+            for c in get_pool(workers).map(factors_chunk, chunks):
+                factors.extend(c)
+        return [(a, b, r) for (a, b), r in zip(factors, rs)]
+
+    def reencrypt_all(self, msgs, pubkey=None, workers=1, factors=None):
+        '''
+        Reencrypts the msgs keeping the order. The first len(factors) msgs
+        are reencrypted with the precomputed factors, the rest are
+        computed here. With workers > 1 the list is split in chunks that
+        are reencrypted in a process pool and joined back in the same
+        order.
         '''
 
-        msgs2 = msgs.copy()
-        perm = self.gen_perm(len(msgs))
-        for i, p in enumerate(perm):
-            m = msgs[p]
-            nm = self.reencrypt(m, pubkey)
-            msgs2[i] = nm
+        factors = list(factors or [])[:len(msgs)]
+        factors += [None] * (len(msgs) - len(factors))
+
+        if workers <= 1 or len(msgs) < workers * 2:
+            return [self.reencrypt(m, pubkey, f) for m, f in zip(msgs, factors)]
+
+        if not pubkey:
+            pubkey = (self.k.p, self.k.g, self.k.y)
+        pubkey = tuple(map(int, pubkey))
+        backend = self.backend.name
+        chunks = [(c, f, pubkey, self.bits, backend, self.fixedbase, self.exp_bits)
+                  for c, f in zip(split(msgs, workers), split(factors, workers))]
 
+        msgs2 = []
+        for c in get_pool(workers).map(reencrypt_chunk, chunks):
+            msgs2.extend(c)
         return msgs2
 
+    def shuffle(self, msgs, pubkey=None, workers=1, factors=None):
+        '''
+        Reencrypt and shuffle
+
+        The permutation is always generated here, the reencryption is done
+        by reencrypt_all, using the precomputed factors if any.
+
+        >>> B = 256
+        >>> k = MixCrypt(bits=B)
+        >>> clears = list(range(2, 12))
+        >>> cipher = [k.encrypt(i) for i in clears]
+        >>> shuffled = k.shuffle(cipher, workers=2)
+        >>> sorted(k.decrypt(i) for i in shuffled) == clears
+        True
+        '''
+
+        permuted = [msgs[i] for i in self.gen_perm(len(msgs))]
+        return self.reencrypt_all(permuted, pubkey, workers, factors)
+
 
 if __name__ == "__main__":
     import doctest
@@ -1,9 +1,23 @@
-from django.db import models
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
 
-from .mixcrypt import MixCrypt
+from django.db import models, transaction
+from django.db.models import Sum
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .mixcrypt import MixCrypt, from_subgroup
+from .ec import ECMixCrypt, CURVES, add_points, is_curve
+from . import contexts
+from . import decryptproof
+from . import dlog
+from . import fixedbase
+from . import groups
+from . import shuffleproof
 
 from base import mods
-from base.models import Auth, Key
+from base.models import Auth, Key, BigBigField
 from base.serializers import AuthSerializer
 from django.conf import settings
 
@@ -11,6 +25,96 @@ from django.conf import settings
 # number of bits for the key, all auths should use the same number of bits
 B = settings.KEYBITS
 
+# use the standard group of B bits, if there's one, instead of generating
+# a new safe prime for each voting, see groups.py
+STANDARD_GROUPS = settings.MIXNET_STANDARD_GROUPS
+
+# size of the random exponents, None uses exponents of the size of q
+EXP_BITS = settings.MIXNET_EXPONENT_BITS
+
+# big integer backend used by MixCrypt, 'auto' picks the fastest installed
+BACKEND = settings.MIXNET_BACKEND
+
+# store a proof of each shuffle, see shuffleproof.py
+SHUFFLE_PROOFS = settings.MIXNET_SHUFFLE_PROOFS
+# and of the chunked ones, that keep all the session in memory to prove it
+CHUNK_PROOFS = settings.MIXNET_CHUNK_PROOFS
+
+# store a proof of the decryption shares of this auth, see decryptproof.py
+DECRYPT_PROOFS = settings.MIXNET_DECRYPT_PROOFS
+
+# number of processes used to reencrypt in the shuffle, 0 uses all the cores
+WORKERS = settings.MIXNET_SHUFFLE_WORKERS or os.cpu_count()
+
+# precomputed tables for g and the public key to speed up reencryption
+FIXEDBASE = settings.MIXNET_FIXEDBASE
+fixedbase.cache.max_bytes = settings.MIXNET_FIXEDBASE_MAX_BYTES
+
+# baby-step giant-step tables to decode exponential ElGamal, stored in
+# MIXNET_DLOG_DIR and shared by the votings with the same group
+dlog.cache.path = settings.MIXNET_DLOG_DIR
+dlog.cache.max_bytes = settings.MIXNET_DLOG_MAX_BYTES
+
+# mixnets of the last votings with their keys ready, see contexts.py
+contexts.cache.max_size = settings.MIXNET_CACHE_SIZE
+
+
+def get_crypt(p=None, k=None, x=None):
+    '''
+    MixCrypt for the group of p, the elliptic curve one if p is the field
+    prime of a curve, see ec.py. With x it has the key k, instead of a new
+    one in its group.
+    '''
+
+    if p and is_curve(p):
+        return ECMixCrypt(k=k, curve=CURVES[int(p)], backend=BACKEND,
+                          fixedbase=FIXEDBASE, x=x)
+    return MixCrypt(k=k, bits=B, backend=BACKEND, fixedbase=FIXEDBASE,
+                    exp_bits=EXP_BITS, x=x)
+
+
+def get_mixnet(voting_id, position=0):
+    '''
+    Mixnet of the voting in position, from the cache of this process, see
+    contexts.py. Raises Mixnet.DoesNotExist if there isn't one.
+    '''
+
+    def load():
+        return (Mixnet.objects.select_related('key', 'pubkey')
+                              .get(voting_id=voting_id, auth_position=position))
+
+    return contexts.cache.get(voting_id, position, load)
+
+
+def combine_keys(p, y1, y2):
+    '''
+    Public key of two auths, the product of both keys, or the sum of the
+    points in a curve
+    '''
+
+    if is_curve(p):
+        return add_points(y1, y2, CURVES[int(p)])
+    return (int(y1) * int(y2)) % int(p)
+
+
+def digest(msgs):
+    '''
+    sha256 of a batch of ballots, to know if it's already stored
+    '''
+
+    h = hashlib.sha256()
+    for a, b in msgs:
+        h.update('{},{};'.format(int(a), int(b)).encode())
+    return h.hexdigest()
+
+
+class ChainError(Exception):
+    '''
+    The next auth of the chain didn't answer 200
+    '''
+
+    pass
+
 
 class Mixnet(models.Model):
     voting_id = models.PositiveIntegerField()
@@ -29,37 +133,418 @@ class Mixnet(models.Model):
                                                           auths, self.pubkey)
 
     def shuffle(self, msgs, pk):
-        crypt = MixCrypt(bits=B)
-        k = crypt.setk(self.key.p, self.key.g, self.key.y, self.key.x)
+        crypt = self.crypt()
+
+        if not self.proves(pk):
+            factors = self.take_factors(pk, len(msgs))
+            return crypt.shuffle(msgs, pk, workers=WORKERS, factors=factors)
+
+        perm = crypt.gen_perm(len(msgs))
+        factors = self.proof_factors(crypt, pk, len(msgs))
+        outputs = crypt.reencrypt_all([msgs[i] for i in perm], pk, workers=WORKERS,
+                                      factors=[(a, b) for a, b, _ in factors])
+        self.prove_shuffle(pk, msgs, outputs, perm, [r for _, _, r in factors])
+        return outputs
+
+    def crypt(self):
+        '''
+        MixCrypt with the key of this auth. It's built once, and the
+        mixnets of the views are cached, see get_mixnet.
+        '''
+
+        crypt = getattr(self, '_crypt', None)
+        if crypt is None:
+            crypt = get_crypt(self.key.p, k=self.key, x=self.key.x)
+            self._crypt = crypt
+        return crypt
+
+    def chain(self):
+        '''
+        List of the next auths, built once like crypt
+        '''
 
-        return crypt.shuffle(msgs, pk)
+        chain = getattr(self, '_chain', None)
+        if chain is None:
+            chain = list(self.next_auths())
+            self._chain = chain
+        return chain
 
-    def decrypt(self, msgs, pk, last=False):
-        crypt = MixCrypt(bits=B)
-        k = crypt.setk(self.key.p, self.key.g, self.key.y, self.key.x)
-        return crypt.shuffle_decrypt(msgs, last)
+    def proves(self, pk):
+        return SHUFFLE_PROOFS and not is_curve(pk[0])
+
+    def proof_factors(self, crypt, pk, n):
+        '''
+        n reencryption factors with their exponents, (g^r, y^r, r), taken
+        from the pool if there are any
+        '''
+
+        factors = self.take_factors(pk, n, exps=True)
+        return factors + crypt.gen_factors(n - len(factors), pk, workers=WORKERS,
+                                           exps=True)
+
+    def prove_shuffle(self, pk, inputs, outputs, perm, rs, session=''):
+        '''
+        Stores the transcript of a shuffle with its proof, outputs[i] is
+        inputs[perm[i]] reencrypted with rs[i]
+        '''
+
+        pk = tuple(map(int, pk))
+        proof = shuffleproof.prove(pk, inputs, outputs, perm, rs, exp_bits=EXP_BITS,
+                                   backend=BACKEND, workers=WORKERS)
+        data = shuffleproof.dumps(pk, inputs, outputs, proof)
+        return Transcript.objects.create(mixnet=self, session=session, data=data)
+
+    def decrypt(self, msgs, pk, last=False, shuffle=True, dlog=None):
+        '''
+        Decrypts the msgs, shuffling them if shuffle. With dlog, the msgs
+        are exponential ElGamal ciphers and the last auth returns the
+        exponents, up to dlog.
+        '''
+
+        crypt = self.crypt()
+        # the exponential ElGamal totals are g^m, they aren't decoded but
+        # found with dlog. The curve decryption is already the exponent
+        exp = dlog is not None and not is_curve(pk[0])
+        if self.proves_decrypt():
+            msgs = [tuple(map(int, m)) for m in msgs]
+            if shuffle:
+                msgs = [msgs[i] for i in crypt.gen_perm(len(msgs))]
+            # the same as multiple_decrypt, with the shares for the proof
+            shares = crypt.decrypt_shares(msgs)
+            clears = crypt.combine_shares(msgs, [shares], decode=False)
+            self.prove_decrypt([a for a, b in msgs], shares,
+                               [b for a, b in msgs], clears)
+            if last and not exp:
+                clears = [from_subgroup(m, crypt.k.p) for m in clears]
+            msgs = clears if last else [(a, m) for (a, b), m in zip(msgs, clears)]
+        elif not shuffle:
+            msgs = crypt.multiple_decrypt(msgs, last, decode=not exp)
+        else:
+            msgs = crypt.shuffle_decrypt(msgs, last, decode=not exp)
+
+        if last and exp:
+            msgs = [crypt.dlog(m, dlog, g=pk[1]) for m in msgs]
+        return msgs
+
+    def decrypt_shares(self, msgs):
+        '''
+        Decryption shares of this auth for the a of each msg, see
+        decrypt_fanout
+        '''
+
+        crypt = self.crypt()
+        return crypt.decrypt_shares([(a, 1) for a in msgs])
+
+    def decrypt_fanout(self, msgs, pk, shuffle=True, dlog=None, workers=1):
+        '''
+        Decrypts the msgs with every auth at the same time. Each auth only
+        computes its decryption shares and this one combines them, instead
+        of each one removing its layer and calling the next. The msgs are
+        shuffled here once, if shuffle.
+        '''
+
+        crypt = self.crypt()
+        msgs = [tuple(map(int, m)) for m in msgs]
+        if shuffle:
+            msgs = [msgs[i] for i in crypt.gen_perm(len(msgs))]
+
+        alist = [a for a, b in msgs]
+        data = { "msgs": alist, "shares": True }
+        shares = [crypt.decrypt_shares(msgs)]
+        responses = self.fanout_call("/decrypt/{}/".format(self.voting_id), data, workers)
+        if self.proves_decrypt():
+            self.prove_decrypt(alist, shares[0])
+            self.check_shares(alist, responses, pk)
+            responses = [r["msgs"] for r in responses]
+        shares.extend(responses)
+
+        exp = dlog is not None and not is_curve(pk[0])
+        clears = crypt.combine_shares(msgs, shares, decode=not exp)
+        if exp:
+            clears = [crypt.dlog(m, dlog, g=pk[1]) for m in clears]
+        return clears
+
+    def proves_decrypt(self):
+        return DECRYPT_PROOFS and not is_curve(self.key.p)
+
+    def prove_decrypt(self, alist, shares, blist=None, outputs=None):
+        '''
+        Stores the decryption shares of this auth with their proof, and
+        returns the proof. With blist, the b of each cipher, the outputs
+        b / d are stored too, see decryptproof.check_outputs
+        '''
+
+        pk = (int(self.key.p), int(self.key.g), int(self.key.y))
+        proof = decryptproof.prove(pk, self.key.x, alist, shares, backend=BACKEND,
+                                   workers=WORKERS)
+        data = decryptproof.dumps(pk, alist, shares, proof, blist, outputs)
+        DecryptProof.objects.create(mixnet=self, data=data)
+        return proof
+
+    def check_shares(self, alist, responses, pk):
+        '''
+        Checks the decryption shares of the other auths, each response is
+        { "msgs": shares, "y": key of the auth, "proof": proof }. The keys
+        of all the auths must be the shares of the voting key pk. Raises
+        ProofError if anything is wrong.
+        '''
+
+        p, g, y = map(int, pk)
+        keys = int(self.key.y)
+        for i, r in enumerate(responses):
+            position = self.auth_position + 1 + i
+            if not isinstance(r, dict) or "proof" not in r:
+                raise decryptproof.ProofError(
+                    'Decryption shares without proof from the auth in position {}'
+                    .format(position))
+            if not decryptproof.verify((p, g, int(r["y"])), alist, r["msgs"], r["proof"],
+                                       backend=BACKEND, workers=WORKERS):
+                raise decryptproof.ProofError(
+                    'Wrong decryption shares from the auth in position {}'.format(position))
+            keys = combine_keys(p, keys, r["y"])
+        if keys != y:
+            raise decryptproof.ProofError('The keys of the auths are not the voting key')
 
     def gen_key(self, p=0, g=0):
-        crypt = MixCrypt(bits=B)
         if self.key:
-            k = crypt.setk(self.key.p, self.key.g, self.key.y, self.key.x)
-        elif (not g or not p):
-            k = crypt.genk()
-            key = Key(p=int(k.p), g=int(k.g), y=int(k.y), x=int(k.x))
-            key.save()
-
-            self.key = key
-            self.save()
+            return
+
+        group = groups.for_bits(B) if STANDARD_GROUPS else None
+        if (not g or not p) and group:
+            p, g = group.p, group.g
+
+        if not g or not p:
+            # a new group, the slow path
+            k = get_crypt().k
         else:
-            k = crypt.getk(p, g)
-            key = Key(p=int(k.p), g=int(k.g), y=int(k.y), x=int(k.x))
-            key.save()
+            # only a random exponent in the group
+            k = get_crypt(p, k=Key(p=p, g=g)).k
+        key = Key(p=int(k.p), g=int(k.g), y=int(k.y), x=int(k.x))
+        key.save()
+
+        self.key = key
+        self._crypt = None
+        self.save()
+
+    def pool(self, pk):
+        p, g, y = pk
+        return self.factors.filter(pubkey__p=p, pubkey__g=g, pubkey__y=y)
+
+    def pool_size(self, pk):
+        return self.pool(pk).count()
+
+    def fill_pool(self, n, pk, batch=1000):
+        '''
+        Precomputes n reencryption factors for the pubkey pk and stores
+        them in the pool, in batches of batch factors
+        '''
+
+        p, g, y = pk
+        pubkey = Key.objects.filter(p=p, g=g, y=y).first()
+        if not pubkey:
+            pubkey = Key(p=p, g=g, y=y)
+            pubkey.save()
+
+        crypt = get_crypt(pubkey.p, k=pubkey)
+        while n > 0:
+            size = min(n, batch)
+            # the exponents are kept for the shuffle proofs
+            if is_curve(p):
+                factors = [(a, b, None) for a, b in
+                           crypt.gen_factors(size, pk, workers=WORKERS)]
+            else:
+                factors = crypt.gen_factors(size, pk, workers=WORKERS, exps=True)
+            ReencryptFactor.objects.bulk_create(
+                ReencryptFactor(mixnet=self, pubkey=pubkey, a=a, b=b, r=r)
+                for a, b, r in factors)
+            n -= size
+
+    def take_factors(self, pk, n, exps=False):
+        '''
+        Takes up to n factors for the pubkey pk from the pool. Each
+        factor is removed when it's taken so it's never used twice. With
+        exps only the factors with their exponent are taken, as
+        (g^r, y^r, r).
+        '''
+
+        qs = self.pool(pk)
+        if exps:
+            qs = qs.filter(r__isnull=False)
+
+        with transaction.atomic():
+            qs = qs.select_for_update(skip_locked=True).order_by('id')[:n]
+            factors = list(qs.values_list('id', 'a', 'b', 'r'))
+            ReencryptFactor.objects.filter(id__in=[f[0] for f in factors]).delete()
+
+        if exps:
+            return [(int(a), int(b), int(r)) for _, a, b, r in factors]
+        return [(a, b) for _, a, b, _ in factors]
 
-            self.key = key
-            self.save()
+    def chunk(self, session, stage, indexes):
+        '''
+        Ballots of a chunked session in the order of indexes
+        '''
 
-    def chain_call(self, path, data):
-        next_auths=self.next_auths()
+        rows = (self.ballots.filter(session=session, stage=stage, index__in=indexes)
+                            .values_list('index', 'a', 'b'))
+        msgs = {i: (int(a), int(b)) for i, a, b in rows}
+        return [msgs[i] for i in indexes]
+
+    def store_chunk(self, session, stage, start, msgs):
+        Ballot.objects.bulk_create(
+            Ballot(mixnet=self, session=session, stage=stage, index=start + i,
+                   a=a, b=b)
+            for i, (a, b) in enumerate(msgs))
+
+    def stored(self, session, stage):
+        '''
+        Number of ballots of the session with a checkpoint in the stage
+        '''
+
+        n = (self.checkpoints.filter(session=session, stage=stage)
+                             .aggregate(n=Sum('size'))['n'])
+        return n or 0
+
+    def clear_session(self, session):
+        '''
+        Removes the ballots and checkpoints of a chunked session, the
+        transcripts are kept
+        '''
+
+        self.ballots.filter(session=session).delete()
+        self.checkpoints.filter(session=session).delete()
+
+    def receive_chunk(self, session, start, msgs, total):
+        '''
+        Stores a chunk of ballots to shuffle. Returns True when all the
+        ballots of the session are stored and this is the last chunk, the
+        chunks are sent in order.
+
+        A chunk that's already stored with the same digest isn't stored
+        again, so a retried tally only resends it. A different one means
+        that the previous auth shuffled again, and this one starts over.
+        '''
+
+        d = digest(msgs)
+        with transaction.atomic():
+            # the chunks of a mixnet are stored one after another, so only
+            # one request finds the session complete
+            Mixnet.objects.select_for_update().get(pk=self.pk)
+            checkpoint = self.checkpoints.filter(session=session, stage=Ballot.INPUT,
+                                                 start=start).first()
+            if checkpoint and checkpoint.digest != d:
+                self.clear_session(session)
+                self.transcripts.filter(session=session).delete()
+                checkpoint = None
+            if not checkpoint:
+                self.store_chunk(session, Ballot.INPUT, start, msgs)
+                Checkpoint.objects.create(mixnet=self, session=session, stage=Ballot.INPUT,
+                                          start=start, size=len(msgs), digest=d)
+            received = self.stored(session, Ballot.INPUT)
+        return received == total and start + len(msgs) == total
+
+    def shuffle_chunks(self, session, pk, total, size):
+        '''
+        Shuffles all the ballots of the session, if this auth didn't
+        finish it before, and sends them to the next auth, see
+        shuffle_session and send_chunks
+        '''
+
+        if self.stored(session, Ballot.OUTPUT) != total:
+            self.shuffle_session(session, pk, total, size)
+        return self.send_chunks(session, pk, total, size)
+
+    def shuffle_session(self, session, pk, total, size):
+        '''
+        The permutation is over all the ballots, like in shuffle, but only
+        one chunk of size ballots is read and reencrypted at a time. The
+        shuffled chunks are stored, and their checkpoints are written when
+        all of them are, so a retry doesn't shuffle again an auth that
+        finished. An unfinished shuffle starts over, its permutation and
+        proof are over all the ballots.
+
+        The proof needs all the inputs and outputs, so with CHUNK_PROOFS
+        they're kept in memory until the end, and the memory isn't bounded
+        by the chunks. Without it the chunked shuffles aren't proved.
+        '''
+
+        crypt = self.crypt()
+        perm = crypt.gen_perm(total)
+
+        # the ballots and the proof of a shuffle that didn't finish
+        self.ballots.filter(session=session, stage=Ballot.OUTPUT).delete()
+        self.transcripts.filter(session=session).delete()
+
+        # the proof is over all the ballots, so they're kept until the end
+        proves = CHUNK_PROOFS and self.proves(pk)
+        inputs, outputs, rs = [None] * total, [], []
+
+        checkpoints = []
+        for start in range(0, total, size):
+            indexes = perm[start:start + size]
+            msgs = self.chunk(session, Ballot.INPUT, indexes)
+            if proves:
+                factors = self.proof_factors(crypt, pk, len(msgs))
+                for i, m in zip(indexes, msgs):
+                    inputs[i] = m
+                rs.extend(r for _, _, r in factors)
+                factors = [(a, b) for a, b, _ in factors]
+            else:
+                factors = self.take_factors(pk, len(msgs))
+            msgs = crypt.reencrypt_all(msgs, pk, workers=WORKERS, factors=factors)
+            if proves:
+                outputs.extend(msgs)
+
+            self.store_chunk(session, Ballot.OUTPUT, start, msgs)
+            checkpoints.append(Checkpoint(mixnet=self, session=session, stage=Ballot.OUTPUT,
+                                          start=start, size=len(msgs), digest=digest(msgs)))
+
+        if proves:
+            self.prove_shuffle(pk, inputs, outputs, perm, rs, session=session)
+        Checkpoint.objects.bulk_create(checkpoints)
+        # the input checkpoints are kept to know the chunks of a retry
+        self.ballots.filter(session=session, stage=Ballot.INPUT).delete()
+
+    def send_chunks(self, session, pk, total, size):
+        '''
+        Sends the shuffled chunks to the next auth. When it answers, the
+        rest of the auths are done, and this one removes the session. The
+        last auth keeps the shuffled ballots to be read in chunks.
+
+        Raises ChainError if the next auth fails, and the session is kept
+        to send it again.
+        '''
+
+        if not self.chain():
+            return {
+                "session": session,
+                "total": total,
+                "url": settings.BASEURL,
+                "position": self.auth_position,
+            }
+
+        for start in range(0, total, size):
+            indexes = list(range(start, min(start + size, total)))
+            data = {
+                "msgs": self.chunk(session, Ballot.OUTPUT, indexes),
+                "pk": { "p": pk[0], "g": pk[1], "y": pk[2] },
+                "session": session,
+                "start": start,
+                "size": size,
+                "total": total,
+            }
+            resp = self.chain_call("/shuffle/{}/".format(self.voting_id), data,
+                                   response=True)
+            if resp.status_code != 200:
+                raise ChainError('The auth in position {} answered {}'.format(
+                                 self.auth_position + 1, resp.status_code))
+
+        self.clear_session(session)
+        # the answer of the auth that has the shuffled ballots
+        return resp.json()
+
+    def chain_call(self, path, data, **kwargs):
+        next_auths = self.chain()
 
         data.update({
             "auths": AuthSerializer(next_auths, many=True).data,
@@ -68,13 +553,45 @@ class Mixnet(models.Model):
         })
 
         if next_auths:
-            auth = next_auths.first().url
-            r = mods.post('mixnet', entry_point=path,
-                           baseurl=auth, json=data)
+            auth = next_auths[0].url
+            r = mods.post('mixnet', entry_point=path, baseurl=auth, json=data,
+                          timeout=settings.MODS_CHAIN_TIMEOUT, **kwargs)
             return r
 
         return None
 
+    def fanout_call(self, path, data, workers):
+        '''
+        Calls all the next auths at the same time, with up to workers
+        requests in flight, instead of each one calling the next. Every
+        auth gets the same auths and position that the chain would give
+        it, and "chain": False so it doesn't call the rest. Returns the
+        responses in the order of the auths.
+        '''
+
+        next_auths = self.chain()
+        calls = []
+        for i, auth in enumerate(next_auths):
+            d = dict(data)
+            d.update({
+                "auths": AuthSerializer(next_auths[i:], many=True).data,
+                "voting": self.voting_id,
+                "position": self.auth_position + 1 + i,
+                "chain": False,
+            })
+            calls.append((auth.url, d))
+
+        def call(args):
+            url, d = args
+            return mods.post('mixnet', entry_point=path, baseurl=url, json=d,
+                             timeout=settings.MODS_CHAIN_TIMEOUT)
+
+        workers = min(len(calls), workers)
+        if workers <= 1:
+            return [call(c) for c in calls]
+        with ThreadPoolExecutor(workers) as pool:
+            return list(pool.map(call, calls))
+
     def next_auths(self):
         next_auths = self.auths.filter(me=False)
 
@@ -82,3 +599,155 @@ class Mixnet(models.Model):
             next_auths = next_auths[1:]
 
         return next_auths
+
+
+@receiver(post_save, sender=Mixnet)
+@receiver(post_delete, sender=Mixnet)
+def invalidate_mixnet(sender, instance, **kwargs):
+    # a new one also replaces any other of its voting and position
+    place = (instance.voting_id, instance.auth_position)
+    contexts.cache.invalidate(lambda mn: mn.pk == instance.pk or
+                              (mn.voting_id, mn.auth_position) == place)
+
+
+@receiver(m2m_changed, sender=Mixnet.auths.through)
+def invalidate_auths(sender, instance, **kwargs):
+    if isinstance(instance, Mixnet):
+        contexts.cache.invalidate(lambda mn: mn.pk == instance.pk)
+    else:
+        contexts.cache.clear()
+
+
+@receiver(post_save, sender=Key)
+@receiver(post_delete, sender=Key)
+def invalidate_key(sender, instance, **kwargs):
+    contexts.cache.invalidate(lambda mn: instance.pk in (mn.key_id, mn.pubkey_id))
+
+
+@receiver(post_save, sender=Auth)
+@receiver(post_delete, sender=Auth)
+def invalidate_auth(sender, instance, **kwargs):
+    # the chains of the mixnets have the auths
+    contexts.cache.clear()
+
+
+class ReencryptFactor(models.Model):
+    '''
+    Precomputed encryption of 1, (g^r, y^r), for the pubkey. The shuffle
+    uses it instead of computing the reencryption at tally time.
+    '''
+
+    mixnet = models.ForeignKey(Mixnet, related_name="factors",
+                               on_delete=models.CASCADE)
+    pubkey = models.ForeignKey(Key, related_name="factors",
+                               on_delete=models.CASCADE)
+    a = BigBigField()
+    b = BigBigField()
+    # the random exponent, for the shuffle proofs
+    r = BigBigField(blank=True, null=True)
+
+
+class Ballot(models.Model):
+    '''
+    Ciphertext of a chunked shuffle. The ballots received are stored until
+    the last chunk arrives, and each auth keeps the shuffled ones until
+    the next auths finish, the last one until they are decrypted, so no
+    auth has all of them in memory.
+    '''
+
+    INPUT = 'in'
+    OUTPUT = 'out'
+    STAGES = ((INPUT, 'input'), (OUTPUT, 'output'))
+
+    mixnet = models.ForeignKey(Mixnet, related_name="ballots",
+                               on_delete=models.CASCADE)
+    session = models.CharField(max_length=64)
+    stage = models.CharField(max_length=3, choices=STAGES)
+    index = models.PositiveIntegerField()
+    a = BigBigField()
+    b = BigBigField()
+
+    class Meta:
+        unique_together = (('mixnet', 'session', 'stage', 'index'),)
+
+
+class Checkpoint(models.Model):
+    '''
+    A chunk of ballots of a session stored in a stage, with its digest.
+    The input chunks are the ones received, and the output ones are the
+    shuffle of this auth, written when all of them are stored. A retried
+    tally resumes from them, see Mixnet.receive_chunk.
+    '''
+
+    mixnet = models.ForeignKey(Mixnet, related_name="checkpoints",
+                               on_delete=models.CASCADE)
+    session = models.CharField(max_length=64)
+    stage = models.CharField(max_length=3, choices=Ballot.STAGES)
+    start = models.PositiveIntegerField()
+    size = models.PositiveIntegerField()
+    digest = models.CharField(max_length=64)
+
+    class Meta:
+        unique_together = (('mixnet', 'session', 'stage', 'start'),)
+
+
+class Transcript(models.Model):
+    '''
+    Shuffle of this auth with its proof, see shuffleproof.py. The verifier
+    only needs the transcript to check that the shuffle is right.
+    '''
+
+    mixnet = models.ForeignKey(Mixnet, related_name="transcripts",
+                               on_delete=models.CASCADE)
+    session = models.CharField(max_length=64, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    data = models.BinaryField()
+
+    def load(self):
+        '''
+        (pk, inputs, outputs, proof)
+        '''
+
+        return shuffleproof.loads(bytes(self.data))
+
+    def verify(self, workers=WORKERS):
+        pk, inputs, outputs, proof = self.load()
+        return shuffleproof.verify(pk, inputs, outputs, proof, backend=BACKEND,
+                                   workers=workers)
+
+
+class DecryptProof(models.Model):
+    '''
+    Decryption shares of this auth with their proof, see decryptproof.py
+    '''
+
+    mixnet = models.ForeignKey(Mixnet, related_name="decrypt_proofs",
+                               on_delete=models.CASCADE)
+    created = models.DateTimeField(auto_now_add=True)
+    data = models.BinaryField()
+
+    def load(self):
+        '''
+        (pk, alist, shares, proof, blist, outputs), blist and outputs are
+        None if only the shares were stored
+        '''
+
+        return decryptproof.loads(bytes(self.data))
+
+    def ciphers(self, outputs=False):
+        '''
+        The (a, b) decrypted, or the (a, b / d) forwarded if outputs, None
+        if only the shares were stored
+        '''
+
+        pk, alist, shares, proof, blist, out = self.load()
+        if blist is None:
+            return None
+        return list(zip(alist, out if outputs else blist))
+
+    def verify(self, workers=WORKERS):
+        pk, alist, shares, proof, blist, outputs = self.load()
+        if blist is not None and not decryptproof.check_outputs(pk, blist, shares, outputs):
+            return False
+        return decryptproof.verify(pk, alist, shares, proof, backend=BACKEND,
+                                   workers=workers)
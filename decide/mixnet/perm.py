@@ -0,0 +1,70 @@
+'''
+Cryptographically secure random permutations.
+
+The random bytes are read from the OS CSPRNG in big blocks and used as
+64 bit words, and the permutation is a Fisher-Yates shuffle, O(n) swaps
+in place. Indexes are drawn with rejection sampling, so every
+permutation has exactly the same probability.
+
+>>> sorted(gen_perm(10)) == list(range(10))
+True
+>>> l = list('abcdef')
+>>> shuffle(l)
+>>> sorted(l)
+['a', 'b', 'c', 'd', 'e', 'f']
+>>> all(0 <= randbelow(7) < 7 for i in range(100))
+True
+'''
+
+from Crypto.Random import get_random_bytes
+
+
+# 64 bit words read from the CSPRNG at once
+BLOCK = 4096
+
+
+def random_words(block=BLOCK):
+    '''
+    Endless stream of random 64 bit words
+    '''
+
+    while True:
+        yield from memoryview(get_random_bytes(8 * block)).cast('Q')
+
+
+def randbelow(n, words=None):
+    '''
+    Random integer in [0, n), n must be lower than 2^64
+    '''
+
+    words = words or random_words(1)
+    shift = 64 - (n - 1).bit_length()
+    while True:
+        r = next(words) >> shift
+        if r < n:
+            return r
+
+
+def shuffle(x):
+    '''
+    Fisher-Yates shuffle of the list x, in place
+    '''
+
+    words = random_words()
+    for i in range(len(x) - 1, 0, -1):
+        shift = 64 - i.bit_length()
+        while True:
+            j = next(words) >> shift
+            if j <= i:
+                break
+        x[i], x[j] = x[j], x[i]
+
+
+def gen_perm(n):
+    '''
+    Random permutation of range(n)
+    '''
+
+    x = list(range(n))
+    shuffle(x)
+    return x
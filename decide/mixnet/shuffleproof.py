@@ -0,0 +1,509 @@
+'''
+Verifiable shuffle, a proof that the outputs of a shuffle are the inputs
+permuted and reencrypted, that doesn't reveal the permutation.
+
+It's the proof of Terelius and Wikström, as written in "Pseudo-Code
+Algorithms for Verifiable Re-Encryption Mix-Nets" (Haenni et al. 2017),
+made non interactive with Fiat-Shamir. The prover commits to the
+permutation, c_j = g^r_j h_i when the output i is the input j, and proves
+with a chain of commitments that the outputs raised to the challenges u_j
+of their inputs are the inputs raised to u_j, reencrypted.
+
+Two changes make it cheaper than the paper:
+
+* The responses are computed in the integers, not mod q, so every random
+  value only needs CHALLENGE_BITS + STAT_BITS bits more than the secret
+  it hides, and the per ballot exponents are short, like the short
+  random exponents of the reencryption.
+* The verifier checks the N per ballot equations at once, raising each
+  one to a random exponent of BATCH_BITS bits (the small exponents test
+  of Bellare, Garay and Rabin), so the powers of the same base are
+  joined, and every product of many powers is computed at once, see
+  multi_pow.
+
+The work of the prover and the verifier is split in chunks that run in
+the process pool of the shuffle.
+
+>>> from mixnet.groups import GROUP_NAMES
+>>> p, g = GROUP_NAMES['ffdhe2048'].p, 2
+>>> y = pow(g, 1234, p)
+>>> inputs = [(pow(g, r, p), pow(y, r, p) * m % p) for r, m in ((3, 4), (5, 9), (7, 16))]
+>>> perm, rs = [2, 0, 1], [11, 12, 13]
+>>> outputs = [(inputs[j][0] * pow(g, r, p) % p, inputs[j][1] * pow(y, r, p) % p)
+...            for j, r in zip(perm, rs)]
+>>> proof = prove((p, g, y), inputs, outputs, perm, rs)
+>>> verify((p, g, y), inputs, outputs, proof)
+True
+>>> verify((p, g, y), inputs, outputs[::-1], proof)
+False
+>>> loads(dumps((p, g, y), inputs, outputs, proof)) == ((p, g, y), inputs, outputs, proof)
+True
+'''
+
+import hashlib
+import struct
+
+from Crypto.Random import random
+
+from .backends import get_backend
+from .fixedbase import fixed_pow
+from .mixcrypt import get_pool, rand_exp, split
+
+
+# size of the Fiat-Shamir challenges, the soundness error is 2^-CHALLENGE_BITS
+CHALLENGE_BITS = 128
+# extra bits of the random values, the statistical distance of the
+# responses to uniform values is 2^-STAT_BITS
+STAT_BITS = 80
+# size of the random exponents of the batched verification
+BATCH_BITS = 64
+
+# lists of a proof, in the order they're stored
+FIELDS = ('cs', 'chat', 't', 'that', 's', 'shat', 'sprime')
+
+MAGIC = b'DSP1'
+# magic, bytes of each number, number of ballots and size of each field
+HEADER = struct.Struct('>4sIQ' + 'Q' * len(FIELDS))
+
+
+def pmap(func, args, workers=1):
+    '''
+    Maps func over args, in the process pool if there are workers
+    '''
+
+    if workers <= 1 or len(args) < 2:
+        return [func(a) for a in args]
+    return list(get_pool(workers).map(func, args))
+
+
+def join(chunks):
+    return [v for c in chunks for v in c]
+
+
+def width(p):
+    return (int(p).bit_length() + 7) // 8
+
+
+def hash_ints(h, values, size):
+    for v in values:
+        h.update(int(v).to_bytes(size, 'big'))
+
+
+def window_size(n, bits):
+    '''
+    Window of multi_pow for n exponents of this size, the one with the
+    fewest multiplications, bits / w * (n + 2^(w + 1))
+    '''
+
+    return min(range(1, 17), key=lambda w: -(-bits // w) * (n + (2 << w)))
+
+
+def multi_pow(bases, exps, p, backend=None):
+    '''
+    Product of b^e mod p for every base b and exponent e >= 0, with the
+    bucket method (Pippenger). For every window of w bits of the exponents,
+    each base is multiplied into the bucket of its digit, and the buckets
+    are joined with two running products. A product of n powers costs
+    about bits / w * (n + 2^(w + 1)) multiplications, many times less than
+    the n powers one by one.
+
+    >>> multi_pow([2, 3, 5], [10, 0, 7], 1019) == 2 ** 10 * 5 ** 7 % 1019
+    True
+    '''
+
+    be = get_backend(backend)
+    p = be.mpz(p)
+    pairs = [(be.mpz(b), int(e)) for b, e in zip(bases, exps) if e]
+    if not pairs:
+        return be.mpz(1)
+
+    bits = max(e.bit_length() for _, e in pairs)
+    w = window_size(len(pairs), bits)
+    mask = (1 << w) - 1
+
+    result = be.mpz(1)
+    for shift in range((bits - 1) // w * w, -1, -w):
+        if result != 1:
+            for i in range(w):
+                result = (result * result) % p
+
+        buckets = [None] * (mask + 1)
+        for b, e in pairs:
+            d = (e >> shift) & mask
+            if d:
+                v = buckets[d]
+                buckets[d] = b if v is None else (v * b) % p
+
+        # prod(bucket_d^d) = prod over d of (prod of the buckets >= d)
+        running = acc = None
+        for d in range(mask, 0, -1):
+            v = buckets[d]
+            if v is not None:
+                running = v if running is None else (running * v) % p
+            if running is not None:
+                acc = running if acc is None else (acc * running) % p
+        if acc is not None:
+            result = (result * acc) % p
+    return result
+
+
+def multi_pow_chunk(args):
+    bases, exps, p, backend = args
+    return multi_pow(bases, exps, p, backend)
+
+
+def power_product(bases, exps, p, backend=None, workers=1):
+    '''
+    Product of b^e mod p, the exponents can be negative. The bases are
+    split in chunks for the process pool.
+    '''
+
+    be = get_backend(backend)
+    p = int(p)
+    parts = max(1, workers)
+    result = 1
+    for sign in (1, -1):
+        pairs = [(b, e * sign) for b, e in zip(bases, exps) if e * sign > 0]
+        if not pairs:
+            continue
+        args = [([b for b, _ in c], [e for _, e in c], p, be.name)
+                for c in split(pairs, parts) if c]
+        r = be.mpz(1)
+        for v in pmap(multi_pow_chunk, args, workers):
+            r = (r * v) % p
+        if sign < 0:
+            r = be.invert(r, p)
+        result = (result * r) % p
+    return result
+
+
+def product(values, p):
+    r = 1
+    for v in values:
+        r = (r * v) % p
+    return r
+
+
+def generators_chunk(args):
+    '''
+    Independent generators of the subgroup, h_i for i in [start, end).
+    Each one is a hash of p and i squared, so nobody knows a relation
+    between them or with g.
+    '''
+
+    p, start, end = args
+    size = width(p) + 16
+    prefix = b'decide-generator' + int(p).to_bytes(width(p), 'big')
+    hs = []
+    for i in range(start, end):
+        counter = 0
+        while True:
+            data = prefix + i.to_bytes(8, 'big') + counter.to_bytes(4, 'big')
+            x = int.from_bytes(hashlib.shake_256(data).digest(size), 'big') % p
+            h = (x * x) % p
+            if h > 1:
+                break
+            counter += 1
+        hs.append(h)
+    return hs
+
+
+def generators(p, n, workers=1):
+    '''
+    h_0 .. h_(n-1)
+    '''
+
+    args = [(int(p), c[0], c[-1] + 1)
+            for c in split(list(range(n)), max(1, workers)) if c]
+    return join(pmap(generators_chunk, args, workers))
+
+
+def seed(pk, inputs, outputs, cs):
+    h = hashlib.sha256(b'decide-shuffle')
+    size = width(pk[0])
+    hash_ints(h, pk, size)
+    h.update(len(inputs).to_bytes(8, 'big'))
+    hash_ints(h, (v for m in inputs for v in m), size)
+    hash_ints(h, (v for m in outputs for v in m), size)
+    hash_ints(h, cs, size)
+    return h.digest()
+
+
+def challenges(seed, n):
+    '''
+    u_j, the challenge of each input
+    '''
+
+    size = CHALLENGE_BITS // 8
+    return [int.from_bytes(hashlib.sha256(seed + j.to_bytes(8, 'big')).digest()[:size], 'big')
+            for j in range(n)]
+
+
+def challenge(seed, p, chat, t, that):
+    h = hashlib.sha256(seed)
+    size = width(p)
+    for values in (chat, t, that):
+        hash_ints(h, values, size)
+    return int.from_bytes(h.digest()[:CHALLENGE_BITS // 8], 'big')
+
+
+def randbits(bits):
+    return random.getrandbits(bits)
+
+
+def commit_chunk(args):
+    '''
+    Commitments to the permutation, g^r h
+    '''
+
+    p, g, rs, hs, backend = args
+    be = get_backend(backend)
+    p, g = be.mpz(p), be.mpz(g)
+    return [(fixed_pow(g, r, p, be) * h) % p for r, h in zip(rs, hs)]
+
+
+def chain_chunk(args):
+    '''
+    A part of the commitment chain, chat_i = g^rhat_i chat_(i-1)^u'_i. The
+    first chat_(i-1) is g^R h^U, so every part starts without the others.
+    '''
+
+    p, g, h, R, U, rhats, ups, backend = args
+    be = get_backend(backend)
+    p, g = be.mpz(p), be.mpz(g)
+    prev = (fixed_pow(g, R, p, be) * be.powmod(be.mpz(h), U, p)) % p
+    chat = []
+    for rhat, up in zip(rhats, ups):
+        prev = (fixed_pow(g, rhat, p, be) * be.powmod(prev, up, p)) % p
+        chat.append(prev)
+    return chat
+
+
+def that_chunk(args):
+    p, g, prevs, whats, wprimes, backend = args
+    be = get_backend(backend)
+    p, g = be.mpz(p), be.mpz(g)
+    return [(fixed_pow(g, wh, p, be) * be.powmod(be.mpz(c), wp, p)) % p
+            for c, wh, wp in zip(prevs, whats, wprimes)]
+
+
+def member_chunk(args):
+    '''
+    True if all the values are in the subgroup of order q
+    '''
+
+    p, values, backend = args
+    be = get_backend(backend)
+    return all(0 < v < p and be.jacobi(v, p) == 1 for v in values)
+
+
+def prove(pk, inputs, outputs, perm, rs, exp_bits=None, backend=None, workers=1):
+    '''
+    Proof that outputs[i] is inputs[perm[i]] reencrypted with the random
+    exponent rs[i] for the public key pk = (p, g, y). exp_bits is the size
+    of the random exponents of the commitments, see rand_exp.
+    '''
+
+    be = get_backend(backend)
+    p, g, y = (int(v) for v in pk)
+    q = (p - 1) // 2
+    n = len(inputs)
+    parts = max(1, workers)
+    chunks = [c for c in split(list(range(n)), parts) if c]
+    rbits = exp_bits if exp_bits and exp_bits < q.bit_length() else q.bit_length()
+    nbits = n.bit_length()
+
+    gens = generators(p, n + 1, workers)
+    h, hs = gens[0], gens[1:]
+
+    # commitment to the permutation, c_j = g^r_j h_i for the output i
+    r = [rand_exp(p, exp_bits) for j in range(n)]
+    args = [(p, g, [r[perm[i]] for i in c], hs[c[0]:c[-1] + 1], be.name) for c in chunks]
+    cs = [0] * n
+    for i, c in enumerate(join(pmap(commit_chunk, args, workers))):
+        cs[perm[i]] = int(c)
+
+    s = seed(pk, inputs, outputs, cs)
+    u = challenges(s, n)
+    up = [u[j] for j in perm]
+
+    # commitment chain, chat_i = g^rhat_i chat_(i-1)^u'_i and chat_-1 = h.
+    # R and U are the exponents of chat_(i-1) = g^R h^U where each chunk
+    # starts
+    rhat = [rand_exp(p, exp_bits) for i in range(n)]
+    starts = {}
+    R, U = 0, 1
+    for i in range(n):
+        starts[i] = (R, U)
+        R = (R * up[i] + rhat[i]) % q
+        U = (U * up[i]) % q
+    args = [(p, g, h) + starts[c[0]] + (rhat[c[0]:c[-1] + 1], up[c[0]:c[-1] + 1], be.name)
+            for c in chunks]
+    chat = [int(c) for c in join(pmap(chain_chunk, args, workers))]
+
+    # secrets of the proof
+    rbar = sum(r)
+    rtilde = sum(rj * uj for rj, uj in zip(r, u))
+    rprime = sum(ri * upi for ri, upi in zip(rs, up))
+    extra = CHALLENGE_BITS + STAT_BITS
+
+    w1 = randbits(rbits + nbits + extra)
+    w2 = randbits(q.bit_length() + extra)
+    w3 = randbits(rbits + CHALLENGE_BITS + nbits + extra)
+    w4 = randbits(q.bit_length() + CHALLENGE_BITS + nbits + extra)
+    whats = [randbits(rbits + extra) for i in range(n)]
+    wprimes = [randbits(CHALLENGE_BITS + extra) for i in range(n)]
+
+    def gpow(e):
+        return be.powmod(be.mpz(g), e, be.mpz(p))
+
+    outa = [a for a, b in outputs]
+    outb = [b for a, b in outputs]
+    t1 = gpow(w1)
+    t2 = gpow(w2)
+    t3 = (gpow(w3) * power_product(hs, wprimes, p, be, workers)) % p
+    t4a = (be.invert(gpow(w4), p) * power_product(outa, wprimes, p, be, workers)) % p
+    t4b = (be.invert(be.powmod(be.mpz(y), w4, be.mpz(p)), p) *
+           power_product(outb, wprimes, p, be, workers)) % p
+    t = [int(v) for v in (t1, t2, t3, t4a, t4b)]
+
+    prevs = [h] + chat[:-1]
+    args = [(p, g, prevs[c[0]:c[-1] + 1], whats[c[0]:c[-1] + 1],
+             wprimes[c[0]:c[-1] + 1], be.name) for c in chunks]
+    that = [int(v) for v in join(pmap(that_chunk, args, workers))]
+
+    c = challenge(s, p, chat, t, that)
+
+    return {
+        'cs': cs,
+        'chat': chat,
+        't': t,
+        'that': that,
+        's': [w1 + c * rbar, w2 + c * R, w3 + c * rtilde, w4 + c * rprime],
+        'shat': [w + c * v for w, v in zip(whats, rhat)],
+        'sprime': [w + c * v for w, v in zip(wprimes, up)],
+    }
+
+
+def verify(pk, inputs, outputs, proof, backend=None, workers=1):
+    '''
+    True if the proof shows that the outputs are a shuffle of the inputs
+    '''
+
+    be = get_backend(backend)
+    p, g, y = (int(v) for v in pk)
+    q = (p - 1) // 2
+    n = len(inputs)
+
+    try:
+        cs, chat, t, that = (proof[k] for k in ('cs', 'chat', 't', 'that'))
+        (s1, s2, s3, s4), shat, sprime = proof['s'], proof['shat'], proof['sprime']
+    except (KeyError, TypeError, ValueError):
+        return False
+
+    if not n or len(t) != 5 or any(len(l) != n for l in (outputs, cs, chat, that, shat, sprime)):
+        return False
+    if any(not 0 < v < p for m in inputs + outputs for v in m):
+        return False
+    if any(v < 0 for v in [s1, s2, s3, s4] + shat + sprime):
+        return False
+
+    # every element of the proof must be in the subgroup, where the
+    # exponents only matter mod q
+    values = cs + chat + t + that
+    args = [(p, c, be.name) for c in split(values, max(1, workers)) if c]
+    if not all(pmap(member_chunk, args, workers)):
+        return False
+
+    gens = generators(p, n + 1, workers)
+    h, hs = gens[0], gens[1:]
+    s = seed(pk, inputs, outputs, cs)
+    u = challenges(s, n)
+    c = challenge(s, p, chat, t, that)
+
+    mpz = be.mpz
+    p_, g_, y_ = mpz(p), mpz(g), mpz(y)
+
+    def pp(bases, exps):
+        return power_product(bases, exps, p, be, workers)
+
+    cbar = (product(map(mpz, cs), p_) * be.invert(product(map(mpz, hs), p_), p_)) % p_
+    U = product(u, q)
+    chat_n = (mpz(chat[-1]) * be.invert(be.powmod(mpz(h), U, p_), p_)) % p_
+    ctilde = pp(cs, u)
+    ina = pp([a for a, b in inputs], u)
+    inb = pp([b for a, b in inputs], u)
+
+    def check(x, e, ts):
+        # x^-c e == ts
+        return (be.invert(be.powmod(x, c, p_), p_) * e) % p_ == ts
+
+    if not (check(cbar, be.powmod(g_, s1, p_), t[0]) and
+            check(chat_n, be.powmod(g_, s2, p_), t[1]) and
+            check(ctilde, be.powmod(g_, s3, p_) * pp(hs, sprime), t[2]) and
+            check(ina, be.invert(be.powmod(g_, s4, p_), p_) *
+                  pp([a for a, b in outputs], sprime), t[3]) and
+            check(inb, be.invert(be.powmod(y_, s4, p_), p_) *
+                  pp([b for a, b in outputs], sprime), t[4])):
+        return False
+
+    # that_i = chat_i^-c g^shat_i chat_(i-1)^sprime_i, all at once with the
+    # random exponents alpha_i. chat_i is in the equations i and i + 1
+    alpha = [randbits(BATCH_BITS) for i in range(n)]
+    exps = [alpha[0] * sprime[0]]
+    exps += [alpha[i + 1] * sprime[i + 1] - c * alpha[i] for i in range(n - 1)]
+    exps.append(-c * alpha[-1])
+    right = (be.powmod(g_, sum(a * v for a, v in zip(alpha, shat)), p_) *
+             pp([h] + chat, exps)) % p_
+    return pp(that, alpha) == right
+
+
+def dumps(pk, inputs, outputs, proof):
+    '''
+    Binary transcript of a shuffle, every number is a fixed width big
+    endian integer like in base/wire.py:
+
+        header       see HEADER
+        p, g, y
+        inputs       n pairs
+        outputs      n pairs
+        proof        the lists of FIELDS
+    '''
+
+    values = list(pk) + [v for m in list(inputs) + list(outputs) for v in m]
+    for k in FIELDS:
+        values.extend(proof[k])
+    values = [int(v) for v in values]
+    size = max(1, (max(v.bit_length() for v in values) + 7) // 8)
+
+    header = HEADER.pack(MAGIC, size, len(inputs), *(len(proof[k]) for k in FIELDS))
+    return header + b''.join(v.to_bytes(size, 'big') for v in values)
+
+
+def loads(data):
+    '''
+    (pk, inputs, outputs, proof) of a transcript written by dumps
+    '''
+
+    data = memoryview(data)
+    magic, size, n, *sizes = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError('Bad shuffle transcript')
+    if len(data) != HEADER.size + size * (3 + 4 * n + sum(sizes)):
+        raise ValueError('Bad shuffle transcript length')
+
+    values = [int.from_bytes(data[i:i + size], 'big')
+              for i in range(HEADER.size, len(data), size)]
+
+    def pairs(start):
+        it = iter(values[start:start + 2 * n])
+        return list(zip(it, it))
+
+    pk = tuple(values[:3])
+    inputs, outputs = pairs(3), pairs(3 + 2 * n)
+    proof = {}
+    off = 3 + 4 * n
+    for k, size in zip(FIELDS, sizes):
+        proof[k] = values[off:off + size]
+        off += size
+    return pk, inputs, outputs, proof
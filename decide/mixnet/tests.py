@@ -1,12 +1,36 @@
-from django.test import TestCase
+import os
+import tempfile
+import threading
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
 from django.conf import settings
+from django.db import connection
+from Crypto.Util.number import isPrime
 from rest_framework.test import APIClient
 from rest_framework.test import APITestCase
 
 from mixnet.mixcrypt import MixCrypt
 from mixnet.mixcrypt import ElGamal
+from mixnet.mixcrypt import rand
+from mixnet.mixcrypt import from_subgroup, to_subgroup
+from mixnet.backends import available_backends
+from mixnet.dlog import TableCache, table_bytes
+from mixnet.ec import ECMixCrypt, ECKey, P256, decode, encode
+from mixnet.fixedbase import FixedBaseCache
+from mixnet.groups import GROUPS, GROUP_NAMES, for_bits
+from mixnet.models import (Auth, Ballot, Checkpoint, DecryptProof, Key, Mixnet, Transcript,
+                           get_mixnet)
+from mixnet.perm import gen_perm, randbelow
+from mixnet import ballotproof
+from mixnet import contexts
+from mixnet import decryptproof
+from mixnet import shuffleproof
 
 from base import mods
+from base import wire
 
 
 class MixnetCase(APITestCase):
@@ -14,6 +38,8 @@ class MixnetCase(APITestCase):
     def setUp(self):
         self.client = APIClient()
         mods.mock_query(self.client)
+        # the rollback of each test doesn't invalidate the mixnets
+        contexts.cache.clear()
 
     def tearDown(self):
         self.client = None
@@ -102,6 +128,26 @@ class MixnetCase(APITestCase):
 
         self.assertEqual(sorted(clear), sorted(clear2))
 
+    def test_decrypt_dlog(self):
+        self.test_create()
+
+        pk = self.key["p"], self.key["g"], self.key["y"]
+        k = MixCrypt(bits=settings.KEYBITS)
+        k.k = ElGamal.construct(pk)
+
+        # three votes for option 0, one for option 1, none for option 2
+        votes = [[1, 0, 0], [1, 0, 0], [0, 1, 0], [1, 0, 0]]
+        totals = [(1, 1)] * 3
+        for vote in votes:
+            ciphers = [k.encrypt_exp(m) for m in vote]
+            totals = [(a * c[0] % pk[0], b * c[1] % pk[0])
+                      for (a, b), c in zip(totals, ciphers)]
+
+        data = { "msgs": totals, "shuffle": False, "dlog": len(votes) }
+        response = self.client.post('/mixnet/decrypt/1/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [3, 1, 0])
+
     def test_multiple_auths(self):
         '''
         This test emulates a two authorities shuffle and decryption.
@@ -188,3 +234,915 @@ class MixnetCase(APITestCase):
 
         self.assertNotEqual(clear, clear1)
         self.assertEqual(sorted(clear), sorted(clear1))
+
+    def test_chunks(self):
+        data = {
+            "voting": 1,
+            "auths": [
+                { "name": "auth1", "url": "http://localhost:8000" },
+                { "name": "auth2", "url": "http://127.0.0.1:8000" },
+            ]
+        }
+        response = self.client.post('/mixnet/', data, format='json')
+        key = response.json()
+        pk = key["p"], key["g"], key["y"]
+
+        clear = list(range(2, 12))
+        encrypt = self.encrypt_msgs(clear, pk)
+
+        for start in range(0, 10, 4):
+            data = { "msgs": encrypt[start:start + 4], "pk": key,
+                     "session": "s1", "start": start, "size": 4, "total": 10 }
+            response = self.client.post('/mixnet/shuffle/1/', data, format='json')
+            self.assertEqual(response.status_code, 200)
+
+        # the last auth has the shuffled votes
+        last = response.json()
+        self.assertEqual(last["position"], 1)
+        self.assertEqual(Mixnet.objects.get(voting_id=1, auth_position=0).ballots.count(), 0)
+
+        shuffled = []
+        for start in range(0, 10, 4):
+            params = "session=s1&position=1&start={}&size={}".format(start, min(4, 10 - start))
+            response = self.client.get('/mixnet/shuffle/1/?' + params)
+            self.assertEqual(response.status_code, 200)
+            shuffled.extend(response.json())
+        self.assertEqual(len(shuffled), 10)
+        self.assertNotEqual(shuffled, encrypt)
+
+        response = self.client.get('/mixnet/shuffle/1/?session=s1&position=1&start=8&size=4')
+        self.assertEqual(response.status_code, 404)
+
+        clear2 = []
+        for start in range(0, 10, 4):
+            data = { "msgs": shuffled[start:start + 4], "pk": key }
+            response = self.client.post('/mixnet/decrypt/1/', data, format='json')
+            clear2.extend(response.json())
+        self.assertEqual(sorted(clear), sorted(clear2))
+
+        response = self.client.delete('/mixnet/shuffle/1/?session=s1&position=1')
+        self.assertEqual(Mixnet.objects.get(voting_id=1, auth_position=1).ballots.count(), 0)
+        self.assertEqual(Mixnet.objects.get(voting_id=1, auth_position=1).checkpoints.count(), 0)
+
+    def test_chunks_resume(self):
+        data = {
+            "voting": 1,
+            "auths": [
+                { "name": "auth1", "url": "http://localhost:8000" },
+                { "name": "auth2", "url": "http://127.0.0.1:8000" },
+            ]
+        }
+        response = self.client.post('/mixnet/', data, format='json')
+        key = response.json()
+        pk = key["p"], key["g"], key["y"]
+
+        clear = list(range(2, 12))
+        encrypt = self.encrypt_msgs(clear, pk)
+
+        def send(msgs):
+            for start in range(0, 10, 4):
+                data = { "msgs": msgs[start:start + 4], "pk": key,
+                         "session": "s1", "start": start, "size": 4, "total": 10 }
+                response = self.client.post('/mixnet/shuffle/1/', data, format='json')
+            return response
+
+        shuffle_session = Mixnet.shuffle_session
+
+        def fail(mn, *args):
+            if mn.auth_position == 1:
+                raise RuntimeError('auth down')
+            return shuffle_session(mn, *args)
+
+        # the second auth dies in the middle of its shuffle
+        with mock.patch.object(Mixnet, 'shuffle_session', autospec=True, side_effect=fail):
+            with self.assertRaises(RuntimeError):
+                send(encrypt)
+
+        mn0 = Mixnet.objects.get(voting_id=1, auth_position=0)
+        mn1 = Mixnet.objects.get(voting_id=1, auth_position=1)
+        self.assertEqual(mn0.stored("s1", Ballot.OUTPUT), 10)
+        self.assertEqual(mn1.stored("s1", Ballot.INPUT), 10)
+        self.assertEqual(mn1.stored("s1", Ballot.OUTPUT), 0)
+
+        # the retry only shuffles in the second auth
+        with mock.patch.object(Mixnet, 'shuffle_session', autospec=True,
+                               side_effect=shuffle_session) as m:
+            response = send(encrypt)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([c[0][0].auth_position for c in m.call_args_list], [1])
+        self.assertEqual(response.json()["position"], 1)
+        self.assertEqual(mn0.ballots.count(), 0)
+        self.assertEqual(mn0.checkpoints.count(), 0)
+
+        shuffled = mn1.chunk("s1", Ballot.OUTPUT, list(range(10)))
+        data = { "msgs": shuffled, "pk": key }
+        response = self.client.post('/mixnet/decrypt/1/', data, format='json')
+        self.assertEqual(sorted(clear), sorted(response.json()))
+
+        # other ballots in a chunk start the session over
+        data = { "msgs": encrypt[4:8], "pk": key, "position": 1,
+                 "session": "s1", "start": 0, "size": 4, "total": 10 }
+        response = self.client.post('/mixnet/shuffle/1/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mn1.stored("s1", Ballot.INPUT), 4)
+        self.assertEqual(mn1.stored("s1", Ballot.OUTPUT), 0)
+        self.assertEqual(mn1.ballots.count(), 4)
+
+    def test_chunks_next_auth_error(self):
+        data = {
+            "voting": 1,
+            "auths": [
+                { "name": "auth1", "url": "http://localhost:8000" },
+                { "name": "auth2", "url": "http://127.0.0.1:8000" },
+            ]
+        }
+        response = self.client.post('/mixnet/', data, format='json')
+        key = response.json()
+        pk = key["p"], key["g"], key["y"]
+        encrypt = self.encrypt_msgs(list(range(2, 12)), pk)
+
+        def send(msgs):
+            for start in range(0, 10, 4):
+                data = { "msgs": msgs[start:start + 4], "pk": key,
+                         "session": "s1", "start": start, "size": 4, "total": 10 }
+                response = self.client.post('/mixnet/shuffle/1/', data, format='json')
+            return response
+
+        # the second auth answers an error, the first one keeps its shuffle
+        error = mock.Mock(status_code=400)
+        error.json.return_value = { "detail": "bad request" }
+        with mock.patch('base.mods.post', return_value=error):
+            response = send(encrypt)
+        self.assertEqual(response.status_code, 502)
+        mn0 = Mixnet.objects.get(voting_id=1, auth_position=0)
+        self.assertEqual(mn0.stored("s1", Ballot.OUTPUT), 10)
+
+        response = send(encrypt)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["position"], 1)
+        self.assertEqual(mn0.ballots.count(), 0)
+        # the chunked shuffles aren't proved by default
+        self.assertFalse(Transcript.objects.exists())
+
+    @mock.patch('mixnet.models.CHUNK_PROOFS', True)
+    def test_chunks_reshuffle_transcript(self):
+        data = {
+            "voting": 1,
+            "auths": [
+                { "name": "auth1", "url": "http://localhost:8000" },
+                { "name": "auth2", "url": "http://127.0.0.1:8000" },
+            ]
+        }
+        response = self.client.post('/mixnet/', data, format='json')
+        key = response.json()
+        pk = key["p"], key["g"], key["y"]
+        encrypt = self.encrypt_msgs(list(range(2, 12)), pk)
+
+        def send(msgs):
+            for start in range(0, 10, 4):
+                data = { "msgs": msgs[start:start + 4], "pk": key,
+                         "session": "s1", "start": start, "size": 4, "total": 10 }
+                response = self.client.post('/mixnet/shuffle/1/', data, format='json')
+            return response
+
+        # the first auth dies after storing the proof of its shuffle
+        with mock.patch.object(Checkpoint.objects, 'bulk_create',
+                               side_effect=RuntimeError('auth down')):
+            with self.assertRaises(RuntimeError):
+                send(encrypt)
+        transcripts = Transcript.objects.filter(mixnet__auth_position=0, session="s1")
+        self.assertEqual(transcripts.count(), 1)
+
+        # the shuffle of the retry replaces it
+        response = send(encrypt)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(transcripts.count(), 1)
+        self.assertTrue(transcripts.get().verify())
+        call_command('verifyshuffle', 1)
+
+    @mock.patch('mixnet.models.CHUNK_PROOFS', True)
+    def test_shuffle_proof(self):
+        self.test_chunks()
+
+        transcripts = Transcript.objects.filter(mixnet__voting_id=1)
+        # the chunked shuffle of both auths
+        self.assertEqual(transcripts.count(), 2)
+        for t in transcripts:
+            self.assertTrue(t.verify())
+
+        t = transcripts.get(session="s1", mixnet__auth_position=0)
+        pk, inputs, outputs, proof = t.load()
+        self.assertEqual(len(inputs), 10)
+        self.assertTrue(shuffleproof.verify(pk, inputs, outputs, proof))
+        self.assertFalse(shuffleproof.verify(pk, inputs, outputs[1:] + outputs[:1], proof))
+        self.assertFalse(shuffleproof.verify(pk, inputs[:9], outputs[:9], proof))
+
+        call_command('verifyshuffle', 1, position=1)
+
+        # a shuffle that drops a ballot and duplicates another
+        outputs[0] = outputs[1]
+        t.data = shuffleproof.dumps(pk, inputs, outputs, proof)
+        t.save()
+        with self.assertRaises(CommandError):
+            call_command('verifyshuffle', 1)
+
+    def test_binary_wire(self):
+        self.test_create()
+
+        clear = [2, 3, 4, 5, 6, 7]
+        pk = self.key["p"], self.key["g"], self.key["y"]
+        encrypt = self.encrypt_msgs(clear, pk)
+        data = wire.encode({ "msgs": encrypt, "pk": self.key })
+
+        response = self.client.post('/mixnet/shuffle/1/', data,
+                                    content_type=wire.MEDIA_TYPE,
+                                    HTTP_ACCEPT=wire.ACCEPT)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], wire.MEDIA_TYPE)
+        shuffled = wire.decode(response.content)
+        self.assertEqual(len(shuffled), len(encrypt))
+
+        data = wire.encode({ "msgs": shuffled }, compression='gzip')
+        response = self.client.post('/mixnet/decrypt/1/', data,
+                                    content_type=wire.MEDIA_TYPE,
+                                    HTTP_ACCEPT=wire.ACCEPT)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(clear), sorted(wire.decode(response.content)))
+
+        # json is still the default
+        data = { "msgs": encrypt, "pk": self.key }
+        response = self.client.post('/mixnet/shuffle/1/', data, format='json')
+        self.assertEqual(len(response.json()), len(encrypt))
+
+        response = self.client.post('/mixnet/shuffle/1/', b'nope',
+                                    content_type=wire.MEDIA_TYPE)
+        self.assertEqual(response.status_code, 400)
+
+        # a small gzip message that is too big decompressed
+        data = wire.encode({ "msgs": [0] * 100000 }, compression='gzip')
+        self.assertLess(len(data), 10000)
+        with override_settings(MIXNET_WIRE_MAX_SIZE=10000):
+            response = self.client.post('/mixnet/decrypt/1/', data,
+                                        content_type=wire.MEDIA_TYPE)
+        self.assertEqual(response.status_code, 400)
+
+    def test_ec(self):
+        data = {
+            "voting": 1,
+            "group": "P-256",
+            "auths": [
+                { "name": "auth1", "url": "http://localhost:8000" },
+                { "name": "auth2", "url": "http://127.0.0.1:8000" },
+            ]
+        }
+        response = self.client.post('/mixnet/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        key = response.json()
+        self.assertEqual(key["p"], P256.p)
+        self.assertEqual(key["g"], encode(P256.g))
+
+        k = ECMixCrypt()
+        k.k = ECKey(key["p"], key["g"], key["y"])
+        clear = [2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14]
+        encrypt = [k.encrypt(i) for i in clear]
+        # points are 33 bytes, the cipher is much smaller than the modp one
+        self.assertTrue(all(i.bit_length() <= 8 * 33 for c in encrypt for i in c))
+
+        data = { "msgs": encrypt, "pk": key }
+        response = self.client.post('/mixnet/shuffle/1/', data, format='json')
+        shuffled = response.json()
+        self.assertNotEqual(shuffled, encrypt)
+
+        data = { "msgs": shuffled, "pk": key }
+        response = self.client.post('/mixnet/decrypt/1/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        clear1 = response.json()
+        self.assertNotEqual(clear, clear1)
+        self.assertEqual(sorted(clear), sorted(clear1))
+
+    def test_ec_unknown_group(self):
+        data = {
+            "voting": 1,
+            "group": "nope",
+            "auths": [ { "name": "auth1", "url": "http://localhost:8000" } ]
+        }
+        response = self.client.post('/mixnet/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_standard_group(self):
+        data = {
+            "voting": 1,
+            "group": "ffdhe2048",
+            "auths": [ { "name": "auth1", "url": "http://localhost:8000" } ]
+        }
+        response = self.client.post('/mixnet/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        key = response.json()
+        group = GROUP_NAMES["ffdhe2048"]
+        self.assertEqual((key["p"], key["g"]), (group.p, group.g))
+
+        clear = [2, 3, 4, 5]
+        pk = key["p"], key["g"], key["y"]
+        k = MixCrypt(k=group, bits=2048)
+        k.k = ElGamal.construct(pk)
+        encrypt = [k.encrypt(i) for i in clear]
+        data = { "msgs": encrypt }
+        response = self.client.post('/mixnet/shuffle/1/', data, format='json')
+        shuffled = response.json()
+
+        response = self.client.post('/mixnet/decrypt/1/', { "msgs": shuffled }, format='json')
+        self.assertEqual(sorted(clear), sorted(response.json()))
+
+    def test_standard_group_keybits(self):
+        # the key of a standard size doesn't generate a new prime
+        with mock.patch('mixnet.models.B', 2048), \
+                mock.patch('mixnet.mixcrypt.ElGamal.generate') as generate:
+            mn = Mixnet(voting_id=1)
+            mn.save()
+            mn.gen_key()
+            self.assertFalse(generate.called)
+        self.assertEqual(int(mn.key.p), for_bits(2048).p)
+        self.assertEqual(pow(2, int(mn.key.x), int(mn.key.p)), int(mn.key.y))
+
+    @override_settings(MIXNET_KEYGEN_FANOUT=1)
+    def test_keygen_fanout(self):
+        urls = ["http://localhost:8000", "http://127.0.0.1:8000", "http://127.0.0.2:8000"]
+        data = {
+            "voting": 1,
+            "auths": [ { "name": "auth{}".format(i), "url": url } for i, url in enumerate(urls) ]
+        }
+        response = self.client.post('/mixnet/', data, format='json')
+        key = response.json()
+
+        # every auth has its own key share and the same next auths as with the chain
+        mns = Mixnet.objects.filter(voting_id=1).order_by('auth_position')
+        self.assertEqual([mn.auth_position for mn in mns], [0, 1, 2])
+        self.assertEqual([mn.auths.count() for mn in mns], [3, 2, 1])
+        y = 1
+        for mn in mns:
+            y = (y * int(mn.key.y)) % key["p"]
+        self.assertEqual(y, key["y"])
+
+    def test_keygen_fanout_parallel(self):
+        urls = ["http://localhost:8000"] + ["http://10.0.0.{}:8000".format(i) for i in range(4)]
+        data = {
+            "voting": 1,
+            "group": "ffdhe2048",
+            "auths": [ { "name": "auth{}".format(i), "url": url } for i, url in enumerate(urls) ]
+        }
+        calls = []
+        # every remote auth waits until the four are called, it only
+        # passes if the requests are in flight at the same time
+        inflight = threading.Barrier(4, timeout=10)
+
+        def post(modname, entry_point, baseurl, json, **kwargs):
+            inflight.wait()
+            calls.append((baseurl, json["position"], len(json["auths"]), json["chain"]))
+            p, g = json["key"]["p"], json["key"]["g"]
+            return { "p": p, "g": g, "y": pow(g, json["position"], p) }
+
+        with mock.patch('base.mods.post', post):
+            response = self.client.post('/mixnet/', data, format='json')
+        key = response.json()
+
+        self.assertFalse(inflight.broken)
+        self.assertEqual(sorted(calls), [(url, i + 1, 4 - i, False) for i, url in enumerate(urls[1:])])
+        mn = Mixnet.objects.get(voting_id=1, auth_position=0)
+        p, g = key["p"], key["g"]
+        self.assertEqual(key["y"], int(mn.key.y) * pow(g, 1 + 2 + 3 + 4, p) % p)
+
+    def test_decrypt_fanout(self):
+        data = {
+            "voting": 1,
+            "auths": [
+                { "name": "auth1", "url": "http://localhost:8000" },
+                { "name": "auth2", "url": "http://127.0.0.1:8000" },
+            ]
+        }
+        response = self.client.post('/mixnet/', data, format='json')
+        key = response.json()
+        pk = key["p"], key["g"], key["y"]
+
+        clear = [2, 3, 4, 5, 6, 7, 8, 9]
+        encrypt = self.encrypt_msgs(clear, pk)
+        results = {}
+        for workers in (0, 8):
+            with override_settings(MIXNET_DECRYPT_FANOUT=workers):
+                data = { "msgs": encrypt, "pk": key }
+                response = self.client.post('/mixnet/decrypt/1/', data, format='json')
+                self.assertEqual(response.status_code, 200)
+                results[workers] = response.json()
+        # the chain and the shares give the same clear texts
+        self.assertEqual(sorted(results[0]), clear)
+        self.assertEqual(sorted(results[8]), clear)
+
+        data = { "msgs": encrypt, "pk": key, "shuffle": False }
+        response = self.client.post('/mixnet/decrypt/1/', data, format='json')
+        self.assertEqual(response.json(), clear)
+
+    def test_decrypt_fanout_parallel(self):
+        urls = ["http://localhost:8000"] + ["http://10.0.0.{}:8000".format(i) for i in range(4)]
+        mn = Mixnet(voting_id=1)
+        mn.save()
+        for i, url in enumerate(urls):
+            a, _ = Auth.objects.get_or_create(name="auth{}".format(i), url=url, me=i == 0)
+            mn.auths.add(a)
+        group = for_bits(2048)
+        mn.gen_key(group.p, group.g)
+        p, g = group.p, group.g
+
+        # the remote auths have the keys 1, 2, 3 and 4
+        y = int(mn.key.y) * pow(g, 1 + 2 + 3 + 4, p) % p
+        k = MixCrypt(k=group, bits=2048)
+        k.k = ElGamal.construct((p, g, y))
+        clear = [2, 3, 4, 5]
+        encrypt = [k.encrypt(m) for m in clear]
+        calls = []
+        # every remote auth waits until the four are called, it only
+        # passes if the requests are in flight at the same time
+        inflight = threading.Barrier(4, timeout=10)
+
+        def post(modname, entry_point, baseurl, json, **kwargs):
+            inflight.wait()
+            x = json["position"]
+            calls.append((x, json["shares"]))
+            shares = [pow(a, x, p) for a in json["msgs"]]
+            pk = (p, g, pow(g, x, p))
+            proof = decryptproof.prove(pk, x, json["msgs"], shares)
+            return { "msgs": shares, "y": pk[2], "proof": proof }
+
+        with mock.patch('base.mods.post', post):
+            clear2 = mn.decrypt_fanout(encrypt, (p, g, y), shuffle=False, workers=8)
+
+        self.assertFalse(inflight.broken)
+        self.assertEqual(clear2, clear)
+        self.assertEqual(sorted(calls), [(1, True), (2, True), (3, True), (4, True)])
+
+    def test_decrypt_proof(self):
+        self.test_decrypt_fanout()
+
+        # the chain, the fan out and the plain decryption of both auths
+        proofs = DecryptProof.objects.filter(mixnet__voting_id=1)
+        self.assertEqual(proofs.count(), 6)
+        self.assertTrue(all(proof.verify() for proof in proofs))
+        call_command('verifydecrypt', 1)
+
+        pk, alist, shares, proof, blist, outputs = proofs.first().load()
+        self.assertEqual(len(alist), 8)
+        wrong = list(shares)
+        wrong[0] = wrong[0] * pk[1] % pk[0]
+        self.assertFalse(decryptproof.verify(pk, alist, wrong, proof))
+
+        # shares out of the subgroup, -a^x, only change the sign of D
+        wrong = list(shares)
+        wrong[0], wrong[1] = pk[0] - wrong[0], pk[0] - wrong[1]
+        self.assertFalse(decryptproof.verify(pk, alist, wrong, proof))
+
+        # the first auth of the chain forwards other ciphers with the right
+        # shares: its outputs aren't b / d, or the second one didn't get them
+        first = proofs.filter(mixnet__auth_position=0).first()
+        pk, alist, shares, proof, blist, outputs = first.load()
+        self.assertTrue(decryptproof.check_outputs(pk, blist, shares, outputs))
+        wrong = list(outputs)
+        wrong[0] = wrong[0] * pk[1] % pk[0]
+        self.assertFalse(decryptproof.check_outputs(pk, blist, shares, wrong))
+        first.data = decryptproof.dumps(pk, alist, shares, proof, blist, wrong)
+        first.save()
+        self.assertFalse(first.verify())
+
+        wrong = [b * pk[1] % pk[0] for b in blist]
+        outputs = [o * pk[1] % pk[0] for o in outputs]
+        first.data = decryptproof.dumps(pk, alist, shares, proof, wrong, outputs)
+        first.save()
+        self.assertTrue(first.verify())
+        with self.assertRaises(CommandError):
+            call_command('verifydecrypt', 1)
+
+    def test_decrypt_fanout_wrong_share(self):
+        urls = ["http://localhost:8000", "http://10.0.0.1:8000"]
+        mn = Mixnet(voting_id=1)
+        mn.save()
+        for i, url in enumerate(urls):
+            a, _ = Auth.objects.get_or_create(name="auth{}".format(i), url=url, me=i == 0)
+            mn.auths.add(a)
+        group = for_bits(2048)
+        mn.gen_key(group.p, group.g)
+        p, g = group.p, group.g
+        y = int(mn.key.y) * pow(g, 7, p) % p
+        k = MixCrypt(k=group, bits=2048)
+        k.k = ElGamal.construct((p, g, y))
+        encrypt = [k.encrypt(m) for m in (2, 3, 4)]
+
+        def post(modname, entry_point, baseurl, json, shares=None, x=7, **kwargs):
+            shares = shares or [pow(a, 7, p) for a in json["msgs"]]
+            pk = (p, g, pow(g, x, p))
+            proof = decryptproof.prove(pk, x, json["msgs"], shares)
+            return { "msgs": shares, "y": pk[2], "proof": proof }
+
+        with mock.patch('base.mods.post', post):
+            clear = mn.decrypt_fanout(encrypt, (p, g, y), shuffle=False)
+        self.assertEqual(clear, [2, 3, 4])
+
+        # one share is wrong, the proof made with the key can't hide it
+        def wrong(modname, entry_point, baseurl, json, **kwargs):
+            shares = [pow(a, 7, p) for a in json["msgs"]]
+            shares[1] = shares[1] * g % p
+            return post(modname, entry_point, baseurl, json, shares)
+
+        # the shares are right, but of a key that isn't part of the voting key
+        def other_key(modname, entry_point, baseurl, json, **kwargs):
+            shares = [pow(a, 8, p) for a in json["msgs"]]
+            return post(modname, entry_point, baseurl, json, shares, x=8)
+
+        for fake in (wrong, other_key, lambda *args, **kwargs: [1, 1, 1]):
+            with mock.patch('base.mods.post', fake):
+                with self.assertRaises(decryptproof.ProofError):
+                    mn.decrypt_fanout(encrypt, (p, g, y), shuffle=False)
+
+    def test_mixnet_cache(self):
+        data = {
+            "voting": 1,
+            "auths": [
+                { "name": "auth1", "url": "http://localhost:8000" },
+                { "name": "auth2", "url": "http://127.0.0.1:8000" },
+            ]
+        }
+        response = self.client.post('/mixnet/', data, format='json')
+        key = response.json()
+        pk = key["p"], key["g"], key["y"]
+
+        mn = get_mixnet(1, 0)
+        self.assertEqual(len(mn.chain()), 1)
+        self.assertEqual(mn.crypt().k.x, mn.key.x)
+        with self.assertNumQueries(0):
+            self.assertIs(get_mixnet(1, 0), mn)
+            self.assertIs(get_mixnet(1, 0).crypt(), mn.crypt())
+            self.assertEqual(len(get_mixnet(1, 0).chain()), 1)
+
+        clear = [2, 3, 4, 5]
+        data = { "msgs": self.encrypt_msgs(clear, pk), "pk": key }
+        response = self.client.post('/mixnet/shuffle/1/', data, format='json')
+        data = { "msgs": response.json(), "pk": key }
+        response = self.client.post('/mixnet/decrypt/1/', data, format='json')
+        self.assertEqual(sorted(response.json()), clear)
+        self.assertIs(get_mixnet(1, 0), mn)
+
+        # a new key of the auth
+        k = mn.key
+        k.x = k.x + 1
+        k.y = k.y * k.g % k.p
+        k.save()
+        mn2 = get_mixnet(1, 0)
+        self.assertIsNot(mn2, mn)
+        self.assertEqual(mn2.crypt().k.x, k.x)
+
+        # a new auth changes the chain
+        mn2.auths.add(Auth.objects.create(name="auth3", url="http://127.0.0.2:8000"))
+        self.assertEqual(len(get_mixnet(1, 0).chain()), 2)
+
+        Mixnet.objects.filter(voting_id=1).delete()
+        with self.assertRaises(Mixnet.DoesNotExist):
+            get_mixnet(1, 0)
+        response = self.client.post('/mixnet/decrypt/1/', data, format='json')
+        self.assertEqual(response.status_code, 404)
+
+        cache = contexts.MixnetCache(max_size=2)
+        for i in range(3):
+            cache.get(i, 0, lambda: i)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get(0, 0, lambda: 'loaded'), 'loaded')
+
+    def test_pool(self):
+        self.test_create()
+        pk = self.key["p"], self.key["g"], self.key["y"]
+        mn = Mixnet.objects.get(voting_id=1)
+        mn.fill_pool(6, pk, batch=4)
+
+        response = self.client.get('/mixnet/pool/1/', format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"size": 6})
+
+        clear = [2, 3, 4, 5]
+        encrypt = self.encrypt_msgs(clear, pk)
+        data = { "msgs": encrypt, "pk": self.key }
+        response = self.client.post('/mixnet/shuffle/1/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mn.pool_size(pk), 2)
+
+        # the pool runs dry, the rest is reencrypted inline
+        encrypt = self.encrypt_msgs(clear, pk)
+        data = { "msgs": encrypt, "pk": self.key }
+        response = self.client.post('/mixnet/shuffle/1/', data, format='json')
+        self.assertEqual(mn.pool_size(pk), 0)
+        shuffled = response.json()
+
+        # the factors of the pool keep their exponents for the proofs
+        self.assertEqual(mn.transcripts.count(), 2)
+        self.assertTrue(all(t.verify() for t in mn.transcripts.all()))
+
+        response = self.client.post('/mixnet/decrypt/1/', { "msgs": shuffled }, format='json')
+        self.assertEqual(sorted(clear), sorted(response.json()))
+
+    def test_binary_key(self):
+        p = GROUP_NAMES['ffdhe2048'].p
+        k = Key(p=p, g=2, y=p - 1)
+        k.save()
+        k = Key.objects.get(pk=k.pk)
+        self.assertEqual((k.p, k.g, k.y, k.x), (p, 2, p - 1, None))
+
+        k.x = 1 << 255
+        k.save()
+        self.assertEqual(Key.objects.filter(x__isnull=False).get().x, 1 << 255)
+
+        raw = Key.objects.values_list('p', flat=True).query
+        with connection.cursor() as cursor:
+            cursor.execute(*raw.sql_with_params())
+            self.assertEqual(len(bytes(cursor.fetchone()[0])), 256)
+
+
+class MixCryptBackendCase(TestCase):
+
+    def test_backends_same_results(self):
+        k = MixCrypt(bits=settings.KEYBITS, backend='python')
+        p, g, y, x = map(int, (k.k.p, k.k.g, k.k.y, k.k.x))
+        clear = [2, 3, 4, 5]
+        rs = [rand(p) for i in clear]
+        cipher = [k.encrypt(m, r=r) for m, r in zip(clear, rs)]
+
+        for name in available_backends():
+            k2 = MixCrypt(k=k.k, bits=settings.KEYBITS, backend=name)
+            k2.setk(p, g, y, x)
+            cipher2 = [k2.encrypt(m, r=r) for m, r in zip(clear, rs)]
+            self.assertEqual(cipher, cipher2)
+            self.assertEqual(clear, [k2.decrypt(c) for c in cipher2])
+            self.assertTrue(all(type(i) is int for c in cipher2 for i in c))
+
+    def test_parallel_shuffle(self):
+        k = MixCrypt(bits=settings.KEYBITS)
+        clear = list(range(2, 22))
+        cipher = [k.encrypt(m) for m in clear]
+
+        shuffled = k.shuffle(cipher, workers=2)
+        self.assertEqual(len(shuffled), len(cipher))
+        self.assertNotEqual(shuffled, cipher)
+        self.assertEqual(sorted(k.decrypt(c) for c in shuffled), clear)
+
+    def test_fixedbase_same_results(self):
+        k = MixCrypt(bits=settings.KEYBITS)
+        kf = MixCrypt(k=k.k, bits=settings.KEYBITS, fixedbase=True)
+        kf.k = k.k
+        p = int(k.k.p)
+        for m in [2, 3, 4, 5]:
+            r = rand(p)
+            self.assertEqual(k.encrypt(m, r=r), kf.encrypt(m, r=r))
+
+    def test_fixedbase_cache_cap(self):
+        k = MixCrypt(bits=settings.KEYBITS)
+        p, g = int(k.k.p), int(k.k.g)
+        cache = FixedBaseCache(max_bytes=20000)
+        for base in range(2, 10):
+            t = cache.get(base, p)
+            self.assertEqual(t.pow(p - 2), pow(base, p - 2, p))
+            self.assertTrue(cache.memory() <= cache.max_bytes)
+        self.assertIsNone(FixedBaseCache(max_bytes=10).get(g, p))
+
+    def test_ballot_proof(self):
+        k = MixCrypt(bits=settings.KEYBITS)
+        pk = (int(k.k.p), int(k.k.g), int(k.k.y))
+
+        def check(vote, context='1|2'):
+            ciphers = [(o['a'], o['b']) for o in vote['options']]
+            proof = {'options': [o['proof'] for o in vote['options']], 'sum': vote['proof']}
+            return ballotproof.verify_ballot(pk, ciphers, proof, context)
+
+        vote = ballotproof.encrypt_ballot(k, [1, 2, 3], 2, '1|2')
+        self.assertTrue(check(vote))
+        self.assertFalse(check(vote, '1|3'))
+
+        # g^2 in an option, with g^0 in the rest
+        forged = ballotproof.encrypt_ballot(k, [1, 2, 3], 2, '1|2')
+        r = rand(k.k.p)
+        a, b = k.encrypt_exp(2, r=r)
+        forged['options'][1].update(a=a, b=b, proof=ballotproof.prove_bit(pk, a, b, 1, r, '1|2'))
+        self.assertFalse(check(forged))
+
+        # no option selected
+        self.assertFalse(check(ballotproof.encrypt_ballot(k, [1, 2, 3], 4, '1|2')))
+
+    def test_fixedbase_cache_threads(self):
+        p = int(MixCrypt(bits=settings.KEYBITS).k.p)
+        cache = FixedBaseCache(max_bytes=20000)
+        errors = []
+
+        def run(i):
+            try:
+                for base in range(2, 40):
+                    t = cache.get(base + i % 3, p)
+                    assert t.pow(5) == pow(base + i % 3, 5, p)
+                    cache.memory()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(i, )) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertTrue(cache.memory() <= cache.max_bytes)
+
+    def test_batch_decrypt(self):
+        k = MixCrypt(bits=settings.KEYBITS)
+        clear = list(range(2, 40))
+        cipher = [k.encrypt(m) for m in clear]
+
+        for name in available_backends():
+            k2 = MixCrypt(k=k.k, bits=settings.KEYBITS, backend=name)
+            k2.k = k.k
+            self.assertEqual(k2.batch_decrypt(cipher), [k.decrypt(c) for c in cipher])
+            self.assertEqual(k2.batch_decrypt(cipher), clear)
+            self.assertEqual(k2.batch_decrypt([]), [])
+
+        # the partial decryptions are still encoded in the subgroup
+        p = int(k.k.p)
+        partial = k.multiple_decrypt(cipher, last=False)
+        self.assertEqual(partial, [(a, to_subgroup(m, p)) for (a, b), m in zip(cipher, clear)])
+
+    def test_perm(self):
+        for n in [0, 1, 2, 1000]:
+            self.assertEqual(sorted(gen_perm(n)), list(range(n)))
+        self.assertNotEqual(gen_perm(1000), list(range(1000)))
+        self.assertEqual({randbelow(3) for i in range(200)}, {0, 1, 2})
+
+    def test_dlog(self):
+        k = MixCrypt(bits=settings.KEYBITS)
+        p, g = int(k.k.p), int(k.k.g)
+        with tempfile.TemporaryDirectory() as path:
+            cache = TableCache(path, max_bytes=table_bytes(64))
+            t = cache.get(p, g, 1000)
+            self.assertEqual(t.steps, 64)
+            for m in [0, 1, 63, 64, 500, 1000]:
+                self.assertEqual(t.log(pow(g, m, p), 1000), m)
+            self.assertIsNone(t.log(pow(g, 1001, p), 1000))
+
+            # the table is read from the file by another cache
+            self.assertEqual(len(os.listdir(path)), 1)
+            t2 = TableCache(path, max_bytes=table_bytes(64)).get(p, g, 1000)
+            self.assertEqual(t2.log(pow(g, 777, p), 1000), 777)
+            cache.clear()
+
+        c = k.encrypt_exp(12)
+        self.assertEqual(k.decrypt_exp(c, 100), 12)
+        with self.assertRaises(ValueError):
+            k.decrypt_exp(c, 10)
+
+    def test_dlog_cache_threads(self):
+        k = MixCrypt(bits=settings.KEYBITS)
+        p, g = int(k.k.p), int(k.k.g)
+        gs = [pow(g, e, p) for e in (1, 3, 5)]
+        with tempfile.TemporaryDirectory() as path:
+            # one table open, every use of another one evicts it
+            cache = TableCache(path, max_bytes=table_bytes(64), max_tables=1)
+            errors = []
+
+            def run(i):
+                try:
+                    for n in range(30):
+                        base = gs[(i + n) % 3]
+                        with cache.use(p, base, 1000) as t:
+                            m = (i * 31 + n) % 1000
+                            self.assertEqual(t.log(pow(base, m, p), 1000), m)
+                except Exception as e:
+                    errors.append(e)
+
+            threads = [threading.Thread(target=run, args=(i, )) for i in range(6)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            self.assertEqual(errors, [])
+            self.assertEqual(len(cache.tables), 1)
+            self.assertEqual(sum(cache.users.values()), 0)
+
+            # an evicted table in use is closed when it's released
+            with cache.use(p, gs[0], 1000) as t:
+                cache.clear()
+                self.assertEqual(t.log(pow(gs[0], 9, p), 1000), 9)
+            with self.assertRaises(ValueError):
+                t.log(pow(gs[0], 9, p), 1000)
+            self.assertEqual(cache.users, {})
+
+    def test_dlog_bad_file(self):
+        k = MixCrypt(bits=settings.KEYBITS)
+        p, g = int(k.k.p), int(k.k.g)
+        with tempfile.TemporaryDirectory() as path:
+            cache = TableCache(path, max_bytes=table_bytes(64))
+            steps = 64
+            # empty, truncated and of other steps
+            for data in (b'', b'DLG1', bytes(table_bytes(32))):
+                with open(cache.filename(p, g, steps), 'wb') as f:
+                    f.write(data)
+                t = cache.get(p, g, 1000)
+                self.assertEqual(t.log(pow(g, 777, p), 1000), 777)
+                self.assertEqual(os.path.getsize(cache.filename(p, g, steps)),
+                                 table_bytes(steps))
+                cache.clear()
+
+    def test_ec_backends(self):
+        k = ECMixCrypt(backend='python')
+        p, g, y, x = k.k.p, k.k.g, k.k.y, k.k.x
+        clear = [0, 1, 2, 1000]
+        rs = [k.rand() for i in clear]
+        cipher = [k.encrypt(m, r=r) for m, r in zip(clear, rs)]
+
+        for name in available_backends():
+            for fixedbase in (False, True):
+                k2 = ECMixCrypt(backend=name, fixedbase=fixedbase)
+                k2.setk(p, g, y, x)
+                cipher2 = [k2.encrypt(m, r=r) for m, r in zip(clear, rs)]
+                self.assertEqual(cipher, cipher2)
+                self.assertEqual(k2.batch_decrypt(cipher2), clear)
+
+        # the sum of the ciphers is the cipher of the sum
+        a, b = cipher[2]
+        c = k.reencrypt(cipher[3], factor=(a, b))
+        self.assertEqual(k.decrypt(c), 1002)
+        self.assertEqual(decode(encode(P256.g)), P256.g)
+
+        shuffled = k.shuffle(cipher, workers=2)
+        self.assertEqual(sorted(k.decrypt(c) for c in shuffled), clear)
+
+    def test_subgroup(self):
+        k = MixCrypt(bits=settings.KEYBITS, backend='python')
+        p, q = int(k.k.p), (int(k.k.p) - 1) // 2
+        be = k.backend
+        clear = list(range(1, 40)) + [q]
+        cipher = [k.encrypt(m) for m in clear]
+
+        # the plain texts are always quadratic residues, like g
+        elems = k.batch_decrypt(cipher, decode=False)
+        self.assertTrue(all(be.jacobi(m, p) == 1 for m in elems))
+        self.assertEqual([from_subgroup(m, p) for m in elems], clear)
+        self.assertEqual(k.batch_decrypt(cipher), clear)
+        # the first non residue over q, q + 1 and q + 2 can both be residues
+        out = next(m for m in range(q + 1, p) if be.jacobi(m, p) == -1)
+        with self.assertRaises(ValueError):
+            k.encrypt(out)
+
+    def test_short_exponents(self):
+        group = for_bits(2048)
+        k = MixCrypt(k=group, bits=2048, exp_bits=256)
+        self.assertTrue(int(k.k.x).bit_length() <= 256)
+        self.assertEqual(pow(group.g, int(k.k.x), group.p), int(k.k.y))
+
+        clear = list(range(2, 22))
+        cipher = [k.encrypt(m) for m in clear]
+        shuffled = k.shuffle(cipher, workers=2)
+        self.assertEqual(sorted(k.batch_decrypt(shuffled)), clear)
+        self.assertEqual(k.decrypt_exp(k.encrypt_exp(7), 10), 7)
+
+    def test_shuffle_proof_parallel(self):
+        k = MixCrypt(k=GROUP_NAMES['ffdhe2048'], bits=2048, exp_bits=256)
+        p, g, y = pk = (k.k.p, k.k.g, k.k.y)
+        cipher = [k.encrypt(m) for m in range(2, 22)]
+        perm = k.gen_perm(len(cipher))
+        factors = k.gen_factors(len(cipher), workers=2, exps=True)
+        rs = [r for _, _, r in factors]
+        shuffled = k.reencrypt_all([cipher[i] for i in perm], workers=2,
+                                   factors=[(a, b) for a, b, _ in factors])
+
+        proof = shuffleproof.prove(pk, cipher, shuffled, perm, rs, exp_bits=256, workers=2)
+        self.assertTrue(shuffleproof.verify(pk, cipher, shuffled, proof, workers=2))
+        self.assertTrue(shuffleproof.verify(pk, cipher, shuffled, proof))
+
+        # the prover doesn't know the exponents of one reencryption
+        rs[3] += 1
+        proof = shuffleproof.prove(pk, cipher, shuffled, perm, rs, exp_bits=256)
+        self.assertFalse(shuffleproof.verify(pk, cipher, shuffled, proof))
+
+    def test_multi_pow(self):
+        p = GROUP_NAMES['ffdhe2048'].p
+        bases = [rand(p) for i in range(150)]
+        exps = [rand(p) >> shift for i, shift in zip(range(150), range(0, 2100, 14))]
+        expected = 1
+        for b, e in zip(bases, exps):
+            expected = expected * pow(b, e, p) % p
+        for name in available_backends():
+            self.assertEqual(shuffleproof.multi_pow(bases, exps, p, name), expected)
+        exps[0] = -exps[0]
+        expected = expected * pow(pow(bases[0], -exps[0], p), p - 3, p) % p
+        self.assertEqual(shuffleproof.power_product(bases, exps, p), expected)
+
+    def test_groups(self):
+        for group in GROUPS:
+            self.assertEqual(group.p.bit_length(), group.bits)
+            self.assertTrue(isPrime(group.p))
+            self.assertTrue(isPrime(group.q))
+            self.assertEqual(pow(group.g, group.q, group.p), 1)
+        self.assertEqual(for_bits(3072).name, 'ffdhe3072')
+        self.assertEqual(for_bits(1536).name, 'modp1536')
+        self.assertIsNone(for_bits(settings.KEYBITS))
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            MixCrypt(bits=settings.KEYBITS, backend='nope')
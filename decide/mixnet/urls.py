@@ -9,4 +9,5 @@ urlpatterns = [
     path('', include(router.urls)),
     path('shuffle/<int:voting_id>/', views.Shuffle.as_view(), name='shuffle'),
     path('decrypt/<int:voting_id>/', views.Decrypt.as_view(), name='decrypt'),
+    path('pool/<int:voting_id>/', views.Pool.as_view(), name='pool'),
 ]
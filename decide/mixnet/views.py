@@ -1,12 +1,28 @@
 from django.conf import settings
-from django.shortcuts import get_object_or_404
-from rest_framework import viewsets
+from django.http import Http404
+from rest_framework import status, viewsets
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 
 from .serializers import MixnetSerializer
-from .models import Auth, Mixnet, Key
+from .models import Auth, Ballot, ChainError, Mixnet, Key, combine_keys, get_mixnet
+from .decryptproof import ProofError
+from .ec import CURVE_NAMES, encode
+from .groups import GROUP_NAMES
 from base.serializers import KeySerializer, AuthSerializer
+from base.wire import WireParser, WireRenderer, WireNegotiation
+
+
+def get_mixnet_or_404(voting_id, position):
+    '''
+    Cached mixnet of the voting in position, see contexts.py
+    '''
+
+    try:
+        return get_mixnet(voting_id, position)
+    except Mixnet.DoesNotExist:
+        raise Http404
 
 
 class MixnetViewSet(viewsets.ModelViewSet):
@@ -24,14 +40,29 @@ class MixnetViewSet(viewsets.ModelViewSet):
          * voting: id
          * position: int / nullable
          * key: { "p": int, "g": int } / nullable
+         * group: str / nullable, "P-256" for elliptic curve ElGamal, or
+           the name of a standard modp group, see groups.py
+         * chain: bool / nullable, false to only generate the key of this
+           auth, the first one asks the rest, see Mixnet.fanout_call
         """
 
         auths = request.data.get("auths")
         voting = request.data.get("voting")
         key = request.data.get("key", {"p": 0, "g": 0})
         position = request.data.get("position", 0)
+        chain = request.data.get("chain", True)
         p, g = int(key["p"]), int(key["g"])
 
+        group = request.data.get("group", "")
+        if group and not p:
+            if group in CURVE_NAMES:
+                curve = CURVE_NAMES[group]
+                p, g = curve.p, encode(curve.g, curve)
+            elif group in GROUP_NAMES:
+                p, g = GROUP_NAMES[group].p, GROUP_NAMES[group].g
+            else:
+                return Response({}, status=status.HTTP_400_BAD_REQUEST)
+
         dbauths = []
         for auth in auths:
             isme = auth["url"] == settings.BASEURL
@@ -49,12 +80,17 @@ class MixnetViewSet(viewsets.ModelViewSet):
         mn.gen_key(p, g)
 
         data = { "key": { "p": mn.key.p, "g": mn.key.g } }
-        # chained call to the next auth to gen the key
-        resp = mn.chain_call("/", data)
-        if resp:
-            y = (resp["y"] * mn.key.y) % mn.key.p
-        else:
-            y = mn.key.y
+        # without chain this auth only gens its own key share
+        y = mn.key.y
+        if chain and settings.MIXNET_KEYGEN_FANOUT:
+            # all the next auths gen their keys at the same time
+            for resp in mn.fanout_call("/", data, settings.MIXNET_KEYGEN_FANOUT):
+                y = combine_keys(mn.key.p, resp["y"], y)
+        elif chain:
+            # chained call to the next auth to gen the key
+            resp = mn.chain_call("/", data)
+            if resp:
+                y = combine_keys(mn.key.p, resp["y"], y)
 
         pubkey = Key(p=mn.key.p, g=mn.key.g, y=y)
         pubkey.save()
@@ -64,7 +100,58 @@ class MixnetViewSet(viewsets.ModelViewSet):
         return  Response(KeySerializer(pubkey, many=False).data)
 
 
-class Shuffle(APIView):
+class WireAPIView(APIView):
+    '''
+    View that also speaks the binary ciphertext format, see base/wire.py
+    '''
+
+    parser_classes = api_settings.DEFAULT_PARSER_CLASSES + [WireParser]
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [WireRenderer]
+    content_negotiation_class = WireNegotiation
+
+
+class Shuffle(WireAPIView):
+
+    def get(self, request, voting_id):
+        """
+        Shuffled ballots of a chunked session, only in the last auth
+
+         * voting_id: id
+         * session: str
+         * start: int
+         * size: int
+         * position: int / nullable
+        """
+
+        position = int(request.GET.get("position", 0))
+        mn = get_mixnet_or_404(voting_id, position)
+
+        session = request.GET.get("session", "")
+        start = int(request.GET.get("start", 0))
+        size = int(request.GET.get("size", 0))
+        indexes = list(range(start, start + size))
+        try:
+            msgs = mn.chunk(session, Ballot.OUTPUT, indexes)
+        except KeyError:
+            raise Http404
+
+        return  Response(msgs)
+
+    def delete(self, request, voting_id):
+        """
+        Removes the shuffled ballots and the checkpoints of a chunked
+        session
+
+         * voting_id: id
+         * session: str
+         * position: int / nullable
+        """
+
+        position = int(request.GET.get("position", 0))
+        mn = get_mixnet_or_404(voting_id, position)
+        mn.clear_session(request.GET.get("session", ""))
+
+        return  Response({})
 
     def post(self, request, voting_id):
         """
@@ -72,10 +159,21 @@ class Shuffle(APIView):
          * msgs: [ [int, int] ]
          * pk: { "p": int, "g": int, "y": int } / nullable
          * position: int / nullable
+
+        The ballots can be sent in chunks, in order, with these extra
+        params. The shuffle starts when all the chunks of the session are
+        received. A chunk sent again isn't stored again, and an auth that
+        already shuffled the session only sends it to the next one, so a
+        failed tally can be resumed with the same session.
+
+         * session: str / nullable
+         * start: int, index of the first ballot of the chunk
+         * size: int, ballots per chunk
+         * total: int, ballots of the session
         """
 
         position = request.data.get("position", 0)
-        mn = get_object_or_404(Mixnet, voting_id=voting_id, auth_position=position)
+        mn = get_mixnet_or_404(voting_id, position)
 
         msgs = request.data.get("msgs", [])
         pk = request.data.get("pk", None)
@@ -84,6 +182,10 @@ class Shuffle(APIView):
         else:
             p, g, y = mn.key.p, mn.key.g, mn.key.y
 
+        session = request.data.get("session", None)
+        if session:
+            return self.post_chunk(request, mn, session, msgs, (p, g, y))
+
         msgs = mn.shuffle(msgs, (p, g, y))
 
         data = {
@@ -98,7 +200,22 @@ class Shuffle(APIView):
         return  Response(msgs)
 
 
-class Decrypt(APIView):
+    def post_chunk(self, request, mn, session, msgs, pk):
+        start = int(request.data.get("start", 0))
+        size = int(request.data.get("size", len(msgs)))
+        total = int(request.data.get("total", len(msgs)))
+
+        if not mn.receive_chunk(session, start, msgs, total):
+            return  Response({ "session": session, "start": start })
+
+        try:
+            return  Response(mn.shuffle_chunks(session, pk, total, size))
+        except ChainError as e:
+            # the shuffled ballots are kept, the tally can be resumed
+            return  Response({ "detail": str(e) }, status=status.HTTP_502_BAD_GATEWAY)
+
+
+class Decrypt(WireAPIView):
 
     def post(self, request, voting_id):
         """
@@ -106,10 +223,16 @@ class Decrypt(APIView):
          * msgs: [ [int, int] ]
          * pk: { "p": int, "g": int, "y": int } / nullable
          * position: int / nullable
+         * shuffle: bool / nullable, false keeps the order of the msgs
+         * dlog: int / nullable, the msgs are g^m and m <= dlog is returned
+         * shares: bool / nullable, the msgs are only the a of each cipher
+           and the decryption shares of this auth are returned, with its
+           key and their proof, { "msgs": shares, "y": int, "proof": {} },
+           if it makes decryption proofs
         """
 
         position = request.data.get("position", 0)
-        mn = get_object_or_404(Mixnet, voting_id=voting_id, auth_position=position)
+        mn = get_mixnet_or_404(voting_id, position)
 
         msgs = request.data.get("msgs", [])
         pk = request.data.get("pk", None)
@@ -118,17 +241,38 @@ class Decrypt(APIView):
         else:
             p, g, y = mn.key.p, mn.key.g, mn.key.y
 
-        next_auths = mn.next_auths()
-        last = next_auths.count() == 0
+        if request.data.get("shares", False):
+            shares = mn.decrypt_shares(msgs)
+            if not mn.proves_decrypt():
+                return  Response(shares)
+            proof = mn.prove_decrypt(msgs, shares)
+            return  Response({ "msgs": shares, "y": mn.key.y, "proof": proof })
+
+        last = not mn.chain()
+
+        shuffle = request.data.get("shuffle", True)
+        dlog = request.data.get("dlog", None)
+        workers = settings.MIXNET_DECRYPT_FANOUT
+        if workers and not last and request.data.get("chain", True):
+            # every auth decrypts at the same time, see Mixnet.decrypt_fanout
+            try:
+                msgs = mn.decrypt_fanout(msgs, (p, g, y), shuffle=shuffle, dlog=dlog,
+                                         workers=workers)
+            except ProofError:
+                # the shares of some auth are wrong
+                return Response({}, status=status.HTTP_400_BAD_REQUEST)
+            return  Response(msgs)
 
         # useful for tests only, to override the last value
         last = request.data.get("force-last", last)
 
-        msgs = mn.decrypt(msgs, (p, g, y), last=last)
+        msgs = mn.decrypt(msgs, (p, g, y), last=last, shuffle=shuffle, dlog=dlog)
 
         data = {
             "msgs": msgs,
             "pk": { "p": p, "g": g, "y": y },
+            "shuffle": shuffle,
+            "dlog": dlog,
         }
         # chained call to the next auth to gen the key
         resp = mn.chain_call("/decrypt/{}/".format(voting_id), data)
@@ -136,3 +280,25 @@ class Decrypt(APIView):
             msgs = resp
 
         return  Response(msgs)
+
+
+class Pool(APIView):
+
+    def get(self, request, voting_id):
+        """
+         * voting_id: id
+         * position: int / nullable
+         * p, g, y: int / nullable, pubkey of the factors, mixnet key by default
+
+        Returns the number of precomputed reencryption factors available
+        """
+
+        position = request.GET.get("position", 0)
+        mn = get_mixnet_or_404(voting_id, position)
+
+        if "y" in request.GET:
+            pk = tuple(int(request.GET[i]) for i in ("p", "g", "y"))
+        else:
+            pk = (mn.key.p, mn.key.g, mn.key.y)
+
+        return Response({"size": mn.pool_size(pk)})
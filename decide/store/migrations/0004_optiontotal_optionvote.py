@@ -0,0 +1,40 @@
+# Generated by Django 2.0 on 2026-10-18 13:00
+
+import base.models
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0003_auto_20180921_1522'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OptionTotal',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('voting_id', models.PositiveIntegerField()),
+                ('number', models.PositiveIntegerField()),
+                ('a', base.models.BigBigField(default=1)),
+                ('b', base.models.BigBigField(default=1)),
+                ('votes', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='OptionVote',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('a', base.models.BigBigField()),
+                ('b', base.models.BigBigField()),
+                ('vote', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='options', to='store.Vote')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='optiontotal',
+            unique_together={('voting_id', 'number')},
+        ),
+    ]
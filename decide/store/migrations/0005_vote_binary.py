@@ -0,0 +1,87 @@
+# Generated by Django 2.0 on 2026-10-18 17:00
+
+import base.models
+from django.db import migrations
+
+
+BATCH = 10000
+
+
+def copy(apps, schema_editor, src, dst, encode):
+    '''
+    Copies the fields src of every vote to dst, BATCH votes at a time
+    '''
+
+    Vote = apps.get_model('store', 'Vote')
+    qn = schema_editor.quote_name
+    sql = 'UPDATE {} SET {} WHERE id = %s'.format(
+          qn(Vote._meta.db_table), ', '.join('{} = %s'.format(qn(f)) for f in dst))
+
+    last = 0
+    while True:
+        rows = list(Vote.objects.filter(id__gt=last).order_by('id')
+                                .values_list('id', *src)[:BATCH])
+        if not rows:
+            break
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(sql, [[encode(v) for v in row[1:]] + [row[0]] for row in rows])
+        last = rows[-1][0]
+
+
+def to_binary(apps, schema_editor):
+    def encode(n):
+        return n.to_bytes(max(1, (n.bit_length() + 7) // 8), 'big')
+    copy(apps, schema_editor, ['a', 'b'], ['a_bin', 'b_bin'], encode)
+
+
+def to_text(apps, schema_editor):
+    copy(apps, schema_editor, ['a_bin', 'b_bin'], ['a', 'b'], str)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0004_optiontotal_optionvote'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vote',
+            name='a_bin',
+            field=base.models.BigBinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='vote',
+            name='b_bin',
+            field=base.models.BigBinaryField(null=True),
+        ),
+        migrations.RunPython(to_binary, to_text),
+        migrations.RemoveField(
+            model_name='vote',
+            name='a',
+        ),
+        migrations.RemoveField(
+            model_name='vote',
+            name='b',
+        ),
+        migrations.RenameField(
+            model_name='vote',
+            old_name='a_bin',
+            new_name='a',
+        ),
+        migrations.RenameField(
+            model_name='vote',
+            old_name='b_bin',
+            new_name='b',
+        ),
+        migrations.AlterField(
+            model_name='vote',
+            name='a',
+            field=base.models.BigBinaryField(),
+        ),
+        migrations.AlterField(
+            model_name='vote',
+            name='b',
+            field=base.models.BigBinaryField(),
+        ),
+    ]
@@ -1,15 +1,47 @@
 from django.db import models
-from base.models import BigBigField
+from base.models import BigBigField, BigBinaryField
 
 
 class Vote(models.Model):
     voting_id = models.PositiveIntegerField()
     voter_id = models.PositiveIntegerField()
 
-    a = BigBigField()
-    b = BigBigField()
+    a = BigBinaryField()
+    b = BigBinaryField()
 
     voted = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return '{}: {}'.format(self.voting_id, self.voter_id)
+
+
+class OptionVote(models.Model):
+    '''
+    Cipher of g^1 or g^0 for one option of a vote in a homomorphic voting
+    '''
+
+    vote = models.ForeignKey(Vote, related_name='options', on_delete=models.CASCADE)
+    number = models.PositiveIntegerField()
+
+    a = BigBigField()
+    b = BigBigField()
+
+
+class OptionTotal(models.Model):
+    '''
+    Product of the ciphers of one option for all the votes of a
+    homomorphic voting, the decryption is g^(votes for the option)
+    '''
+
+    voting_id = models.PositiveIntegerField()
+    number = models.PositiveIntegerField()
+
+    a = BigBigField(default=1)
+    b = BigBigField(default=1)
+    votes = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = (('voting_id', 'number'),)
+
+    def __str__(self):
+        return '{}: {}'.format(self.voting_id, self.number)
@@ -1,6 +1,6 @@
 from rest_framework import serializers
 
-from .models import Vote
+from .models import Vote, OptionTotal
 
 
 class VoteSerializer(serializers.HyperlinkedModelSerializer):
@@ -10,3 +10,12 @@ class VoteSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
         model = Vote
         fields = ('voting_id', 'voter_id', 'a', 'b')
+
+
+class OptionTotalSerializer(serializers.HyperlinkedModelSerializer):
+    a = serializers.IntegerField()
+    b = serializers.IntegerField()
+
+    class Meta:
+        model = OptionTotal
+        fields = ('voting_id', 'number', 'a', 'b', 'votes')
@@ -1,19 +1,23 @@
 import datetime
 import random
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.test import TestCase
 from rest_framework.test import APIClient
 from rest_framework.test import APITestCase
 
-from .models import Vote
+from .models import Vote, OptionTotal
 from .serializers import VoteSerializer
 from base import mods
 from base.models import Auth
 from base.tests import BaseTestCase
 from census.models import Census
+from mixnet import ballotproof
+from mixnet.ec import ECMixCrypt
+from mixnet.mixcrypt import MixCrypt, rand
 from mixnet.models import Key
-from voting.models import Question
+from voting.models import Question, QuestionOption
 from voting.models import Voting
 
 
@@ -100,6 +104,115 @@ class StoreTextCase(BaseTestCase):
         self.assertEqual(Vote.objects.first().a, CTE_A)
         self.assertEqual(Vote.objects.first().b, CTE_B)
 
+    def test_store_vote_subgroup(self):
+        VOTING_PK = 349
+        Census(voting_id=VOTING_PK, voter_id=1).save()
+        k = MixCrypt(bits=settings.KEYBITS)
+        key = Key(p=k.k.p, g=k.k.g, y=k.k.y)
+        key.save()
+        self.gen_voting(VOTING_PK)
+        Voting.objects.filter(pk=VOTING_PK).update(pub_key=key)
+        p = int(k.k.p)
+        a, b = k.encrypt(3)
+        # -a isn't a quadratic residue, p = 3 mod 4
+        wrong = [(p - a, b), (a, p - b), (a + p, b), ('x', b)]
+
+        user = self.get_or_create_user(1)
+        self.login(user=user.username)
+        for c in wrong:
+            data = { "voting": VOTING_PK, "voter": 1, "vote": { "a": c[0], "b": c[1] } }
+            response = self.client.post('/store/', data, format='json')
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(Vote.objects.filter(voting_id=VOTING_PK).count(), 0)
+
+        data = { "voting": VOTING_PK, "voter": 1, "vote": { "a": a, "b": b } }
+        response = self.client.post('/store/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        self.login()
+        data = {
+            "voting": VOTING_PK,
+            "votes": [{ "voter": 1, "vote": { "a": c[0], "b": c[1] } } for c in wrong],
+        }
+        response = self.client.post('/store/bulk/', data, format='json')
+        self.assertEqual(response.json(), { "stored": 0, "status": ["invalid"] * 4 })
+        self.assertEqual(Vote.objects.get(voting_id=VOTING_PK).a, a)
+
+    def test_store_vote_homomorphic(self):
+        VOTING_PK = 346
+        for i in range(3):
+            QuestionOption(question=self.question, option='option {}'.format(i), number=i + 2).save()
+        k = MixCrypt(bits=settings.KEYBITS)
+        key = Key(p=k.k.p, g=k.k.g, y=k.k.y)
+        key.save()
+        self.gen_voting(VOTING_PK)
+        Voting.objects.filter(pk=VOTING_PK).update(tally_mode=Voting.HOMOMORPHIC, pub_key=key)
+
+        def vote(voter, selected):
+            Census.objects.get_or_create(voting_id=VOTING_PK, voter_id=voter)
+            user = self.get_or_create_user(voter)
+            self.login(user=user.username)
+            context = '{}|{}'.format(VOTING_PK, voter)
+            data = {
+                "voting": VOTING_PK,
+                "voter": voter,
+                "vote": ballotproof.encrypt_ballot(k, [2, 3, 4], selected, context)
+            }
+            return self.client.post('/store/', data, format='json')
+
+        def forged(voter, ms):
+            # a valid proof for each bit, but more than one vote
+            pk = (int(k.k.p), int(k.k.g), int(k.k.y))
+            rs = [rand(k.k.p) for m in ms]
+            ciphers = [k.encrypt_exp(m, r=r) for m, r in zip(ms, rs)]
+            proofs = [ballotproof.prove_bit(pk, a, b, m, r, '{}|{}'.format(VOTING_PK, voter))
+                      for (a, b), m, r in zip(ciphers, ms, rs)]
+            options = [{ "number": n, "a": a, "b": b, "proof": proof }
+                       for n, (a, b), proof in zip((2, 3, 4), ciphers, proofs)]
+            data = {
+                "voting": VOTING_PK,
+                "voter": voter,
+                "vote": { "options": options, "proof": { "c": 0, "s": 0 } }
+            }
+            return self.client.post('/store/', data, format='json')
+
+        self.assertEqual(vote(1, 2).status_code, 200)
+        self.assertEqual(vote(2, 3).status_code, 200)
+        self.assertEqual(vote(3, 2).status_code, 200)
+        # the second vote of a voter replaces the first one
+        self.assertEqual(vote(3, 4).status_code, 200)
+
+        # the votes without valid proofs aren't added
+        self.assertEqual(forged(4, [1, 1, 0]).status_code, 400)
+        self.assertEqual(forged(4, [0, 0, 0]).status_code, 400)
+        data = {
+            "voting": VOTING_PK,
+            "voter": 4,
+            "vote": ballotproof.encrypt_ballot(k, [2, 3, 4], 2, '{}|{}'.format(VOTING_PK, 5))
+        }
+        self.assertEqual(self.client.post('/store/', data, format='json').status_code, 400)
+
+        totals = {t.number: t for t in OptionTotal.objects.filter(voting_id=VOTING_PK)}
+        self.assertEqual(totals[2].votes, 3)
+        counts = {n: k.decrypt_exp((t.a, t.b), t.votes) for n, t in totals.items()}
+        self.assertEqual(counts, {2: 1, 3: 1, 4: 1})
+
+        # the vote must have every option
+        data = {
+            "voting": VOTING_PK,
+            "voter": 3,
+            "vote": { "a": 1, "b": 1 }
+        }
+        response = self.client.post('/store/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        self.login(user='noadmin')
+        response = self.client.get('/store/totals/', {'voting_id': VOTING_PK}, format='json')
+        self.assertEqual(response.status_code, 403)
+        self.login()
+        response = self.client.get('/store/totals/', {'voting_id': VOTING_PK}, format='json')
+        self.assertEqual(len(response.json()), 3)
+
     def test_vote(self):
         self.gen_votes()
         response = self.client.get('/store/', format='json')
@@ -193,3 +306,77 @@ class StoreTextCase(BaseTestCase):
         self.voting.save()
         response = self.client.post('/store/', data, format='json')
         self.assertEqual(response.status_code, 401)
+
+    def test_store_bulk(self):
+        VOTING_PK = 347
+        self.gen_voting(VOTING_PK)
+        for voter in range(1, 5):
+            Census(voting_id=VOTING_PK, voter_id=voter).save()
+        Vote(voting_id=VOTING_PK, voter_id=1, a=1, b=1).save()
+
+        data = {
+            "voting": VOTING_PK,
+            "votes": [
+                { "voter": 1, "vote": { "a": 30, "b": 55 } },
+                { "voter": 2, "vote": { "a": 31, "b": 56 } },
+                { "voter": 2, "vote": { "a": 32, "b": 57 } },
+                { "voter": 3, "vote": { "a": 0, "b": 58 } },
+                { "voter": 4 },
+                { "voter": 5, "vote": { "a": 33, "b": 59 } },
+            ]
+        }
+        response = self.client.post('/store/bulk/', data, format='json')
+        self.assertEqual(response.status_code, 401)
+
+        self.login(user='noadmin')
+        response = self.client.post('/store/bulk/', data, format='json')
+        self.assertEqual(response.status_code, 403)
+
+        self.login()
+        response = self.client.post('/store/bulk/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            "stored": 2,
+            "status": ["updated", "stored", "duplicated", "invalid", "invalid", "census"],
+        })
+
+        votes = Vote.objects.filter(voting_id=VOTING_PK).order_by('voter_id')
+        self.assertEqual([(v.voter_id, v.a, v.b) for v in votes], [(1, 30, 55), (2, 31, 56)])
+
+        # closed
+        self.voting = Voting.objects.get(pk=VOTING_PK)
+        self.voting.end_date = timezone.now() - datetime.timedelta(days=1)
+        self.voting.save()
+        response = self.client.post('/store/bulk/', data, format='json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_store_bulk_curve(self):
+        VOTING_PK = 348
+        self.gen_voting(VOTING_PK)
+        for voter in range(1, 4):
+            Census(voting_id=VOTING_PK, voter_id=voter).save()
+        # the encoded points have a prefix and are bigger than p
+        k = ECMixCrypt()
+        key = Key(p=k.k.p, g=k.k.g, y=k.k.y)
+        key.save()
+        Voting.objects.filter(pk=VOTING_PK).update(pub_key=key)
+        a, b = k.encrypt(3)
+        self.assertGreater(a, k.k.p)
+
+        data = {
+            "voting": VOTING_PK,
+            "votes": [
+                { "voter": 1, "vote": { "a": a, "b": b } },
+                { "voter": 2, "vote": { "a": a, "b": (1 << 256) | 5 } },
+                { "voter": 3, "vote": { "a": 30, "b": 55 } },
+            ]
+        }
+        self.login()
+        response = self.client.post('/store/bulk/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            "stored": 1,
+            "status": ["stored", "invalid", "invalid"],
+        })
+        vote = Vote.objects.get(voting_id=VOTING_PK)
+        self.assertEqual((vote.voter_id, vote.a, vote.b), (1, a, b))
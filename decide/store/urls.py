@@ -4,4 +4,6 @@ from . import views
 
 urlpatterns = [
     path('', views.StoreView.as_view(), name='store'),
+    path('bulk/', views.BulkStoreView.as_view(), name='store-bulk'),
+    path('totals/', views.TotalsView.as_view(), name='store-totals'),
 ]
@@ -1,3 +1,5 @@
+from Crypto.Util.number import inverse
+from django.db import transaction
 from django.utils import timezone
 from django.utils.dateparse import parse_datetime
 import django_filters.rest_framework
@@ -5,10 +7,51 @@ from rest_framework import status
 from rest_framework.response import Response
 from rest_framework import generics
 
-from .models import Vote
-from .serializers import VoteSerializer
+from .models import Vote, OptionVote, OptionTotal
+from .serializers import VoteSerializer, OptionTotalSerializer
 from base import mods
 from base.perms import UserIsStaff
+from mixnet import ballotproof
+from mixnet.backends import get_backend
+from mixnet.ec import CURVES, decode, is_curve
+
+
+# votes of each insert of the bulk store
+BULK_BATCH = 1000
+
+
+def voting_open(voting):
+    start_date = voting.get('start_date', None)
+    end_date = voting.get('end_date', None)
+    not_started = not start_date or timezone.now() < parse_datetime(start_date)
+    is_closed = end_date and parse_datetime(end_date) < timezone.now()
+    return not not_started and not is_closed
+
+
+def valid_cipher(a, b, p):
+    '''
+    a and b are in the subgroup of the quadratic residues of the voting
+    key p, where g is, or encoded points of the curve in the elliptic
+    curve votings, that are bigger than p.
+
+    The shuffle and decryption proofs of the auths only hold for ciphers
+    in the group, so a cipher out of it would make them fail, and the
+    tally would never end.
+    '''
+
+    if a <= 0 or b <= 0:
+        return False
+    if not p:
+        return True
+    if not is_curve(p):
+        be = get_backend()
+        return a < p and b < p and be.jacobi(a, p) == 1 and be.jacobi(b, p) == 1
+    try:
+        decode(a, CURVES[p])
+        decode(b, CURVES[p])
+    except ValueError:
+        return False
+    return True
 
 
 class StoreView(generics.ListAPIView):
@@ -33,11 +76,7 @@ class StoreView(generics.ListAPIView):
         voting = mods.get('voting', params={'id': vid})
         if not voting or not isinstance(voting, list):
             return Response({}, status=status.HTTP_401_UNAUTHORIZED)
-        start_date = voting[0].get('start_date', None)
-        end_date = voting[0].get('end_date', None)
-        not_started = not start_date or timezone.now() < parse_datetime(start_date)
-        is_closed = end_date and parse_datetime(end_date) < timezone.now()
-        if not_started or is_closed:
+        if not voting_open(voting[0]):
             return Response({}, status=status.HTTP_401_UNAUTHORIZED)
 
         uid = request.data.get('voter')
@@ -58,8 +97,17 @@ class StoreView(generics.ListAPIView):
         if perms.status_code == 401:
             return Response({}, status=status.HTTP_401_UNAUTHORIZED)
 
-        a = vote.get("a")
-        b = vote.get("b")
+        if voting[0].get('tally_mode') == 'HOMOMORPHIC':
+            return self.store_options(voting[0], vid, uid, vote)
+
+        pub_key = voting[0].get('pub_key') or {}
+        p = int(pub_key['p']) if pub_key.get('p') else None
+        try:
+            a, b = int(vote.get("a")), int(vote.get("b"))
+        except (TypeError, ValueError):
+            return Response({}, status=status.HTTP_400_BAD_REQUEST)
+        if not valid_cipher(a, b, p):
+            return Response({}, status=status.HTTP_400_BAD_REQUEST)
 
         defs = { "a": a, "b": b }
         v, _ = Vote.objects.get_or_create(voting_id=vid, voter_id=uid,
@@ -70,3 +118,159 @@ class StoreView(generics.ListAPIView):
         v.save()
 
         return  Response({})
+
+    def store_options(self, voting, vid, uid, vote):
+        """
+        Homomorphic votings, the vote has a cipher of g^1 for the selected
+        option and g^0 for the rest. Each one is multiplied into the total
+        of its option, dividing first by the previous vote of the voter.
+        The vote is only added if its proofs show that every cipher is g^0
+        or g^1 and that only one is g^1, see mixnet/ballotproof.py.
+
+         * vote: { "options": [ { "number": int, "a": int, "b": int,
+                                  "proof": { "c": [int, int], "s": [int, int] } } ],
+                   "proof": { "c": int, "s": int } }
+        """
+
+        options = vote.get('options')
+        numbers = sorted(o['number'] for o in voting['question']['options'])
+        if (not isinstance(options, list) or not voting.get('pub_key') or
+                sorted(o.get('number') for o in options) != numbers):
+            return Response({}, status=status.HTTP_400_BAD_REQUEST)
+
+        pk = tuple(int(voting['pub_key'][k]) for k in ('p', 'g', 'y'))
+        p = pk[0]
+        try:
+            ciphers = [(int(o['a']), int(o['b'])) for o in options]
+        except (KeyError, TypeError, ValueError):
+            return Response({}, status=status.HTTP_400_BAD_REQUEST)
+        proof = {'options': [o.get('proof') for o in options], 'sum': vote.get('proof')}
+        context = '{}|{}'.format(int(vid), int(uid))
+        if not ballotproof.verify_ballot(pk, ciphers, proof, context):
+            return Response({}, status=status.HTTP_400_BAD_REQUEST)
+        ciphers = {o['number']: c for o, c in zip(options, ciphers)}
+
+        with transaction.atomic():
+            for n in numbers:
+                OptionTotal.objects.get_or_create(voting_id=vid, number=n)
+            # the totals are locked, so the votes of a voting are added one
+            # after another
+            totals = OptionTotal.objects.select_for_update().filter(voting_id=vid)
+            totals = {t.number: t for t in totals}
+
+            v, created = Vote.objects.get_or_create(voting_id=vid, voter_id=uid,
+                                                    defaults={"a": 0, "b": 0})
+            for old in v.options.all():
+                t = totals.get(old.number)
+                if t:
+                    t.a = (t.a * inverse(old.a, p)) % p
+                    t.b = (t.b * inverse(old.b, p)) % p
+            v.options.all().delete()
+
+            for n, (a, b) in ciphers.items():
+                t = totals[n]
+                t.a = (t.a * a) % p
+                t.b = (t.b * b) % p
+                if created:
+                    t.votes += 1
+                t.save()
+
+            OptionVote.objects.bulk_create(
+                OptionVote(vote=v, number=n, a=a, b=b)
+                for n, (a, b) in ciphers.items())
+            v.save()
+
+        return  Response({})
+
+
+class BulkStoreView(generics.GenericAPIView):
+    """
+    Votes of many voters of a voting in one request, for the kiosks and
+    the digitised paper ballots. The voting is read once, the census is
+    checked with a single query and the votes are written in bulk.
+    """
+
+    permission_classes = (UserIsStaff,)
+
+    def post(self, request):
+        """
+         * voting: id
+         * votes: [ { "voter": id, "vote": { "a": int, "b": int } } ]
+
+        The answer has the status of each vote, in the order of the
+        request: "stored", "updated" if it replaces a previous vote,
+        "duplicated" if the voter is repeated in the request, "census" if
+        the voter isn't in the census or "invalid".
+        """
+
+        vid = request.data.get('voting')
+        votes = request.data.get('votes')
+        if not vid or not isinstance(votes, list):
+            return Response({}, status=status.HTTP_400_BAD_REQUEST)
+
+        voting = mods.get('voting', params={'id': vid})
+        if not voting or not isinstance(voting, list):
+            return Response({}, status=status.HTTP_401_UNAUTHORIZED)
+        if not voting_open(voting[0]):
+            return Response({}, status=status.HTTP_401_UNAUTHORIZED)
+        # the homomorphic votes are added to the totals one by one
+        if voting[0].get('tally_mode') == 'HOMOMORPHIC':
+            return Response({}, status=status.HTTP_400_BAD_REQUEST)
+
+        pub_key = voting[0].get('pub_key') or {}
+        p = int(pub_key['p']) if pub_key.get('p') else None
+
+        parsed = []
+        for v in votes:
+            try:
+                parsed.append((int(v['voter']), int(v['vote']['a']), int(v['vote']['b'])))
+            except (KeyError, TypeError, ValueError):
+                parsed.append(None)
+
+        # only the voters of this request are read from the census
+        auth = 'Token {}'.format(request.auth.key)
+        voters = ','.join(sorted({str(v[0]) for v in parsed if v}))
+        census = mods.get('census', params={'voting_id': vid, 'voters': voters},
+                          HTTP_AUTHORIZATION=auth) if voters else {}
+        census = set(census.get('voters', []))
+
+        result = []
+        ciphers = {}
+        for v in parsed:
+            if not v:
+                result.append('invalid')
+                continue
+            uid, a, b = v
+            if not valid_cipher(a, b, p):
+                result.append('invalid')
+            elif uid not in census:
+                result.append('census')
+            elif uid in ciphers:
+                result.append('duplicated')
+            else:
+                result.append(uid)
+                ciphers[uid] = (a, b)
+
+        with transaction.atomic():
+            old = Vote.objects.filter(voting_id=vid, voter_id__in=list(ciphers))
+            updated = set(old.values_list('voter_id', flat=True))
+            old.delete()
+            Vote.objects.bulk_create((Vote(voting_id=vid, voter_id=uid, a=a, b=b)
+                                      for uid, (a, b) in ciphers.items()),
+                                     batch_size=BULK_BATCH)
+
+        result = [r if isinstance(r, str) else 'updated' if r in updated else 'stored'
+                  for r in result]
+        return Response({'stored': len(ciphers), 'status': result})
+
+
+class TotalsView(generics.ListAPIView):
+    """
+    Encrypted totals of the options of the homomorphic votings
+    """
+
+    queryset = OptionTotal.objects.all()
+    serializer_class = OptionTotalSerializer
+    filter_backends = (django_filters.rest_framework.DjangoFilterBackend,)
+    filter_fields = ('voting_id', )
+    permission_classes = (UserIsStaff,)
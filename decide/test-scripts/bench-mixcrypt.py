@@ -0,0 +1,345 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import time
+
+from Crypto.Random import random
+from Crypto.Util.number import getPrime
+
+from mixnet.backends import available_backends
+from mixnet.dlog import Table, TableCache
+from mixnet.ec import ECMixCrypt
+from mixnet.fixedbase import FixedBase, best_window, MAX_BYTES
+from mixnet.groups import for_bits
+from mixnet.perm import gen_perm
+from mixnet.mixcrypt import MixCrypt, PublicKey, rand
+from mixnet import decryptproof
+from mixnet import shuffleproof
+
+
+N = 200
+
+
+def timeit(f, *args):
+    t = time.perf_counter()
+    r = f(*args)
+    return time.perf_counter() - t, r
+
+
+def bench_backend(bits):
+    '''
+    Encrypt, reencrypt and decrypt N messages with every backend, using
+    the same random values, and check that all results are equal.
+    '''
+
+    p = getPrime(bits)
+    g = 2
+    x = rand(p)
+    y = pow(g, x, p)
+    rs = [rand(p) for i in range(N)]
+    clears = list(range(2, N + 2))
+
+    results = {}
+    for name in available_backends():
+        k = MixCrypt(k=PublicKey(p, g, y), bits=bits, backend=name)
+        k.setk(p, g, y, x)
+
+        t1, cipher = timeit(lambda: [k.encrypt(m, r=r) for m, r in zip(clears, rs)])
+        t2, _ = timeit(lambda: [k.reencrypt(c) for c in cipher])
+        t3, d = timeit(lambda: [k.decrypt(c) for c in cipher])
+        assert d == clears
+
+        results[name] = (t1 + t2 + t3, cipher)
+        print('{:5} bits {:7} encrypt {:.3f}s reencrypt {:.3f}s decrypt {:.3f}s'.format(
+              bits, name, t1, t2, t3))
+
+    base, cipher = results['python']
+    for name, (t, c) in results.items():
+        assert c == cipher, '{} results differ from python'.format(name)
+        print('{:5} bits {:7} speedup x{:.2f}'.format(bits, name, base / t))
+
+
+def bench_shuffle(bits):
+    '''
+    Shuffles N * 10 messages with 1, 2, 4... workers up to the number of
+    cores.
+    '''
+
+    p = getPrime(bits)
+    g = 2
+    x = rand(p)
+    y = pow(g, x, p)
+    k = MixCrypt(k=PublicKey(p, g, y), bits=bits)
+    k.setk(p, g, y, x)
+    cipher = [k.encrypt(m) for m in range(2, N * 10 + 2)]
+
+    workers = 1
+    base = None
+    while workers <= os.cpu_count():
+        t, _ = timeit(k.shuffle, cipher, None, workers)
+        base = base or t
+        print('{:5} bits {:3} workers {:.3f}s speedup x{:.2f}'.format(
+              bits, workers, t, base / t))
+        workers *= 2
+
+
+def bench_fixedbase(bits):
+    '''
+    N * 10 powers of the same base, with powmod and with the fixed base
+    table, including the time to build the table.
+    '''
+
+    p = getPrime(bits)
+    g = 2
+    exps = [rand(p) for i in range(N * 10)]
+    window = best_window(bits, MAX_BYTES // 2)
+
+    t1, r1 = timeit(lambda: [pow(g, e, p) for e in exps])
+    t2, table = timeit(FixedBase, g, p, window)
+    t3, r2 = timeit(lambda: [table.pow(e) for e in exps])
+    assert r1 == [int(i) for i in r2]
+    print('{:5} bits window {} table {:.1f} MB built in {:.3f}s'.format(
+          bits, window, table.memory() / 2 ** 20, t2))
+    print('{:5} bits powmod {:.3f}s fixed base {:.3f}s speedup x{:.2f}'.format(
+          bits, t1, t3, t1 / t3))
+
+
+def old_perm(n):
+    '''
+    The permutation that shuffle_decrypt used before, O(n^2)
+    '''
+
+    msgs = list(range(n))
+    out = []
+    while msgs:
+        i = random.StrongRandom().randint(0, len(msgs) - 1)
+        out.append(msgs.pop(i))
+    return out
+
+
+def bench_perm(n):
+    '''
+    Random permutation of n elements, the old one is only run up to 100k
+    elements because it's quadratic
+    '''
+
+    t1, perm = timeit(gen_perm, n)
+    assert sorted(perm) == list(range(n))
+    if n <= 100000:
+        t2, _ = timeit(old_perm, n)
+        print('{:8} elements fisher-yates {:.3f}s old {:.3f}s speedup x{:.2f}'.format(
+              n, t1, t2, t2 / t1))
+    else:
+        print('{:8} elements fisher-yates {:.3f}s'.format(n, t1))
+
+
+def linear_dlog(h, g, p, maxm):
+    gm = 1
+    for m in range(maxm + 1):
+        if gm == h:
+            return m
+        gm = (gm * g) % p
+
+
+def bench_dlog(maxm):
+    '''
+    Decodes totals up to maxm with the baby-step giant-step table, the
+    first time it's built and saved, then it's read from the file. The
+    linear search is only run up to 100k.
+    '''
+
+    import tempfile
+
+    bits = 2048
+    p = getPrime(bits)
+    g = 2
+    ms = [random.randint(0, maxm) for i in range(20)]
+    hs = [pow(g, m, p) for m in ms]
+
+    with tempfile.TemporaryDirectory() as path:
+        t1, table = timeit(TableCache(path).get, p, g, maxm)
+        t2, table = timeit(TableCache(path).get, p, g, maxm)
+        t3, d = timeit(lambda: [table.log(h, maxm) for h in hs])
+        assert d == ms
+
+    msg = '{:8} max build {:.3f}s load {:.6f}s decode {:.1f}us'.format(
+          maxm, t1, t2, t3 / len(hs) * 1e6)
+    if maxm <= 100000:
+        t4, d = timeit(lambda: [linear_dlog(h, g, p, maxm) for h in hs[:5]])
+        assert d == ms[:5]
+        msg += ' linear {:.1f}us'.format(t4 / 5 * 1e6)
+    print(msg)
+
+
+def cipher_bytes(cipher):
+    return sum((int(i).bit_length() + 7) // 8 for c in cipher for i in c) / len(cipher)
+
+
+def bench_ec(bits):
+    '''
+    Encrypt, reencrypt and decrypt N messages with a modp key of this size
+    and with P-256, showing the bytes of each cipher
+    '''
+
+    p = getPrime(bits)
+    g = 2
+    x = rand(p)
+    y = pow(g, x, p)
+    k = MixCrypt(k=PublicKey(p, g, y), bits=bits)
+    k.setk(p, g, y, x)
+    ec = ECMixCrypt()
+    clears = list(range(2, N + 2))
+
+    results = []
+    for name, c in (('modp', k), ('P-256', ec)):
+        t1, cipher = timeit(lambda: [c.encrypt(m) for m in clears])
+        t2, _ = timeit(lambda: [c.reencrypt(i) for i in cipher])
+        t3, d = timeit(lambda: [c.decrypt(i) for i in cipher])
+        assert d == clears
+        results.append(t1 + t2 + t3)
+        print('{:5} bits {:5} encrypt {:.3f}s reencrypt {:.3f}s decrypt {:.3f}s {:.0f} bytes'.format(
+              bits, name, t1, t2, t3, cipher_bytes(cipher)))
+    print('{:5} bits P-256 speedup x{:.2f}'.format(bits, results[0] / results[1]))
+
+
+def bench_keygen(bits):
+    '''
+    New key with a new safe prime, as every voting did before, and with
+    the standard group of the same size
+    '''
+
+    group = for_bits(bits)
+    t1, k = timeit(MixCrypt, None, bits)
+    t2, k = timeit(MixCrypt, group, bits)
+    assert int(k.k.p) == group.p
+    print('{:5} bits generate {:.3f}s {} {:.6f}s speedup x{:.0f}'.format(
+          bits, t1, group.name, t2, t1 / t2))
+
+
+def bench_shortexp(bits, exp_bits=256):
+    '''
+    Shuffle and decrypt of N votes in the standard group of this size, as
+    the mixnet endpoints do, with full exponents and with short ones
+    '''
+
+    group = for_bits(bits)
+    results = []
+    for e in (None, exp_bits):
+        k = MixCrypt(k=group, bits=bits, fixedbase=True, exp_bits=e)
+        cipher = [k.encrypt(m) for m in range(2, N + 2)]
+        t1, shuffled = timeit(k.shuffle, cipher)
+        t2, d = timeit(k.shuffle_decrypt, shuffled)
+        assert sorted(d) == list(range(2, N + 2))
+        results.append(t1 + t2)
+        print('{:5} bits {:>4} exponent bits shuffle {:.3f}s decrypt {:.3f}s'.format(
+              bits, e or bits, t1, t2))
+    print('{:5} bits speedup x{:.2f}'.format(bits, results[0] / results[1]))
+
+
+def bench_proof(n, bits=2048, exp_bits=256):
+    '''
+    Shuffle of n votes in the standard group of bits, with the generation
+    and the verification of its proof, using all the cores
+    '''
+
+    workers = os.cpu_count()
+    group = for_bits(bits)
+    k = MixCrypt(k=group, bits=bits, fixedbase=True, exp_bits=exp_bits)
+    pk = (k.k.p, k.k.g, k.k.y)
+    cipher = k.reencrypt_all([(1, 1)] * n, pk, workers)
+
+    def shuffle():
+        perm = k.gen_perm(n)
+        factors = k.gen_factors(n, pk, workers, exps=True)
+        shuffled = k.reencrypt_all([cipher[i] for i in perm], pk, workers,
+                                   [(a, b) for a, b, _ in factors])
+        return shuffled, perm, [r for _, _, r in factors]
+
+    t1, (shuffled, perm, rs) = timeit(shuffle)
+    t2, proof = timeit(shuffleproof.prove, pk, cipher, shuffled, perm, rs,
+                       exp_bits, None, workers)
+    t3, ok = timeit(shuffleproof.verify, pk, cipher, shuffled, proof, None, workers)
+    assert ok
+    size = len(shuffleproof.dumps(pk, cipher, shuffled, proof))
+    print('{:7} votes {} workers shuffle {:.1f}s prove {:.1f}s verify {:.1f}s '
+          'transcript {:.1f}MB'.format(n, workers, t1, t2, t3, size / 2 ** 20))
+
+
+def bench_decproof(n, bits=2048, exp_bits=256):
+    '''
+    Decryption shares of n votes with the proof of all of them, compared
+    with a Chaum-Pedersen proof for each share, estimated with 100 of them
+    '''
+
+    workers = os.cpu_count()
+    group = for_bits(bits)
+    k = MixCrypt(k=group, bits=bits, fixedbase=True, exp_bits=exp_bits)
+    p, g, y, x = (int(i) for i in (k.k.p, k.k.g, k.k.y, k.k.x))
+    cipher = k.reencrypt_all([(1, 1)] * n, (p, g, y), workers)
+    alist = [a for a, b in cipher]
+
+    t1, shares = timeit(k.decrypt_shares, cipher)
+    t2, proof = timeit(decryptproof.prove, (p, g, y), x, alist, shares, None, workers)
+    t3, ok = timeit(decryptproof.verify, (p, g, y), alist, shares, proof, None, workers)
+    assert ok
+
+    be = k.backend
+    c, r = rand(2 ** 128), rand(p)
+
+    def single():
+        # g^r y^-c and a^r d^-c to verify one Chaum-Pedersen proof
+        for a, d in zip(alist[:100], shares[:100]):
+            for base, e in ((g, r), (y, c), (a, r), (d, c)):
+                be.powmod(be.mpz(base), e, be.mpz(p))
+    t4, _ = timeit(single)
+    print('{:7} votes {} workers shares {:.1f}s prove {:.1f}s verify {:.1f}s, '
+          'one proof per share verify {:.1f}s'.format(n, workers, t1, t2, t3, t4 * n / 100))
+
+
+def bench_bigfield(n, bits=2048):
+    '''
+    Size and decoding time of n votes (a, b) of the group of bits, stored
+    as the decimal text of BigBigField and as the big endian bytes of
+    BigBinaryField.
+    '''
+
+    p = for_bits(bits).p
+    votes = [(rand(p), rand(p)) for i in range(n)]
+    size = lambda v: max(1, (v.bit_length() + 7) // 8)
+
+    t1, text = timeit(lambda: [(str(a), str(b)) for a, b in votes])
+    t2, binary = timeit(lambda: [(a.to_bytes(size(a), 'big'), b.to_bytes(size(b), 'big'))
+                                 for a, b in votes])
+    t3, r1 = timeit(lambda: [(int(a), int(b)) for a, b in text])
+    t4, r2 = timeit(lambda: [(int.from_bytes(a, 'big'), int.from_bytes(b, 'big'))
+                             for a, b in binary])
+    assert r1 == r2 == votes
+
+    mb = lambda rows: sum(len(a) + len(b) for a, b in rows) / 2 ** 20
+    print('{:7} votes text {:.1f}MB encode {:.2f}s decode {:.2f}s, '
+          'binary {:.1f}MB encode {:.2f}s decode {:.2f}s'.format(
+          n, mb(text), t1, t3, mb(binary), t2, t4))
+
+
+BENCHS = {
+    'backend': (bench_backend, [256, 1024, 2048, 3072]),
+    'shuffle': (bench_shuffle, [256, 1024, 2048, 3072]),
+    'fixedbase': (bench_fixedbase, [256, 1024, 2048, 3072]),
+    'perm': (bench_perm, [10000, 100000, 1000000]),
+    'dlog': (bench_dlog, [1000, 100000, 1000000]),
+    'ec': (bench_ec, [2048, 3072]),
+    'keygen': (bench_keygen, [1536]),
+    'shortexp': (bench_shortexp, [2048, 3072]),
+    'proof': (bench_proof, [10000, 100000]),
+    'decproof': (bench_decproof, [10000, 100000]),
+    'bigfield': (bench_bigfield, [100000, 1000000]),
+}
+
+
+if __name__ == '__main__':
+    bench = sys.argv[1] if len(sys.argv) > 1 else 'backend'
+    f, sizes = BENCHS[bench]
+    sizes = [int(i) for i in sys.argv[2:]] or sizes
+    for size in sizes:
+        f(size)
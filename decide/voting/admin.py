@@ -5,6 +5,7 @@ from .models import QuestionOrder
 from .models import QuestionOption
 from .models import Question
 from .models import Voting
+from .models import TallyJob
 
 from .filters import StartedFilter
 
@@ -23,8 +24,11 @@ def stop(ModelAdmin, request, queryset):
 
 def tally(ModelAdmin, request, queryset):
     for v in queryset.filter(end_date__lt=timezone.now()):
+        if v.tally:
+            continue
+        # submit doesn't start a job if there's one in progress
         token = request.session.get('auth-token', '')
-        v.tally_votes(token)
+        TallyJob.submit(v, token)
 
 
 class QuestionOptionInline(admin.TabularInline):
@@ -47,5 +51,13 @@ class VotingAdmin(admin.ModelAdmin):
     actions = [ start, stop, tally ]
 
 
+class TallyJobAdmin(admin.ModelAdmin):
+    list_display = ('voting', 'status', 'phase', 'processed', 'total', 'updated')
+    readonly_fields = ('voting', 'status', 'phase', 'processed', 'total',
+                       'error', 'cancel', 'phase_start', 'finished', 'session', 'shuffled')
+    list_filter = ('status', )
+
+
 admin.site.register(Voting, VotingAdmin)
+admin.site.register(TallyJob, TallyJobAdmin)
 admin.site.register(Question, QuestionAdmin)
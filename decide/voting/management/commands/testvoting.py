@@ -10,7 +10,7 @@ from base import mods
 from base.models import Auth
 from census.models import Census
 from mixnet.mixcrypt import MixCrypt
-from mixnet.mixcrypt import ElGamal
+from mixnet.mixcrypt import PublicKey
 from voting.models import Voting, Question, QuestionOption
 
 
@@ -18,12 +18,15 @@ from voting.models import Voting, Question, QuestionOption
 class Command(BaseCommand):
     help = 'Test the full voting process with one auth (self)'
 
-    def encrypt_msg(self, msg, v, bits=settings.KEYBITS):
+    def get_crypt(self, v, bits=settings.KEYBITS):
         pk = v.pub_key
-        p, g, y = (pk.p, pk.g, pk.y)
-        k = MixCrypt(bits=bits)
-        k.k = ElGamal.construct((p, g, y))
-        return k.encrypt(msg)
+        k = PublicKey(pk.p, pk.g, pk.y)
+        crypt = MixCrypt(k=k, bits=bits, backend=settings.MIXNET_BACKEND,
+                         fixedbase=settings.MIXNET_FIXEDBASE,
+                         exp_bits=settings.MIXNET_EXPONENT_BITS)
+        # one crypt for all the votes, encrypting only with the voting pubkey
+        crypt.k = k
+        return crypt
 
     def create_voting(self):
         q = Question(desc='test question')
@@ -52,11 +55,12 @@ class Command(BaseCommand):
     def store_votes(self, v):
         voters = list(Census.objects.filter(voting_id=v.id))
         voter = voters.pop()
+        crypt = self.get_crypt(v)
         clear = {}
         for opt in v.question.options.all():
             clear[opt.number] = 0
             for i in range(random.randint(0, 5)):
-                a, b = self.encrypt_msg(opt.number, v)
+                a, b = crypt.encrypt(opt.number)
                 data = {
                     'voting': v.id,
                     'voter': voter.voter_id,
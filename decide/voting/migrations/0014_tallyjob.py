@@ -0,0 +1,32 @@
+# Generated by Django 2.0 on 2026-10-18 12:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0013_auto_20210109_1633'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TallyJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(blank=True, default='', max_length=64)),
+                ('status', models.CharField(choices=[('PENDING', 'PENDING'), ('RUNNING', 'RUNNING'), ('DONE', 'DONE'), ('FAILED', 'FAILED'), ('CANCELLED', 'CANCELLED')], default='PENDING', max_length=9)),
+                ('phase', models.CharField(blank=True, choices=[('VOTES', 'VOTES'), ('SHUFFLE', 'SHUFFLE'), ('DECRYPT', 'DECRYPT'), ('POSTPROC', 'POSTPROC')], default='', max_length=8)),
+                ('processed', models.PositiveIntegerField(default=0)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True, default='')),
+                ('cancel', models.BooleanField(default=False)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('phase_start', models.DateTimeField(blank=True, null=True)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+                ('voting', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tally_jobs', to='voting.Voting')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.0 on 2026-10-18 13:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0014_tallyjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='voting',
+            name='tally_mode',
+            field=models.CharField(choices=[('MIXNET', 'MIXNET'), ('HOMOMORPHIC', 'HOMOMORPHIC')], default='MIXNET', max_length=11),
+        ),
+    ]
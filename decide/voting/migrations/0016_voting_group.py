@@ -0,0 +1,18 @@
+# Generated by Django 2.0 on 2026-10-18 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0015_voting_tally_mode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='voting',
+            name='group',
+            field=models.CharField(blank=True, choices=[('', 'ElGamal modp'), ('P-256', 'ElGamal P-256')], default='', max_length=32),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.0 on 2026-10-18 15:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0016_voting_group'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='voting',
+            name='group',
+            field=models.CharField(blank=True, choices=[('', 'ElGamal modp'), ('P-256', 'ElGamal P-256'), ('ffdhe2048', 'ElGamal ffdhe2048 (RFC 7919)'), ('ffdhe3072', 'ElGamal ffdhe3072 (RFC 7919)'), ('ffdhe4096', 'ElGamal ffdhe4096 (RFC 7919)')], default='', max_length=32),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 2.0 on 2026-10-18 16:00
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0017_voting_group_standard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tallyjob',
+            name='session',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='tallyjob',
+            name='shuffled',
+            field=django.contrib.postgres.fields.jsonb.JSONField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='DecryptedChunk',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session', models.CharField(max_length=64)),
+                ('start', models.PositiveIntegerField()),
+                ('votes', django.contrib.postgres.fields.jsonb.JSONField()),
+                ('voting', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='decrypted_chunks', to='voting.Voting')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='decryptedchunk',
+            unique_together={('voting', 'session', 'start')},
+        ),
+    ]
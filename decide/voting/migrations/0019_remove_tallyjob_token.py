@@ -0,0 +1,17 @@
+# Generated by Django 2.0 on 2026-10-18 21:00
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0018_tally_checkpoints'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='tallyjob',
+            name='token',
+        ),
+    ]
@@ -1,14 +1,22 @@
-from django.db import models
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import threading
+import uuid
+
+from django.conf import settings
+from django.db import connection, models, transaction
 from django.contrib.postgres.fields import JSONField
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
+from django.utils import timezone
 import tarfile
 import os
 
 from base import mods
 from base.models import Auth, Key
+from . import packing
 
 
 class Question(models.Model):
@@ -219,6 +227,27 @@ class Voting(models.Model):
 
     voting_type= models.CharField(max_length=8,choices=VOTING_TYPE_CHOICES,default='IDENTITY')
 
+    # MIXNET shuffles and decrypts every vote. HOMOMORPHIC is only for
+    # questions without order, each vote has a cipher of g^0 or g^1 per
+    # option and the store multiplies them, so only the totals are decrypted
+    MIXNET = 'MIXNET'
+    HOMOMORPHIC = 'HOMOMORPHIC'
+    TALLY_MODE_CHOICES = [
+        (MIXNET, MIXNET),
+        (HOMOMORPHIC, HOMOMORPHIC),]
+
+    tally_mode = models.CharField(max_length=11, choices=TALLY_MODE_CHOICES, default=MIXNET)
+
+    # group of the ElGamal key, the default is a modp group of KEYBITS bits
+    GROUP_CHOICES = [
+        ('', 'ElGamal modp'),
+        ('P-256', 'ElGamal P-256'),
+        ('ffdhe2048', 'ElGamal ffdhe2048 (RFC 7919)'),
+        ('ffdhe3072', 'ElGamal ffdhe3072 (RFC 7919)'),
+        ('ffdhe4096', 'ElGamal ffdhe4096 (RFC 7919)'),]
+
+    group = models.CharField(max_length=32, choices=GROUP_CHOICES, blank=True, default='')
+
     start_date = models.DateTimeField(blank=True, null=True)
     end_date = models.DateTimeField(blank=True, null=True)
 
@@ -228,6 +257,19 @@ class Voting(models.Model):
     tally = JSONField(blank=True, null=True)
     postproc = JSONField(blank=True, null=True)
 
+    def clean(self):
+        if (self.tally_mode == self.HOMOMORPHIC and self.question_id and
+                self.question.order_options.exists()):
+            raise ValidationError('Homomorphic tally is only for questions without order')
+        # the store adds the homomorphic votes with modp products
+        if self.tally_mode == self.HOMOMORPHIC and self.group == 'P-256':
+            raise ValidationError('Homomorphic tally is only for modp groups')
+        # a ranking is packed in one vote, see voting.packing
+        if self.question_id:
+            n = self.question.order_options.count()
+            if n and not packing.fits(packing.ranking_radices(n), self.group):
+                raise ValidationError('Too many ordered options for the group of the voting')
+
     def create_pubkey(self):
         if self.pub_key or not self.auths.count():
             return
@@ -236,8 +278,10 @@ class Voting(models.Model):
         data = {
             "voting": self.id,
             "auths": [ {"name": a.name, "url": a.url} for a in self.auths.all() ],
+            "group": self.group,
         }
-        key = mods.post('mixnet', baseurl=auth.url, json=data)
+        key = mods.post('mixnet', baseurl=auth.url, json=data,
+                        timeout=settings.MODS_CHAIN_TIMEOUT)
         pk = Key(p=key["p"], g=key["g"], y=key["y"])
         pk.save()
         self.pub_key = pk
@@ -246,43 +290,207 @@ class Voting(models.Model):
     def get_votes(self, token=''):
         # getting votes from store
         votes = mods.get('store', params={'voting_id': self.id}, HTTP_AUTHORIZATION='Token ' + token)
-        # anon votes
-        return [[i['a'], i['b']] for i in votes]
+        # anon votes, sorted so a resumed tally sends the same chunks
+        return sorted([i['a'], i['b']] for i in votes)
 
-    def tally_votes(self, token=''):
+    def query_mixnet(self, path, baseurl, method='post', **kwargs):
+        '''
+        Queries the mixnet of an auth, raises TallyError if it doesn't
+        answer 200. The shuffle and the decryption wait for the whole
+        chain, see MODS_CHAIN_TIMEOUT
+        '''
+
+        response = mods.query('mixnet', entry_point=path, method=method, baseurl=baseurl,
+                response=True, timeout=settings.MODS_CHAIN_TIMEOUT, **kwargs)
+        if response.status_code != 200:
+            raise TallyError('The mixnet of {} answered {} to {} {}'.format(
+                baseurl, response.status_code, method.upper(), path))
+        return response.json()
+
+    def tally_votes(self, token='', job=None):
         '''
         The tally is a shuffle and then a decrypt
+
+        When it's run by a TallyJob, the job is updated with the progress
+        and the tally stops if the job is cancelled.
         '''
 
+        step = job.step if job else lambda *args, **kwargs: None
+
+        if self.tally_mode == self.HOMOMORPHIC:
+            self.tally = self.tally_homomorphic(token, step)
+            self.save()
+            step(TallyJob.POSTPROC)
+            self.do_postproc()
+            return
+
+        step(TallyJob.VOTES)
         votes = self.get_votes(token)
+        total = len(votes)
 
         auth = self.auths.first()
         shuffle_url = "/shuffle/{}/".format(self.id)
         decrypt_url = "/decrypt/{}/".format(self.id)
         auths = [{"name": a.name, "url": a.url} for a in self.auths.all()]
 
+        size = settings.MIXNET_CHUNK_SIZE
+        if size and len(votes) > size:
+            self.tally = self.tally_chunks(votes, auth, size, step, job)
+            self.save()
+            step(TallyJob.POSTPROC, total, total)
+            self.do_postproc()
+            return
+
         # first, we do the shuffle
+        step(TallyJob.SHUFFLE, 0, total)
         data = { "msgs": votes }
-        response = mods.post('mixnet', entry_point=shuffle_url, baseurl=auth.url, json=data,
-                response=True)
-        if response.status_code != 200:
-            # TODO: manage error
-            pass
+        shuffled = self.query_mixnet(shuffle_url, auth.url, json=data)
 
         # then, we can decrypt that
-        data = {"msgs": response.json()}
-        response = mods.post('mixnet', entry_point=decrypt_url, baseurl=auth.url, json=data,
-                response=True)
-
-        if response.status_code != 200:
-            # TODO: manage error
-            pass
-
-        self.tally = response.json()
+        step(TallyJob.DECRYPT, 0, total)
+        data = {"msgs": shuffled}
+        self.tally = self.query_mixnet(decrypt_url, auth.url, json=data)
         self.save()
 
+        step(TallyJob.POSTPROC, total, total)
         self.do_postproc()
 
+    def tally_homomorphic(self, token, step):
+        '''
+        The store has the product of the votes of each option, so only one
+        cipher per option is decrypted, in order and without shuffle, and
+        the mixnet returns the number of votes of each option
+        '''
+
+        step(TallyJob.VOTES)
+        totals = mods.get('store', entry_point='/totals/', params={'voting_id': self.id},
+                HTTP_AUTHORIZATION='Token ' + token)
+        if not totals:
+            return {}
+
+        auth = self.auths.first()
+        decrypt_url = "/decrypt/{}/".format(self.id)
+        step(TallyJob.DECRYPT, 0, len(totals))
+        data = {
+            "msgs": [[t['a'], t['b']] for t in totals],
+            "shuffle": False,
+            "dlog": max(t['votes'] for t in totals),
+        }
+        votes = self.query_mixnet(decrypt_url, auth.url, json=data)
+
+        # json keys are always strings
+        return {str(t['number']): v for t, v in zip(totals, votes)}
+
+    def tally_chunks(self, votes, auth, size, step, job=None):
+        '''
+        The same tally, but the votes are sent to the mixnet in chunks of
+        size ballots. The shuffle needs all the votes, so every chunk is
+        sent first, and then the shuffled chunks are read from the last
+        auth and decrypted, MIXNET_CHUNK_WINDOW chunks at the same time.
+
+        With a job, its mixnet session, the end of the shuffle and the
+        decrypted chunks are stored, and a new job after a failed one
+        resumes from them. The auths that finished their shuffle don't
+        shuffle again, see mixnet.models.Checkpoint.
+        '''
+
+        shuffle_url = "/shuffle/{}/".format(self.id)
+        decrypt_url = "/decrypt/{}/".format(self.id)
+        session = job.session if job and job.session else uuid.uuid4().hex
+        total = len(votes)
+        starts = range(0, total, size)
+
+        if job and not job.session:
+            job.session = session
+            job.save(update_fields=['session', 'updated'])
+
+        # the last chunk answers with the auth that has the shuffled votes
+        last = job.shuffled if job else None
+        if not last:
+            for start in starts:
+                step(TallyJob.SHUFFLE, start, total)
+                data = {
+                    "msgs": votes[start:start + size],
+                    "session": session,
+                    "start": start,
+                    "size": size,
+                    "total": total,
+                }
+                last = self.query_mixnet(shuffle_url, auth.url, json=data)
+            if job:
+                job.shuffled = last
+                job.save(update_fields=['shuffled', 'updated'])
+
+        params = {"session": session, "position": last["position"]}
+        done = dict(self.decrypted_chunks.filter(session=session).values_list('start', 'votes'))
+
+        def decrypt(start):
+            if start in done:
+                return done[start]
+            chunk = dict(params, start=start, size=min(size, total - start))
+            msgs = self.query_mixnet(shuffle_url, last["url"], method='get', params=chunk)
+            return self.query_mixnet(decrypt_url, auth.url, json={"msgs": msgs})
+
+        tally = []
+
+        def add(start, clears):
+            # stored here and not in the threads, that have other
+            # connections to the database
+            if start not in done:
+                DecryptedChunk.objects.create(voting=self, session=session, start=start,
+                                              votes=clears)
+            tally.extend(clears)
+            step(TallyJob.DECRYPT, len(tally), total)
+
+        step(TallyJob.DECRYPT, 0, total)
+        window = settings.MIXNET_CHUNK_WINDOW
+        if window > 1:
+            with ThreadPoolExecutor(window) as pool:
+                futures = [pool.submit(decrypt, start) for start in starts]
+                try:
+                    for start, f in zip(starts, futures):
+                        add(start, f.result())
+                except Exception:
+                    for f in futures:
+                        f.cancel()
+                    raise
+        else:
+            for start in starts:
+                add(start, decrypt(start))
+
+        self.query_mixnet(shuffle_url, last["url"], method='delete', params=params)
+        self.decrypted_chunks.filter(session=session).delete()
+
+        return tally
+
+    def tally_job(self):
+        '''
+        Last tally job of this voting, None if it was never tallied in the
+        background
+        '''
+
+        return self.tally_jobs.order_by('-id').first()
+
+    def count_rankings(self, tally, n):
+        '''
+        Each vote of an ordered question is a packed ranking of its n
+        options, see voting.packing. positions[i][j] is the number of
+        votes that rank the option i in the position j, the invalid
+        ballots aren't counted.
+        '''
+
+        positions = [[0] * (n + 1) for i in range(n)]
+        if not isinstance(tally, list):
+            return positions
+
+        for m in tally:
+            ranking = packing.unpack_ranking(m, n)
+            if ranking is None:
+                continue
+            for i, position in enumerate(ranking):
+                positions[i][position] += 1
+        return positions
+
     def do_postproc(self):
         # votingType = "IDENTITY"
         votingType = self.voting_type
@@ -302,6 +510,8 @@ class Voting(models.Model):
             for opt in options:
                 if isinstance(tally, list):
                     votes = tally.count(opt.number)
+                elif isinstance(tally, dict):
+                    votes = tally.get(str(opt.number), 0)
                 else:
                    votes = 0
                 opts.append({
@@ -315,18 +525,18 @@ class Voting(models.Model):
         if order_options.count()!=0:
             votingType = "BORDA"
             t_file.write("Results from ordered voting with ID" + str(self.id) + ":\n")
-            for order_option in order_options:
-                if isinstance(tally, list):
-                    votes = tally.count(order_option.order_number)
-                else:
-                    votes = 0
-                ords.append({
-                    'option': order_option.option,
-                    'number': order_option.number,
-                    'order_number': order_option.order_number,
-                    'votes': votes
-                })
-                t_file.write("Option " + str(order_option.number) + ": " + order_option.option + " -> " + str(votes) + " votes in position " + str(order_option.order_number) + "\n")
+            order_options = list(order_options.order_by('number'))
+            positions = self.count_rankings(tally, len(order_options))
+            for i, order_option in enumerate(order_options):
+                for position in range(1, len(order_options) + 1):
+                    votes = positions[i][position]
+                    ords.append({
+                        'option': order_option.option,
+                        'number': order_option.number,
+                        'order_number': position,
+                        'votes': votes
+                    })
+                    t_file.write("Option " + str(order_option.number) + ": " + order_option.option + " -> " + str(votes) + " votes in position " + str(position) + "\n")
                 
         t_file.close()
         
@@ -345,4 +555,179 @@ class Voting(models.Model):
 
 
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return self.name
+
+
+class DecryptedChunk(models.Model):
+    '''
+    Votes of a chunk of a chunked tally that are already decrypted, see
+    Voting.tally_chunks
+    '''
+
+    voting = models.ForeignKey(Voting, related_name='decrypted_chunks', on_delete=models.CASCADE)
+    session = models.CharField(max_length=64)
+    start = models.PositiveIntegerField()
+    votes = JSONField()
+
+    class Meta:
+        unique_together = (('voting', 'session', 'start'),)
+
+
+class TallyCancelled(Exception):
+    pass
+
+
+class TallyError(Exception):
+    pass
+
+
+class TallyJob(models.Model):
+    '''
+    Tally of a voting run in the background. The request that starts it
+    answers at once and the progress is stored here, so it can be followed
+    from the status endpoint, cancelled, or retried if it fails.
+    '''
+
+    PENDING = 'PENDING'
+    RUNNING = 'RUNNING'
+    DONE = 'DONE'
+    FAILED = 'FAILED'
+    CANCELLED = 'CANCELLED'
+    STATUS_CHOICES = [(s, s) for s in (PENDING, RUNNING, DONE, FAILED, CANCELLED)]
+
+    VOTES = 'VOTES'
+    SHUFFLE = 'SHUFFLE'
+    DECRYPT = 'DECRYPT'
+    POSTPROC = 'POSTPROC'
+    PHASE_CHOICES = [(p, p) for p in (VOTES, SHUFFLE, DECRYPT, POSTPROC)]
+
+    voting = models.ForeignKey(Voting, related_name='tally_jobs', on_delete=models.CASCADE)
+    status = models.CharField(max_length=9, choices=STATUS_CHOICES, default=PENDING)
+    phase = models.CharField(max_length=8, choices=PHASE_CHOICES, blank=True, default='')
+    processed = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+    cancel = models.BooleanField(default=False)
+
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+    phase_start = models.DateTimeField(blank=True, null=True)
+    finished = models.DateTimeField(blank=True, null=True)
+
+    # mixnet session of a chunked tally, and the answer of its shuffle
+    # when it's done, a job after a failed one resumes from them
+    session = models.CharField(max_length=64, blank=True, default='')
+    shuffled = JSONField(blank=True, null=True)
+
+    @classmethod
+    def submit(cls, voting, token=''):
+        '''
+        Creates a job for the voting and starts it in a thread, or in this
+        same thread if TALLY_ASYNC is False. If the last job of the voting
+        failed, was cancelled or died running, this one resumes its chunked
+        tally. Returns None if the voting has an active job.
+
+        The voting is locked to check its last job, so two requests can't
+        start two jobs. The token of the staff user that starts it is only
+        passed to the thread, it's never stored.
+        '''
+
+        with transaction.atomic():
+            Voting.objects.select_for_update().get(pk=voting.pk)
+            last = voting.tally_job()
+            if last and last.active():
+                return None
+            job = cls(voting=voting)
+            if last and last.status != cls.DONE:
+                job.session, job.shuffled = last.session, last.shuffled
+                if last.status == cls.RUNNING:
+                    last.finish(cls.FAILED, 'The tally stopped without finishing')
+            job.save()
+
+        if settings.TALLY_ASYNC:
+            threading.Thread(target=job.run_thread, args=(token, ), daemon=True).start()
+        else:
+            job.run(token)
+        return job
+
+    def active(self):
+        '''
+        True while the job is pending or running. A running job that isn't
+        updated in TALLY_JOB_STALE seconds is considered dead, for example
+        after a restart of the server, so it can be retried.
+        '''
+
+        if self.status == self.PENDING:
+            return True
+        if self.status == self.RUNNING:
+            stale = timezone.now() - timedelta(seconds=settings.TALLY_JOB_STALE)
+            return self.updated > stale
+        return False
+
+    def retry(self, token):
+        '''
+        New job for the voting, with the token of the user that retries
+        it, None if the voting has an active job
+        '''
+
+        return TallyJob.submit(self.voting, token)
+
+    def run_thread(self, token=''):
+        try:
+            self.run(token)
+        finally:
+            connection.close()
+
+    def run(self, token=''):
+        self.refresh_from_db()
+        if self.cancel:
+            self.finish(self.CANCELLED)
+            return
+
+        self.status = self.RUNNING
+        self.save(update_fields=['status', 'updated'])
+        try:
+            self.voting.tally_votes(token, job=self)
+        except TallyCancelled:
+            self.finish(self.CANCELLED)
+        except Exception as e:
+            self.finish(self.FAILED, '{}: {}'.format(type(e).__name__, e))
+        else:
+            self.finish(self.DONE)
+
+    def finish(self, status, error=''):
+        self.status = status
+        self.error = error
+        self.finished = timezone.now()
+        self.save(update_fields=['status', 'error', 'finished', 'updated'])
+
+    def step(self, phase, processed=0, total=None):
+        '''
+        Stores the progress, raises TallyCancelled if the job was cancelled
+        '''
+
+        if TallyJob.objects.filter(pk=self.pk, cancel=True).exists():
+            raise TallyCancelled()
+
+        if phase != self.phase:
+            self.phase = phase
+            self.phase_start = timezone.now()
+        self.processed = processed
+        if total is not None:
+            self.total = total
+        # cancel is never saved here, it's only changed by the cancel request
+        self.save(update_fields=['phase', 'phase_start', 'processed', 'total', 'updated'])
+
+    def eta(self):
+        '''
+        Seconds left to finish the current phase, estimated from the
+        ballots processed since it started. None if it can't be estimated.
+        '''
+
+        if self.status != self.RUNNING or not self.processed or not self.phase_start:
+            return None
+        elapsed = (timezone.now() - self.phase_start).total_seconds()
+        return elapsed * (self.total - self.processed) / self.processed
+
+    def __str__(self):
+        return '{} ({})'.format(self.voting, self.status)
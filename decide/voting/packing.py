@@ -0,0 +1,131 @@
+'''
+Ballot packing, a whole ballot in one plaintext
+
+A ballot of an ordered question is the position that the voter gives to
+each option, 0 if it isn't ranked. Each option is a digit of a mixed-radix
+number, the first option is the least significant digit, and the number
+plus one, so an empty ballot isn't 0, is encrypted as a single vote.
+Without packing every position would be a cipher of its own, and each
+cipher costs a full shuffle and decrypt in the mixnet.
+
+The radix of each digit can be different, a ranking of n options has
+n + 1 values per digit, but a multi-option ballot only needs 2. The
+product of the radices must fit in the plaintexts of the group of the
+voting, see capacity.
+
+>>> radices = ranking_radices(3)
+>>> pack([2, 0, 1], radices)
+18
+>>> unpack(18, radices)
+[2, 0, 1]
+>>> pack_ranking([2, 3, 1])
+31
+>>> unpack_ranking(31, 3)
+[2, 3, 1]
+>>> unpack_ranking(pack([1, 1, 0], radices) + 1, 3) is None
+True
+'''
+
+from django.conf import settings
+
+from mixnet.ec import MAX_MESSAGE
+from mixnet.groups import GROUP_NAMES
+
+
+def pack(digits, radices):
+    '''
+    The mixed-radix number of the digits, digits[0] is the least
+    significant
+    '''
+
+    if len(digits) != len(radices):
+        raise ValueError('Wrong number of digits')
+
+    n = 0
+    for d, r in zip(reversed(digits), reversed(radices)):
+        if not 0 <= d < r:
+            raise ValueError('Digit out of range')
+        n = n * r + d
+    return n
+
+
+def unpack(n, radices):
+    '''
+    Digits of the mixed-radix number n, the inverse of pack
+    '''
+
+    digits = []
+    for r in radices:
+        n, d = divmod(n, r)
+        digits.append(d)
+    if n:
+        raise ValueError('Number out of range')
+    return digits
+
+
+def size(radices):
+    '''
+    Number of different ballots
+    '''
+
+    total = 1
+    for r in radices:
+        total *= r
+    return total
+
+
+def ranking_radices(n):
+    return [n + 1] * n
+
+
+def valid_ranking(positions):
+    '''
+    The ranked positions are 1, 2, ... without gaps nor repetitions
+    '''
+
+    ranked = sorted(p for p in positions if p)
+    return ranked == list(range(1, len(ranked) + 1))
+
+
+def pack_ranking(positions):
+    '''
+    Plaintext of the ballot that gives positions[i] to the option i, in
+    the order of their numbers
+    '''
+
+    if not valid_ranking(positions):
+        raise ValueError('Invalid ranking')
+    return pack(positions, ranking_radices(len(positions))) + 1
+
+
+def unpack_ranking(m, n):
+    '''
+    Positions of the n options in the plaintext m, None if it isn't a
+    valid ballot
+    '''
+
+    try:
+        positions = unpack(int(m) - 1, ranking_radices(n))
+    except (TypeError, ValueError):
+        return None
+    return positions if valid_ranking(positions) else None
+
+
+def capacity(group=''):
+    '''
+    Largest plaintext of the votes of a voting with this group. The
+    modp groups encode 0 < m <= q, see mixnet.mixcrypt.to_subgroup, a
+    safe prime of KEYBITS bits has q >= 2^(KEYBITS - 2). The curves
+    decrypt with a small discrete log, up to MAX_MESSAGE.
+    '''
+
+    if group == 'P-256':
+        return MAX_MESSAGE
+    if group in GROUP_NAMES:
+        return (GROUP_NAMES[group].p - 1) // 2
+    return 1 << (settings.KEYBITS - 2)
+
+
+def fits(radices, group=''):
+    # the largest packed ballot is size - 1, plus one
+    return size(radices) <= capacity(group)
@@ -1,6 +1,6 @@
 from rest_framework import serializers
 
-from .models import Question, QuestionOption, Voting, QuestionOrder
+from .models import Question, QuestionOption, Voting, QuestionOrder, TallyJob
 from base.serializers import KeySerializer, AuthSerializer
 
 class QuestionOrderSerializer(serializers.HyperlinkedModelSerializer):
@@ -30,7 +30,7 @@ class VotingSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
         model = Voting
         fields = ('id', 'name', 'desc', 'question', 'slug', 'start_date',
-                  'end_date', 'pub_key', 'auths', 'tally', 'postproc')
+                  'end_date', 'pub_key', 'auths', 'tally', 'postproc', 'tally_mode', 'group')
 
 
 class SimpleVotingSerializer(serializers.HyperlinkedModelSerializer):
@@ -39,3 +39,15 @@ class SimpleVotingSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
         model = Voting
         fields = ('name', 'desc', 'question', 'slug', 'start_date', 'end_date')
+
+
+class TallyJobSerializer(serializers.ModelSerializer):
+    eta = serializers.SerializerMethodField()
+
+    class Meta:
+        model = TallyJob
+        fields = ('id', 'status', 'phase', 'processed', 'total', 'eta',
+                  'error', 'created', 'updated', 'finished')
+
+    def get_eta(self, job):
+        return job.eta()
@@ -4,11 +4,13 @@ import time
 import os
 import tarfile
 import shutil
+from datetime import timedelta
+from unittest import mock
 
 from django.utils import timezone
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from rest_framework.test import APIClient
 from rest_framework.test import APITestCase
 from django.core.exceptions import ValidationError
@@ -17,10 +19,14 @@ from django.contrib.staticfiles.testing import StaticLiveServerTestCase
 from base import mods
 from base.tests import BaseTestCase
 from census.models import Census
+from mixnet import ballotproof
 from mixnet.mixcrypt import ElGamal
 from mixnet.mixcrypt import MixCrypt
+from mixnet.ec import ECMixCrypt, ECKey, is_curve
+from mixnet.groups import GROUP_NAMES
 from mixnet.models import Auth
-from voting.models import Voting, Question, QuestionOption, QuestionOrder
+from voting import packing
+from voting.models import Voting, Question, QuestionOption, QuestionOrder, TallyError, TallyJob
 
 from selenium import webdriver
 from selenium.webdriver.common.by import By
@@ -43,6 +49,10 @@ class VotingTestCase(BaseTestCase):
     def encrypt_msg(self, msg, v, bits=settings.KEYBITS):
         pk = v.pub_key
         p, g, y = (pk.p, pk.g, pk.y)
+        if is_curve(p):
+            k = ECMixCrypt()
+            k.k = ECKey(p, g, y)
+            return k.encrypt(msg)
         k = MixCrypt(bits=bits)
         k.k = ElGamal.construct((p, g, y))
         return k.encrypt(msg)
@@ -216,6 +226,180 @@ class VotingTestCase(BaseTestCase):
         for q in v.postproc:
             self.assertEqual(tally.get(q["number"], 0), q["votes"])
 
+    def test_complete_voting_homomorphic(self):
+        v = self.create_voting()
+        v.tally_mode = Voting.HOMOMORPHIC
+        v.save()
+        self.create_voters(v)
+
+        v.create_pubkey()
+        v.start_date = timezone.now()
+        v.save()
+
+        pk = v.pub_key
+        k = MixCrypt(bits=settings.KEYBITS)
+        k.k = ElGamal.construct((pk.p, pk.g, pk.y))
+
+        options = list(v.question.options.all())
+        voters = list(Census.objects.filter(voting_id=v.id))[:10]
+        clear = {opt.number: 0 for opt in options}
+        for voter in voters:
+            selected = random.choice(options).number
+            clear[selected] += 1
+            numbers = [opt.number for opt in options]
+            context = '{}|{}'.format(v.id, voter.voter_id)
+            data = {
+                'voting': v.id,
+                'voter': voter.voter_id,
+                'vote': ballotproof.encrypt_ballot(k, numbers, selected, context),
+            }
+            user = self.get_or_create_user(voter.voter_id)
+            self.login(user=user.username)
+            mods.post('store', json=data)
+
+        self.login()  # set token
+        v.tally_votes(self.token)
+
+        for opt in options:
+            self.assertEqual(v.tally.get(str(opt.number)), clear[opt.number])
+
+        for q in v.postproc:
+            self.assertEqual(clear[q["number"]], q["votes"])
+
+    def test_complete_voting_ec(self):
+        v = self.create_voting()
+        v.group = 'P-256'
+        v.save()
+        self.create_voters(v)
+
+        v.create_pubkey()
+        v.start_date = timezone.now()
+        v.save()
+        self.assertTrue(is_curve(v.pub_key.p))
+
+        clear = self.store_votes(v)
+
+        self.login()  # set token
+        v.tally_votes(self.token)
+
+        tally = v.tally
+        tally.sort()
+        tally = {k: len(list(x)) for k, x in itertools.groupby(tally)}
+
+        for q in v.question.options.all():
+            self.assertEqual(tally.get(q.number, 0), clear.get(q.number, 0))
+
+        v.tally_mode = Voting.HOMOMORPHIC
+        with self.assertRaises(ValidationError):
+            v.clean()
+
+    def test_create_pubkey_standard_group(self):
+        v = self.create_voting()
+        v.group = 'ffdhe2048'
+        v.save()
+
+        v.create_pubkey()
+        group = GROUP_NAMES['ffdhe2048']
+        self.assertEqual((v.pub_key.p, v.pub_key.g), (group.p, group.g))
+
+    @override_settings(MIXNET_CHUNK_SIZE=7, MIXNET_CHUNK_WINDOW=1)
+    def test_complete_voting_chunks(self):
+        v = self.create_voting()
+        self.create_voters(v)
+
+        v.create_pubkey()
+        v.start_date = timezone.now()
+        v.save()
+
+        clear = self.store_votes(v)
+
+        self.login()  # set token
+        v.tally_votes(self.token)
+
+        tally = v.tally
+        tally.sort()
+        tally = {k: len(list(x)) for k, x in itertools.groupby(tally)}
+
+        for q in v.question.options.all():
+            self.assertEqual(tally.get(q.number, 0), clear.get(q.number, 0))
+
+    def test_complete_voting_ordered(self):
+        v = self.create_order_voting()
+        self.create_voters(v)
+
+        v.create_pubkey()
+        v.start_date = timezone.now()
+        v.save()
+
+        options = list(v.question.order_options.order_by('number'))
+        n = len(options)
+        voters = list(Census.objects.filter(voting_id=v.id))[:10]
+        clear = [[0] * (n + 1) for i in range(n)]
+        for voter in voters:
+            # a ranking of some of the options, the rest aren't ranked
+            ranked = random.sample(range(n), random.randint(0, n))
+            positions = [0] * n
+            for position, i in enumerate(ranked):
+                positions[i] = position + 1
+            for i, position in enumerate(positions):
+                clear[i][position] += 1
+
+            # the whole ranking is a single cipher
+            a, b = self.encrypt_msg(packing.pack_ranking(positions), v)
+            data = {
+                'voting': v.id,
+                'voter': voter.voter_id,
+                'vote': { 'a': a, 'b': b },
+            }
+            user = self.get_or_create_user(voter.voter_id)
+            self.login(user=user.username)
+            mods.post('store', json=data)
+
+        self.login()  # set token
+        v.tally_votes(self.token)
+
+        self.assertEqual(len(v.tally), len(voters))
+        positions = v.count_rankings(v.tally, n)
+        for i in range(n):
+            self.assertEqual(positions[i][1:], clear[i][1:])
+
+        # borda, n points for the first position and 1 for the last
+        points = {opt.number: sum(clear[i][pos] * (n + 1 - pos) for pos in range(1, n + 1))
+                  for i, opt in enumerate(options)}
+        for q in v.postproc:
+            self.assertEqual(q['postproc'], points[q['number']])
+
+    def test_ordered_packing(self):
+        for n in range(1, 7):
+            positions = list(range(1, n + 1))
+            random.shuffle(positions)
+            m = packing.pack_ranking(positions)
+            self.assertEqual(packing.unpack_ranking(m, n), positions)
+
+        # repeated positions and gaps aren't valid ballots
+        self.assertRaises(ValueError, packing.pack_ranking, [1, 1, 2])
+        self.assertRaises(ValueError, packing.pack_ranking, [1, 3, 0])
+        radices = packing.ranking_radices(3)
+        self.assertIsNone(packing.unpack_ranking(packing.pack([1, 1, 2], radices) + 1, 3))
+        self.assertIsNone(packing.unpack_ranking(packing.size(radices) + 1, 3))
+
+        # a ranking of 7 options doesn't fit in the messages of P-256
+        self.assertTrue(packing.fits(packing.ranking_radices(6), 'P-256'))
+        self.assertFalse(packing.fits(packing.ranking_radices(7), 'P-256'))
+        self.assertTrue(packing.fits(packing.ranking_radices(30)))
+
+        v = self.create_order_voting()
+        # only the empty ballot, 1, is counted
+        self.assertEqual(v.count_rankings([1, 0, 'x'], 5)[0], [1, 0, 0, 0, 0, 0])
+
+        v.clean()
+        v.group = 'P-256'
+        v.clean()
+        for i in range(2):
+            QuestionOrder(question=v.question, option='more {}'.format(i)).save()
+        with self.assertRaises(ValidationError):
+            v.clean()
+
     def test_postproc_voting_compressed(self):
         v = self.create_voting()
         self.create_voters(v)
@@ -327,6 +511,7 @@ class VotingTestCase(BaseTestCase):
 
         self.assertEqual(Voting.objects.get(name="Votacion tipo_inventado").voting_type, "IDENTITY")
 
+    @override_settings(TALLY_ASYNC=False)
     def test_update_voting(self):
         voting = self.create_voting()
 
@@ -386,8 +571,12 @@ class VotingTestCase(BaseTestCase):
 
         data = {'action': 'tally'}
         response = self.client.put('/voting/{}/'.format(voting.pk), data, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json(), 'Voting tally started')
+
+        response = self.client.get('/voting/{}/tally/'.format(voting.pk))
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(response.json(), 'Voting tallied')
+        self.assertEqual(response.json()['status'], 'DONE')
 
         # STATUS VOTING: tallied
         data = {'action': 'start'}
@@ -405,6 +594,124 @@ class VotingTestCase(BaseTestCase):
         self.assertEqual(response.status_code, 400)
         self.assertEqual(response.json(), 'Voting already tallied')
 
+    @override_settings(TALLY_ASYNC=False)
+    def test_tally_job(self):
+        voting = self.create_voting()
+        voting.create_pubkey()
+        voting.start_date = timezone.now()
+        voting.end_date = timezone.now()
+        voting.save()
+
+        self.login()
+        url = '/voting/{}/tally/'.format(voting.pk)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 404)
+
+        job = TallyJob(voting=voting)
+        job.save()
+
+        data = {'action': 'tally'}
+        response = self.client.put('/voting/{}/'.format(voting.pk), data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), 'Voting tally in progress')
+
+        # a pending job is cancelled before it starts
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, 202)
+        job.run()
+        self.assertEqual(job.status, TallyJob.CANCELLED)
+
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], 'DONE')
+        self.assertEqual(voting.tally_job().processed, 0)
+
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(MIXNET_CHUNK_SIZE=7, MIXNET_CHUNK_WINDOW=1, TALLY_ASYNC=False)
+    def test_tally_job_resume(self):
+        v = self.create_voting()
+        self.create_voters(v)
+
+        v.create_pubkey()
+        v.start_date = timezone.now()
+        v.save()
+
+        clear = self.store_votes(v)
+        v.end_date = timezone.now()
+        v.save()
+
+        query_mixnet = Voting.query_mixnet
+
+        def fail(voting, path, baseurl, method='post', **kwargs):
+            # the mixnet fails to decrypt the second chunk
+            if path.startswith('/decrypt/') and voting.decrypted_chunks.exists():
+                raise TallyError('decrypt failed')
+            return query_mixnet(voting, path, baseurl, method, **kwargs)
+
+        self.login()  # set token
+        with mock.patch.object(Voting, 'query_mixnet', autospec=True, side_effect=fail):
+            job = TallyJob.submit(v, self.token)
+        self.assertEqual(job.status, TallyJob.FAILED)
+        self.assertIn('decrypt failed', job.error)
+        self.assertTrue(job.shuffled)
+        self.assertEqual(v.decrypted_chunks.count(), 1)
+
+        # the new job doesn't shuffle again, and only decrypts the rest
+        # the retry runs with the token of the user that asks for it, the
+        # job doesn't keep any
+        self.assertNotIn('token', [f.name for f in TallyJob._meta.get_fields()])
+        with mock.patch.object(Voting, 'query_mixnet', autospec=True,
+                               side_effect=query_mixnet) as m:
+            job = job.retry(self.token)
+        self.assertEqual(job.status, TallyJob.DONE)
+        posts = [args[1] for args, kwargs in m.call_args_list
+                 if kwargs.get('method', 'post') == 'post']
+        self.assertFalse([p for p in posts if p.startswith('/shuffle/')])
+        self.assertEqual(len(posts), len(range(0, len(v.tally), 7)) - 1)
+        self.assertEqual(v.decrypted_chunks.count(), 0)
+
+        v.refresh_from_db()
+        tally = v.tally
+        tally.sort()
+        tally = {k: len(list(x)) for k, x in itertools.groupby(tally)}
+        for q in v.question.options.all():
+            self.assertEqual(tally.get(q.number, 0), clear.get(q.number, 0))
+
+    @override_settings(TALLY_ASYNC=False)
+    def test_tally_job_stale(self):
+        voting = self.create_voting()
+        job = TallyJob(voting=voting, status=TallyJob.RUNNING, session='s1',
+                       shuffled={'position': 1})
+        job.save()
+        self.assertIsNone(TallyJob.submit(voting))
+
+        # the process of the job died, a new one resumes its tally
+        stale = timezone.now() - timedelta(seconds=settings.TALLY_JOB_STALE + 1)
+        TallyJob.objects.filter(pk=job.pk).update(updated=stale)
+        with mock.patch.object(TallyJob, 'run') as run:
+            new = TallyJob.submit(voting, 'token')
+        run.assert_called_once_with('token')
+        self.assertEqual((new.session, new.shuffled), ('s1', {'position': 1}))
+        job.refresh_from_db()
+        self.assertEqual(job.status, TallyJob.FAILED)
+
+        # the new job is active, no other one starts
+        self.assertIsNone(TallyJob.submit(voting))
+        self.assertEqual(voting.tally_jobs.count(), 2)
+
+    def test_tally_error(self):
+        v = self.create_voting()
+        response = mock.Mock(status_code=500)
+        with mock.patch('base.mods.query', return_value=response):
+            with self.assertRaises(TallyError):
+                v.query_mixnet('/shuffle/{}/'.format(v.id), settings.BASEURL, json={})
+
+
 class VotingModelTestCase(BaseTestCase):
     def setUp(self):
 
@@ -4,9 +4,10 @@ from django.utils import timezone
 from django.shortcuts import get_object_or_404
 from rest_framework import generics, status
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from .models import Question, QuestionOption, Voting, QuestionOrder
-from .serializers import SimpleVotingSerializer, VotingSerializer
+from .models import Question, QuestionOption, Voting, QuestionOrder, TallyJob
+from .serializers import SimpleVotingSerializer, VotingSerializer, TallyJobSerializer
 from base.perms import UserIsStaff
 from base.models import Auth
 
@@ -97,10 +98,59 @@ class VotingUpdate(generics.RetrieveUpdateDestroyAPIView):
             elif voting.tally:
                 msg = 'Voting already tallied'
                 st = status.HTTP_400_BAD_REQUEST
+            elif not TallyJob.submit(voting, request.auth.key):
+                msg = 'Voting tally in progress'
+                st = status.HTTP_400_BAD_REQUEST
             else:
-                voting.tally_votes(request.auth.key)
-                msg = 'Voting tallied'
+                msg = 'Voting tally started'
+                st = status.HTTP_202_ACCEPTED
         else:
             msg = 'Action not found, try with start, stop or tally'
             st = status.HTTP_400_BAD_REQUEST
-        return Response(msg, status=st)
\ No newline at end of file
+        return Response(msg, status=st)
+
+
+class TallyJobView(APIView):
+    permission_classes = (UserIsStaff,)
+
+    def get(self, request, voting_id):
+        """
+        Status of the last tally of the voting
+        """
+
+        voting = get_object_or_404(Voting, pk=voting_id)
+        job = voting.tally_job()
+        if not job:
+            return Response({}, status=status.HTTP_404_NOT_FOUND)
+        return Response(TallyJobSerializer(job).data)
+
+    def post(self, request, voting_id):
+        """
+        Retries a failed or cancelled tally
+        """
+
+        voting = get_object_or_404(Voting, pk=voting_id)
+        job = voting.tally_job()
+        if not job:
+            return Response('Voting is not tallied', status=status.HTTP_400_BAD_REQUEST)
+        if job.status == TallyJob.DONE:
+            return Response('Voting tally can not be retried', status=status.HTTP_400_BAD_REQUEST)
+
+        job = TallyJob.submit(voting, request.auth.key)
+        if not job:
+            return Response('Voting tally can not be retried', status=status.HTTP_400_BAD_REQUEST)
+        return Response(TallyJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+    def delete(self, request, voting_id):
+        """
+        Cancels the tally, it stops at the next step
+        """
+
+        voting = get_object_or_404(Voting, pk=voting_id)
+        job = voting.tally_job()
+        if not job or not job.active():
+            return Response('Voting tally is not in progress', status=status.HTTP_400_BAD_REQUEST)
+
+        TallyJob.objects.filter(pk=job.pk).update(cancel=True)
+        job.refresh_from_db()
+        return Response(TallyJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)